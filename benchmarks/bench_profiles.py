@@ -0,0 +1,122 @@
+"""
+bench_profiles.py
+
+Description:
+    Benchmark of the scaling profiles (run.py --profile). Scales a
+    sample dataset with every profile and reports the throughput, the
+    size of the scaled images and their PSNR against an uncompressed
+    Lanczos resize of the source, next to the Pillow defaults.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import io
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+sys.path.append(path_to_package)
+
+from core.image_annotations import ImageAnnotations
+from core.profiles import PROFILES
+from core.resize import psnr
+
+ANNOTATIONS = 'Car 0 0 0 100.5 200.25 400 500 0 0 0 0 0 0 0\n'
+
+
+# ----------------------------------------------------------------
+def process_arguments():
+    # Initialize the ArgumentParser
+    parser = argparse.ArgumentParser(
+        description = "Scaling profiles benchmark",
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--input_path', dest = 'input_path', type = str, default = None,
+                        help = 'Kitti dataset to sample, noisy gradients are generated if not given')
+    parser.add_argument('--samples', dest = 'samples', type = int, default = 20,
+                        help = 'images of the sample')
+    parser.add_argument('--repeat', dest = 'repeat', type = int, default = 3,
+                        help = 'rounds over the sample per profile')
+    parser.add_argument('--target_width', dest = 'target_width', type = int, default = 284,
+                        help = 'target width')
+    parser.add_argument('--target_height', dest = 'target_height', type = int, default = 284,
+                        help = 'target height')
+    return parser.parse_args()
+
+
+# ----------------------------------------------------------------
+def make_images(count, width = 1136, height = 568):
+    """Encode noisy gradients, closer to real photos than flat colors"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    images = []
+    for _ in range(count):
+        shift = rng.integers(0, 255)
+        pixels = np.stack([(x * 255 // width + shift) % 256, y * 255 // height,
+                           (x + y) * 255 // (width + height)], axis = -1)
+        pixels = np.clip(pixels + rng.normal(0, 8, size = pixels.shape), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format = 'JPEG', quality = 90)
+        images.append(buffer.getvalue())
+    return images
+
+
+# ----------------------------------------------------------------
+def measure(images, profile, args):
+    """
+    Scale and encode every image of the sample
+
+    Return:
+        Tuple of (images per second, mean bytes per image, mean PSNR in dB)
+    """
+    target_size = (args.target_width, args.target_height)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        encoded = []
+        for image in images:
+            img_ann = ImageAnnotations.from_bytes(image, ANNOTATIONS)
+            img_ann.scale(args.target_width, args.target_height, profile = profile)
+            encoded.append(img_ann.encode())
+    elapsed = time.perf_counter() - start
+
+    quality = []
+    for image, scaled in zip(images, encoded):
+        reference = Image.open(io.BytesIO(image)).convert('RGB').resize(target_size, Image.LANCZOS)
+        quality.append(psnr(Image.open(io.BytesIO(scaled)).convert('RGB'), reference))
+    return len(images) * args.repeat / elapsed, np.mean([len(data) for data in encoded]), np.mean(quality)
+
+
+# ----------------------------------------------------------------
+def main():
+    args = process_arguments()
+
+    if args.input_path:
+        paths = sorted(glob.glob(os.path.join(args.input_path, 'images', '*.jpg')))[:args.samples]
+        images = []
+        for path in paths:
+            with open(path, 'rb') as file:
+                images.append(file.read())
+        if not images:
+            sys.exit(f'No JPEG image in [{os.path.join(args.input_path, "images")}]')
+    else:
+        images = make_images(args.samples)
+
+    print(f'{len(images)} images scaled to {args.target_width}x{args.target_height}, {args.repeat} rounds')
+    for name, profile in [('default', None)] + list(PROFILES.items()):
+        throughput, size, quality = measure(images, profile, args)
+        print(f'{name:<9} {throughput:8.1f} images/s   {size/1024:7.1f} KiB/image   PSNR {quality:6.2f} dB')
+
+
+# ----------------------------------------------------------------
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+bench_resize.py
+
+Description:
+    Benchmark of the resize backends (run.py --resize_backend). Decodes
+    and resizes JPEG images with every backend and reports the time per
+    image and the PSNR of the result against the pil backend, for
+    integer and non-integer factors, so that the backend can be picked
+    per job.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import io
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+sys.path.append(path_to_package)
+
+from core.resize import RESIZE_BACKENDS, resize_image, psnr, integer_factors, draft_scale
+
+
+# ----------------------------------------------------------------
+def process_arguments():
+    # Initialize the ArgumentParser
+    parser = argparse.ArgumentParser(
+        description = "Resize backends benchmark",
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--repeat', dest = 'repeat', type = int, default = 20,
+                        help = 'resizes of every image per backend')
+    parser.add_argument('--image_width', dest = 'image_width', type = int, default = 1136,
+                        help = 'width of the generated source image')
+    parser.add_argument('--image_height', dest = 'image_height', type = int, default = 568,
+                        help = 'height of the generated source image')
+    parser.add_argument('--targets', dest = 'targets', type = str, default = '284x284,568x284,142x142,300x300',
+                        help = 'comma separated target sizes')
+    parser.add_argument('--input_path', dest = 'input_path', type = str, default = None,
+                        help = 'folder of JPEG images to use instead of a generated one, i.e. a Kitti images folder')
+    parser.add_argument('--max_images', dest = 'max_images', type = int, default = 20,
+                        help = 'images read from --input_path')
+    return parser.parse_args()
+
+
+# ----------------------------------------------------------------
+def make_image(width, height):
+    """Encode a gradient with some noise, closer to a real photo than a flat color"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis = -1)
+    pixels = np.clip(pixels + rng.normal(0, 8, size = pixels.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format = 'JPEG', quality = 90)
+    return buffer.getvalue()
+
+
+# ----------------------------------------------------------------
+def measure(images, target_size, backend, repeat):
+    """
+    Decode and resize every image
+
+    Return:
+        Tuple of (milliseconds per image, resized images of the last round)
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        resized = [resize_image(Image.open(io.BytesIO(image)), target_size, backend) for image in images]
+    return (time.perf_counter() - start) * 1000 / (repeat * len(images)), resized
+
+
+# ----------------------------------------------------------------
+def main():
+    args = process_arguments()
+
+    if args.input_path:
+        paths = sorted(glob.glob(os.path.join(args.input_path, '*.jpg')))[:args.max_images]
+        images = []
+        for path in paths:
+            with open(path, 'rb') as file:
+                images.append(file.read())
+    else:
+        images = [make_image(args.image_width, args.image_height)]
+    if not images:
+        sys.exit(f'No JPEG image in [{args.input_path}]')
+    size = Image.open(io.BytesIO(images[0])).size
+
+    print(f'{len(images)} images of {size[0]}x{size[1]}, {args.repeat} rounds')
+    for target in args.targets.split(','):
+        target_size = tuple(int(value) for value in target.lower().split('x'))
+        factors = integer_factors(size, target_size)
+        scale = draft_scale(size, target_size)
+        path = f'factors {factors}' if factors else 'no integer factors'
+        if scale:
+            path += f', draft decode at 1/{scale}'
+        print(f'{target:<10} {path}')
+
+        reference = None
+        for backend in RESIZE_BACKENDS:
+            elapsed, resized = measure(images, target_size, backend, args.repeat)
+            if reference is None:
+                reference = resized
+            quality = np.mean([psnr(image, ref) for image, ref in zip(resized, reference)])
+            print(f'    {backend:<6} {elapsed:8.2f} ms/image   PSNR vs pil {quality:6.2f} dB')
+
+
+# ----------------------------------------------------------------
+if __name__ == '__main__':
+    main()
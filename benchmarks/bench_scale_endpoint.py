@@ -0,0 +1,163 @@
+"""
+bench_scale_endpoint.py
+
+Description:
+    Latency benchmark of the in-memory scale endpoint (POST /scale).
+    Measures the scaling itself in-process and the full HTTP round
+    trip against a local Rest API instance, and checks the p99
+    latency against config.SCALE_P99_TARGET_MS.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import sys
+import io
+import time
+import argparse
+import threading
+from subprocess import Popen, PIPE, TimeoutExpired
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from PIL import Image
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+sys.path.append(path_to_package)
+sys.path.append(os.path.join(path_to_package, 'restapi'))
+
+import config
+from core.image_annotations import ImageAnnotations
+
+ANNOTATIONS = ('Car 0 0 0 100.5 200.25 400 500 0 0 0 0 0 0 0\n'
+               'Pedestrian 0 0 0 700 150 760 330 0 0 0 0 0 0 0\n') * 4
+
+WARMUP_TIME = 2
+
+
+# ----------------------------------------------------------------
+def process_arguments():
+    # Initialize the ArgumentParser
+    parser = argparse.ArgumentParser(
+        description = "In-memory scale endpoint benchmark",
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--requests', dest = 'requests', type = int, default = 500,
+                        help = 'number of requests')
+    parser.add_argument('--concurrency', dest = 'concurrency', type = int, default = 1,
+                        help = 'number of concurrent clients, latency grows once it exceeds the executor workers or the cores')
+    parser.add_argument('--image_width', dest = 'image_width', type = int, default = 1136,
+                        help = 'source image width')
+    parser.add_argument('--image_height', dest = 'image_height', type = int, default = 568,
+                        help = 'source image height')
+    parser.add_argument('--rest_api_port', dest = 'rest_api_port', type = int, default = 8081,
+                        help = 'port of the local Rest API instance started by the benchmark')
+    parser.add_argument('--base_url', dest = 'base_url', type = str, default = None,
+                        help = 'benchmark an already running Rest API instead of starting one')
+    parser.add_argument('--user_id', dest = 'user_id', type = str, default = config.USER_IDS[0],
+                        help = 'user to authenticate with')
+    return parser.parse_args()
+
+
+# ----------------------------------------------------------------
+def make_image(width, height):
+    """Encode a gradient with some noise, closer to a real photo than a flat color"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis = -1)
+    pixels = np.clip(pixels + rng.normal(0, 8, size = pixels.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format = 'JPEG', quality = 90)
+    return buffer.getvalue()
+
+
+# ----------------------------------------------------------------
+def report(name, latencies, elapsed):
+    """Print latency percentiles and throughput, return the p99 in milliseconds"""
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f'{name:<10} n={len(latencies):<6} {len(latencies)/elapsed:8.1f} req/s   '
+          f'p50={p50:7.2f} ms   p95={p95:7.2f} ms   p99={p99:7.2f} ms   max={latencies.max():7.2f} ms')
+    return p99
+
+
+# ----------------------------------------------------------------
+def bench_in_process(image_bytes, n):
+    """Scale without HTTP, the lower bound of the endpoint latency"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        img_ann = ImageAnnotations.from_bytes(image_bytes, ANNOTATIONS)
+        img_ann.scale(284, 284)
+        img_ann.encode()
+        latencies.append(time.perf_counter() - t0)
+    return report('in-process', latencies, time.perf_counter() - start)
+
+
+# ----------------------------------------------------------------
+def bench_http(base_url, token, image_bytes, n, concurrency):
+    """Full round trips through the Rest API from concurrent clients"""
+    local = threading.local()
+    headers = {'Authorization': f'bearer {token}', 'Content-Type': 'image/jpeg'}
+
+    def one_request(_):
+        # One keep-alive session per client thread
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        t0 = time.perf_counter()
+        r = local.session.post(f'{base_url}/scale', params = {'annotations': ANNOTATIONS, 'format': 'jpeg'},
+                         data = image_bytes, headers = headers, timeout = 30)
+        r.raise_for_status()
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = concurrency) as executor:
+        latencies = list(executor.map(one_request, range(n)))
+    return report('http', latencies, time.perf_counter() - start)
+
+
+# ----------------------------------------------------------------
+def main():
+    args = process_arguments()
+    image_bytes = make_image(args.image_width, args.image_height)
+    print(f'Source image {args.image_width}x{args.image_height} ({len(image_bytes)} bytes) -> 284x284, '
+          f'p99 target {config.SCALE_P99_TARGET_MS} ms')
+
+    bench_in_process(image_bytes, min(args.requests, 200))
+
+    rest_api = None
+    base_url = args.base_url
+    if base_url is None:
+        base_url = f'http://localhost:{args.rest_api_port}'
+        rest_api = Popen(['python3', os.path.join(path_to_package, 'restapi', 'rest_api.py'),
+                          '--rest_api_port', str(args.rest_api_port), '--log_level', 'ERROR'],
+                         stdout = PIPE, stderr = PIPE)
+        time.sleep(WARMUP_TIME)
+
+    try:
+        r = requests.post(f'{base_url}/auth', data = {'user_id': args.user_id})
+        r.raise_for_status()
+        token = r.json()['token']
+        p99 = bench_http(base_url, token, image_bytes, args.requests, args.concurrency)
+    finally:
+        if rest_api is not None:
+            rest_api.terminate()
+            try:
+                rest_api.wait(5)
+            except TimeoutExpired:
+                rest_api.kill()
+
+    if p99 > config.SCALE_P99_TARGET_MS:
+        print(f'p99 latency above the {config.SCALE_P99_TARGET_MS} ms target')
+        sys.exit(1)
+
+
+# ----------------------------------------------------------------
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""
+load_test.py
+
+Description:
+    Load generator for the Rest API. Runs a closed loop of concurrent
+    clients against a local Rest API instance (or an already running
+    one) for a given duration with a configurable mix of requests, and
+    reports throughput, latency percentiles, error rates and status codes
+    per kind of request. Scenarios cover token checks, a bad-token flood
+    next to legitimate traffic and concurrent scale jobs.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+from subprocess import Popen, DEVNULL, TimeoutExpired
+from urllib.parse import urlencode
+import numpy as np
+from PIL import Image
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+sys.path.append(path_to_package)
+sys.path.append(os.path.join(path_to_package, 'restapi'))
+
+import config
+
+WARMUP_TIME = 2
+
+# Request mix of every scenario, {kind of request: weight}
+SCENARIOS = {
+    'mixed': {'home': 1, 'auth': 1, 'token': 4},
+    'auth': {'auth': 1},
+    'token': {'token': 1},
+    # Legitimate token checks while most clients send invalid tokens
+    'bad_token_flood': {'bad_token': 9, 'token': 1},
+    'scale_jobs': {'images': 1},
+}
+
+# Status code expected for every kind of request, anything else is an error
+EXPECTED_STATUS = {
+    'home': 200,
+    'auth': 200,
+    # Valid token, unknown job
+    'token': 404,
+    'bad_token': 401,
+    'images': 200,
+}
+
+
+# ----------------------------------------------------------------
+def process_arguments():
+    # Initialize the ArgumentParser
+    parser = argparse.ArgumentParser(
+        description = "Rest API load test",
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--scenario', dest = 'scenario', type = str, default = 'mixed', choices = SCENARIOS,
+                        help = 'predefined request mix')
+    parser.add_argument('--mix', dest = 'mix', type = str, default = None,
+                        help = f'request mix overriding the scenario, i.e. "auth=1,token=4" with kinds {list(EXPECTED_STATUS)}')
+    parser.add_argument('--concurrency', dest = 'concurrency', type = int, default = 50,
+                        help = 'number of concurrent clients, each one sends its next request once answered')
+    parser.add_argument('--duration', dest = 'duration', type = float, default = 30,
+                        help = 'seconds of load, requests still pending afterwards are waited for')
+    parser.add_argument('--request_timeout', dest = 'request_timeout', type = float, default = 60,
+                        help = 'seconds before a request is counted as timed out')
+    parser.add_argument('--pairs', dest = 'pairs', type = int, default = 8,
+                        help = 'pairs of image and annotations file of the dataset scaled by the images requests')
+    parser.add_argument('--rest_api_port', dest = 'rest_api_port', type = int, default = 8082,
+                        help = 'port of the local Rest API instance started by the load test')
+    parser.add_argument('--base_url', dest = 'base_url', type = str, default = None,
+                        help = 'load an already running Rest API instead of starting one, images requests '\
+                               'then need a --input_path readable by the server')
+    parser.add_argument('--input_path', dest = 'input_path', type = str, default = None,
+                        help = 'dataset scaled by the images requests, a temporary one is generated if not given')
+    parser.add_argument('--user_id', dest = 'user_id', type = str, default = config.USER_IDS[0],
+                        help = 'user to authenticate with')
+    parser.add_argument('--json', dest = 'json', action = 'store_true', default = False,
+                        help = 'print the report as JSON')
+    args = parser.parse_args()
+
+    try:
+        args.mix = parse_mix(args.mix) if args.mix else SCENARIOS[args.scenario]
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+# ----------------------------------------------------------------
+def parse_mix(mix):
+    """
+    Parse a request mix
+
+    Parameters:
+        mix (str): comma separated kind=weight pairs
+
+    Return:
+        Dictionary of {kind of request: weight}
+    """
+    weights = {}
+    for item in mix.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in EXPECTED_STATUS:
+            raise ValueError(f'Unknown kind of request {kind}, expected one of {list(EXPECTED_STATUS)}')
+        weights[kind] = float(weight) if weight else 1.0
+    if sum(weights.values()) <= 0:
+        raise ValueError('The request mix needs a positive weight')
+    return weights
+
+
+# ----------------------------------------------------------------
+def make_dataset(path_to_data, pairs):
+    """Write a small Kitti Format dataset for the scale jobs"""
+    os.makedirs(os.path.join(path_to_data, 'images'))
+    os.makedirs(os.path.join(path_to_data, 'annotations'))
+    image = Image.new(mode = 'RGB', size = (1136, 568), color = (0, 255, 0))
+    for i in range(pairs):
+        image.save(os.path.join(path_to_data, 'images', f'frame-{i}.jpg'))
+        with open(os.path.join(path_to_data, 'annotations', f'frame-{i}.txt'), 'w') as file:
+            file.write('Car 0 0 0 100.5 200.25 400 500 0 0 0 0 0 0 0\n')
+
+
+class LoadTest(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, base_url, token, args):
+        """
+        LoadTest, a closed loop of concurrent clients.
+
+        Parameters:
+            base_url (str): URL of the Rest API
+            token (str): valid token of args.user_id
+            args (Namespace): parsed command arguments
+        """
+        self._base_url = base_url
+        self._token = token
+        self._args = args
+        self._kinds = list(args.mix)
+        self._weights = [args.mix[kind] for kind in self._kinds]
+        # {kind: [(latency in seconds, status code or error name)]}
+        self._results = defaultdict(list)
+        self._client = AsyncHTTPClient()
+
+    # ----------------------------------------------------------------
+    def request(self, kind):
+        """
+        Build a request of the given kind
+
+        Return:
+            Tuple of (url, keyword arguments of fetch)
+        """
+        headers = {'Authorization': f'bearer {self._token}'}
+        if kind == 'home':
+            return f'{self._base_url}/', {}
+        if kind == 'auth':
+            return f'{self._base_url}/auth', {'method': 'POST', 'body': urlencode({'user_id': self._args.user_id})}
+        if kind == 'token':
+            return f'{self._base_url}/jobs/{os.urandom(16).hex()}', {'headers': headers}
+        if kind == 'bad_token':
+            return f'{self._base_url}/jobs/{os.urandom(16).hex()}', {'headers': {'Authorization': 'bearer not.a.token'}}
+        # Different target sizes so that identical requests are not deduplicated
+        params = {'input_path': self._args.input_path, 'output_path': self._args.input_path,
+                  'target_width': random.randint(64, 512), 'target_height': random.randint(64, 512)}
+        return f'{self._base_url}/images?{urlencode(params)}', {'headers': headers}
+
+    # ----------------------------------------------------------------
+    async def client(self, deadline):
+        """Send requests one after the other until the deadline"""
+        while time.monotonic() < deadline:
+            kind = random.choices(self._kinds, self._weights)[0]
+            url, kwargs = self.request(kind)
+            start = time.perf_counter()
+            try:
+                response = await self._client.fetch(url, raise_error = False,
+                                                    request_timeout = self._args.request_timeout, **kwargs)
+                outcome = response.code if response.code != 599 else type(response.error).__name__
+            except HTTPClientError as e:
+                # Timeouts are raised even with raise_error = False
+                outcome = e.code if e.code != 599 else 'timeout'
+            except Exception as e:
+                outcome = type(e).__name__
+            self._results[kind].append((time.perf_counter() - start, outcome))
+
+    # ----------------------------------------------------------------
+    async def run(self):
+        """
+        Run the load test
+
+        Return:
+            Elapsed seconds
+        """
+        start = time.monotonic()
+        deadline = start + self._args.duration
+        await asyncio.gather(*(self.client(deadline) for _ in range(self._args.concurrency)))
+        return time.monotonic() - start
+
+    # ----------------------------------------------------------------
+    def report(self, elapsed):
+        """
+        Summarize the results
+
+        Parameters:
+            elapsed (float): seconds the load test lasted
+
+        Return:
+            Dictionary of {kind of request or 'total': statistics}
+        """
+        report = {}
+        everything = []
+        for kind in self._kinds:
+            results = self._results[kind]
+            everything.extend((latency, outcome == EXPECTED_STATUS[kind], outcome) for latency, outcome in results)
+            report[kind] = self.statistics([(latency, outcome == EXPECTED_STATUS[kind], outcome)
+                                            for latency, outcome in results], elapsed)
+        report['total'] = self.statistics(everything, elapsed)
+        return report
+
+    # ----------------------------------------------------------------
+    @staticmethod
+    def statistics(results, elapsed):
+        """Throughput, error rate, latency percentiles in milliseconds and outcomes of some results"""
+        if not results:
+            return {'requests': 0}
+        latencies = np.array([latency for latency, _, _ in results]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        outcomes = defaultdict(int)
+        for _, _, outcome in results:
+            outcomes[str(outcome)] += 1
+        return {
+            'requests': len(results),
+            'requests_per_second': round(len(results) / elapsed, 1),
+            'error_rate': round(sum(1 for _, ok, _ in results if not ok) / len(results), 4),
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'max_ms': round(latencies.max(), 2),
+            'outcomes': dict(outcomes)
+        }
+
+
+# ----------------------------------------------------------------
+def print_report(report, args, elapsed):
+    """Print the report as a table"""
+    print(f'{args.concurrency} clients for {elapsed:.1f} s, mix {args.mix}')
+    for kind, stats in report.items():
+        if not stats['requests']:
+            print(f'{kind:<10} no request')
+            continue
+        print(f"{kind:<10} n={stats['requests']:<7} {stats['requests_per_second']:8.1f} req/s   "
+              f"errors={stats['error_rate']*100:6.2f}%   p50={stats['p50_ms']:8.2f} ms   "
+              f"p95={stats['p95_ms']:8.2f} ms   p99={stats['p99_ms']:8.2f} ms   max={stats['max_ms']:8.2f} ms   "
+              f"{stats['outcomes']}")
+
+
+# ----------------------------------------------------------------
+def main():
+    args = process_arguments()
+
+    path_to_tmp = None
+    if 'images' in args.mix and args.input_path is None:
+        path_to_tmp = tempfile.mkdtemp(prefix = 'load_test-')
+        args.input_path = os.path.join(path_to_tmp, 'data')
+        make_dataset(args.input_path, args.pairs)
+
+    rest_api = None
+    base_url = args.base_url
+    if base_url is None:
+        base_url = f'http://localhost:{args.rest_api_port}'
+        rest_api = Popen(['python3', os.path.join(path_to_package, 'restapi', 'rest_api.py'),
+                          '--rest_api_port', str(args.rest_api_port), '--log_level', 'ERROR'],
+                         stdout = DEVNULL, stderr = DEVNULL)
+        time.sleep(WARMUP_TIME)
+
+    # Otherwise requests beyond the default 10 connections wait in the client
+    AsyncHTTPClient.configure(None, max_clients = args.concurrency)
+    try:
+        async def run():
+            response = await AsyncHTTPClient().fetch(f'{base_url}/auth', method = 'POST',
+                                                     body = urlencode({'user_id': args.user_id}))
+            load_test = LoadTest(base_url, json.loads(response.body)['token'], args)
+            elapsed = await load_test.run()
+            return load_test.report(elapsed), elapsed
+
+        report, elapsed = asyncio.run(run())
+    finally:
+        if rest_api is not None:
+            rest_api.terminate()
+            try:
+                rest_api.wait(5)
+            except TimeoutExpired:
+                rest_api.kill()
+        if path_to_tmp is not None:
+            shutil.rmtree(path_to_tmp, ignore_errors = True)
+
+    if args.json:
+        print(json.dumps(report, indent = 2))
+    else:
+        print_report(report, args, elapsed)
+    if report['total']['requests'] and report['total']['error_rate'] > 0:
+        sys.exit(1)
+
+
+# ----------------------------------------------------------------
+if __name__ == '__main__':
+    main()
@@ -4,4 +4,6 @@
 from .annotations import Annotations
 from .image_annotations import ImageAnnotations
 from .path_consistensy import InputOutputPathConsistensy
-from .custom_exceptions import NoSuchPath, UnvalidAnnotationsFile, UnvalidKittiFolderFormat
\ No newline at end of file
+from .dataset_index import DatasetIndex
+from .transforms import Compose, Crop, Resize, LetterboxPad, HorizontalFlip, Affine
+from .custom_exceptions import NoSuchPath, UnvalidAnnotationsFile, UnvalidKittiFolderFormat, UnvalidImageFile, UnvalidBatchUpload
\ No newline at end of file
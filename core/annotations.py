@@ -15,6 +15,8 @@ Copyright:
 import re
 import numpy as np
 from core.custom_exceptions import UnvalidAnnotationsFile
+from core.transforms import transform_boxes
+from core.serializer import AnnotationSerializer
 
 class Annotations(object):
 
@@ -22,19 +24,27 @@ class Annotations(object):
     # Initialization
 
     # ----------------------------------------------------------------
-    def __init__(self, path):
+    def __init__(self, path = None, check = True, text = None):
         """
         Annotations, an abstract representation of all the annotations
         related to an image.
 
         Parameters:
             path (str): path to annotations file
+            check (bool): raise if the annotations do not follow the requirements
+            text (str): annotations file content, used instead of reading path
         """
         self._path = path
         self._annotations = None
+        self._class_names = None
+        self._parameters = None
         # Store annotations
-        self.read_annotations()
-        self.self_check()
+        if text is None:
+            self.read_annotations()
+        else:
+            self._annotations = text.splitlines()
+        if check:
+            self.self_check()
 
     # ----------------------------------------------------------------
     def read_annotations(self):
@@ -44,36 +54,82 @@ class Annotations(object):
         with open(self._path, 'r') as file:
             self._annotations = file.read().splitlines()
     
+    # ----------------------------------------------------------------
+    @property
+    def class_names(self):
+        if self._class_names is None:
+            self.parse()
+        return self._class_names
+
+    @property
+    def parameters(self):
+        if self._parameters is None:
+            self.parse()
+        return self._parameters
+
+    @property
+    def bounding_boxes(self):
+        return self.parameters[:, 3:7]
+
+    # ----------------------------------------------------------------
+    def parse(self):
+        """
+        Parse every annotation into its class name and a row of the 
+        (N, 14) numeric parameters matrix. Missing trailing parameters
+        are filled with zeros.
+        """
+        self._class_names = []
+        self._parameters = np.zeros((len(self._annotations), 14), dtype=np.float64)
+
+        for row, object_labels in enumerate(self._annotations):
+            self._class_names.append(re.findall(r'[a-zA-Z]+', object_labels)[0])
+            numeric_parameters = re.findall(r'[-]*[0-9]+[.]*[0-9]*', object_labels)[:14]
+            self._parameters[row, :len(numeric_parameters)] = [float(parameter) for parameter in numeric_parameters]
+
     # ---------------------------------------------------------------- 
     def self_check(self):
         """
         Consistensy check for the annotations. Its purpose is to ensure all
         annotations in the file follow the Kitti format and the requirements.
-        Each annotation should have a class name followed by 14 numeric parameters.
-        According to requirements, all annotations are bounding boxes, therefore only
-        4 of the numeric parameters should be non zero.
+        Raises on the first annotation that does not.
+        """
+        for line, reason in self.violations():
+            raise UnvalidAnnotationsFile(reason = reason, line = line)
+
+    # ----------------------------------------------------------------
+    def violations(self):
         """
+        Check every annotation of the file. Each annotation should have a class
+        name followed by 14 numeric parameters. According to requirements, all
+        annotations are bounding boxes, therefore only 4 of the numeric parameters
+        should be non zero.
 
-        for object_labels in self._annotations:
+        Return:
+            Generator of (line number, reason) for each unvalid annotation
+        """
+
+        for line, object_labels in enumerate(self._annotations, start = 1):
 
             # Check if there is a class name
             class_name = re.findall(r'[a-zA-Z]+', object_labels)
             if len(class_name) > 1:
-                raise UnvalidAnnotationsFile(reason = 'unvalid_class')
+                yield line, 'unvalid_class'
+                continue
                 
             if len(class_name) == 0:
-                raise UnvalidAnnotationsFile(reason = 'class')
+                yield line, 'class'
+                continue
             
             
             # Check if the annotation only contains the bounding box
             numeric_parameters = re.findall(r'[-]*[0-9]+[.]*[0-9]*', object_labels)
 
             if sum([float(parameter) for parameter in numeric_parameters[:3]]) != 0:
-                raise UnvalidAnnotationsFile(reason = 'box')
-            if sum([float(parameter) for parameter in numeric_parameters[3:7]]) == 0:
-                raise UnvalidAnnotationsFile(reason = 'unvalid_box')
-            if sum([float(parameter) for parameter in numeric_parameters[7:]]) != 0:
-                raise UnvalidAnnotationsFile(reason = 'box')
+                yield line, 'box'
+            elif sum([float(parameter) for parameter in numeric_parameters[3:7]]) == 0:
+                yield line, 'unvalid_box'
+            elif sum([float(parameter) for parameter in numeric_parameters[7:]]) != 0:
+                yield line, 'box'
     
     # ----------------------------------------------------------------
     def scale_bounding_box(self, width, height, bounding_box, 
@@ -104,6 +160,28 @@ class Annotations(object):
         
         return x_min_scale, y_min_scale, x_max_scale, y_max_scale
 
+    # ----------------------------------------------------------------
+    def scale_parameters(self, img_width, img_height, target_width, target_height, decimals = 2):
+        """
+        Scale all bounding boxes of the file at once
+
+        Parameters:
+            img_width (int): width of the image
+            img_height (int): height of the image
+            target_width (int): target width to scale the image
+            target_height (int): target height to scale the image
+            decimals (int): decimals to round scaled coordinates
+
+        Return:
+            (N, 14) numeric parameters with the scaled bounding boxes
+        """
+        parameters = self.parameters.copy()
+        width_scale = target_width/img_width
+        height_scale = target_height/img_height
+        parameters[:, 3:7] = np.round(parameters[:, 3:7] * [width_scale, height_scale, width_scale, height_scale],
+                                      decimals)
+        return parameters
+
     # ----------------------------------------------------------------
     def scale(self, img_width, img_height, target_width, target_height):
         """
@@ -118,27 +196,35 @@ class Annotations(object):
         Return:
             List of the scaled annotations of the file
         """
+        parameters = self.scale_parameters(img_width, img_height, target_width, target_height)
+        return AnnotationSerializer().lines(self.class_names, parameters)
 
-        scaled_annotations = []
+    # ----------------------------------------------------------------
+    def transform_parameters(self, matrix, size, min_size = 1.0, decimals = 2):
+        """
+        Transform all bounding boxes of the file at once, boxes left with
+        less than min_size once clipped to the image are dropped
 
-        for object_labels in self._annotations:
+        Parameters:
+            matrix (array): 3x3 matrix, i.e. folded by transforms.Compose
+            size (tuple): (width, height) of the transformed image
+            min_size (float): minimum width and height of a box to keep it
+            decimals (int): decimals to round transformed coordinates
 
-            # Get numeric parameters
-            numeric_parameters = re.findall(r'[-]*[0-9]+[.]*[0-9]*', object_labels)
-            # Store bounding box coordinates
-            bounding_box_coord = [float(label) for label in numeric_parameters[3:7]]
-            # Compute scaled bounding box coordinates
-            x_min_scale, y_min_scale, x_max_scale, y_max_scale = self.scale_bounding_box(img_width, 
-                                                                                         img_height, 
-                                                                                         bounding_box_coord,
-                                                                                         target_width,
-                                                                                         target_height
-                                                                                         )
-            # Replace old coordinates with scaled coordinates
-            numeric_parameters[3:7] = x_min_scale, y_min_scale, x_max_scale, y_max_scale
-            
-            # Store results
-            numeric_parameters_scaled = ' '.join(str(label) for label in numeric_parameters)
-            scaled_annotations.append(re.findall(r'[a-zA-Z]+', object_labels)[0]+' '+numeric_parameters_scaled)
-        
-        return scaled_annotations
\ No newline at end of file
+        Return:
+            Tuple of (class names, (N, 14) numeric parameters) of the boxes kept
+        """
+        parameters = self.parameters.copy()
+        boxes, keep = transform_boxes(self.bounding_boxes, matrix, size, min_size)
+        parameters[:, 3:7] = np.round(boxes, decimals)
+        return [class_name for class_name, kept in zip(self.class_names, keep) if kept], parameters[keep]
+
+    # ----------------------------------------------------------------
+    def transform(self, matrix, size, min_size = 1.0, decimals = 2):
+        """
+        Transform all annotations of the file, see transform_parameters()
+
+        Return:
+            List of the transformed annotations of the file
+        """
+        return AnnotationSerializer().lines(*self.transform_parameters(matrix, size, min_size, decimals))
@@ -0,0 +1,188 @@
+"""
+archive.py
+
+Description:
+    Archives of an output folder built on the fly, chunk by chunk,
+    so that multi-GB results can be downloaded without writing or
+    buffering the whole archive. The tar layout is computed upfront,
+    which gives its exact size and allows serving any byte range.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import time
+import hashlib
+import tarfile
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024
+# Oldest timestamp a zip file can hold (1980-01-01)
+ZIP_EPOCH = 315532800
+
+
+# ----------------------------------------------------------------
+def list_files(path_to_folder):
+    """
+    List the regular files of a folder recursively, in a stable order
+
+    Parameters:
+        path_to_folder (str): path to the folder
+
+    Return:
+        List of (relative posix name, path, size, mtime) tuples
+    """
+    files = []
+    for root, folders, names in os.walk(path_to_folder):
+        folders.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            relative = os.path.relpath(path, path_to_folder).replace(os.sep, '/')
+            files.append((relative, path, stat.st_size, stat.st_mtime))
+    return files
+
+
+class TarStream(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path_to_folder, arcname):
+        """
+        TarStream, a pax tar archive of a folder laid out upfront and
+        produced on demand.
+
+        Parameters:
+            path_to_folder (str): path to the folder to archive
+            arcname (str): name of the root folder inside the archive
+        """
+        # Segments of the archive: (offset, size, header bytes or path to file)
+        self._segments = []
+        digest = hashlib.blake2b(digest_size = 16)
+        offset = 0
+        for relative, path, size, mtime in list_files(path_to_folder):
+            info = tarfile.TarInfo(arcname+'/'+relative)
+            info.size = size
+            info.mtime = int(mtime)
+            info.mode = 0o644
+            header = info.tobuf(format = tarfile.PAX_FORMAT, encoding = 'utf-8')
+            self._segments.append((offset, len(header), header))
+            offset += len(header)
+            self._segments.append((offset, size, path))
+            offset += size
+            padding = -size % tarfile.BLOCKSIZE
+            if padding:
+                self._segments.append((offset, padding, bytes(padding)))
+                offset += padding
+            digest.update(f'{relative}\0{size}\0{mtime}\0'.encode('utf-8', 'surrogateescape'))
+
+        # End of archive marker
+        self._segments.append((offset, 2*tarfile.BLOCKSIZE, bytes(2*tarfile.BLOCKSIZE)))
+        self._size = offset + 2*tarfile.BLOCKSIZE
+        self._etag = digest.hexdigest()
+
+    # ----------------------------------------------------------------
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def etag(self):
+        return self._etag
+
+    # ----------------------------------------------------------------
+    def chunks(self, start = 0, end = None, chunk_size = CHUNK_SIZE):
+        """
+        Produce a byte range of the archive
+
+        Parameters:
+            start (int): first byte
+            end (int): byte after the last one, None for the end of the archive
+            chunk_size (int): maximum size of the chunks read from the files
+
+        Return:
+            Generator of bytes
+        """
+        end = self._size if end is None else min(end, self._size)
+        for offset, size, content in self._segments:
+            if offset+size <= start:
+                continue
+            if offset >= end:
+                break
+            first = max(start, offset) - offset
+            last = min(end, offset+size) - offset
+            if isinstance(content, bytes):
+                yield content[first:last]
+                continue
+
+            with open(content, 'rb') as file:
+                file.seek(first)
+                remaining = last - first
+                while remaining:
+                    data = file.read(min(chunk_size, remaining))
+                    if not data:
+                        raise OSError(f'{content} changed while being archived')
+                    remaining -= len(data)
+                    yield data
+
+
+class _ChunkWriter(object):
+    """Unseekable file object collecting what zipfile writes"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+# ----------------------------------------------------------------
+def zip_chunks(path_to_folder, arcname, chunk_size = CHUNK_SIZE):
+    """
+    Produce a zip archive of a folder. Its size is unknown upfront since
+    annotations are compressed, images are stored as they are already compressed.
+
+    Parameters:
+        path_to_folder (str): path to the folder to archive
+        arcname (str): name of the root folder inside the archive
+        chunk_size (int): approximate size of the chunks produced
+
+    Return:
+        Generator of bytes
+    """
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, 'w') as archive:
+        for relative, path, size, mtime in list_files(path_to_folder):
+            info = zipfile.ZipInfo(arcname+'/'+relative, time.localtime(max(mtime, ZIP_EPOCH))[:6])
+            info.compress_type = zipfile.ZIP_STORED if relative.endswith('.jpg') else zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as source, \
+                 archive.open(info, 'w', force_zip64 = size > zipfile.ZIP64_LIMIT) as destination:
+                while True:
+                    data = source.read(chunk_size)
+                    if not data:
+                        break
+                    destination.write(data)
+                    if writer.size >= chunk_size:
+                        yield writer.take()
+            if writer.size >= chunk_size:
+                yield writer.take()
+    # Remaining entries and central directory
+    yield writer.take()
@@ -0,0 +1,387 @@
+"""
+batch_stream.py
+
+Description:
+    Incremental parsers for batches of image and annotation files
+    uploaded as a tar archive or a multipart/form-data body. Data is
+    fed chunk by chunk as it arrives from the network and files are
+    handed out as soon as they are complete, so only the file being
+    received and the pairs still missing a partner are held in memory.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import posixpath
+import tarfile
+from email.message import Message
+from core.custom_exceptions import UnvalidBatchUpload
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+# Maximum size of the headers of a multipart part
+MAX_PART_HEADERS_SIZE = 16384
+NO_DATA_TYPES = (tarfile.LNKTYPE, tarfile.SYMTYPE, tarfile.DIRTYPE,
+                 tarfile.FIFOTYPE, tarfile.CHRTYPE, tarfile.BLKTYPE)
+
+
+# ----------------------------------------------------------------
+def multipart_boundary(content_type):
+    """
+    Get the boundary of a multipart/form-data Content-Type header
+
+    Parameters:
+        content_type (str): Content-Type header
+
+    Return:
+        Boundary as bytes
+    """
+    message = Message()
+    message['Content-Type'] = content_type
+    boundary = message.get_param('boundary')
+    if not boundary:
+        raise UnvalidBatchUpload(reason = 'format')
+    return boundary.encode('latin-1')
+
+
+class TarStreamParser(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, max_entry_size):
+        """
+        TarStreamParser, an incremental parser of tar archives (ustar,
+        GNU long names and pax paths). Directories, links and other
+        special entries are skipped.
+
+        Parameters:
+            max_entry_size (int): maximum size of a file in bytes
+        """
+        self._max_entry_size = max_entry_size
+        self._buffer = bytearray()
+        self._entry = None
+        self._body = bytearray()
+        self._remaining = 0
+        self._padding = 0
+        self._next_name = None
+        self._end = False
+
+    # ----------------------------------------------------------------
+    def start_entry(self, block):
+        """
+        Parse the header of the next entry
+
+        Parameters:
+            block (bytes): 512 bytes header block
+        """
+        try:
+            info = tarfile.TarInfo.frombuf(bytes(block), 'utf-8', 'surrogateescape')
+        except tarfile.HeaderError:
+            raise UnvalidBatchUpload(reason = 'format')
+
+        stored = info.isreg() or info.type in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE)
+        if stored and info.size > self._max_entry_size:
+            raise UnvalidBatchUpload(reason = 'entry_size')
+
+        if self._next_name is not None and info.type not in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE):
+            info.name = self._next_name
+            self._next_name = None
+
+        self._entry = info if stored else None
+        self._body = bytearray()
+        # Links, directories and devices have no data blocks
+        self._remaining = 0 if info.type in NO_DATA_TYPES else info.size
+        self._padding = -self._remaining % BLOCK_SIZE
+
+    # ----------------------------------------------------------------
+    def finish_entry(self):
+        """
+        Complete the current entry
+
+        Return:
+            Tuple of (name, body) for files, None otherwise
+        """
+        entry, body = self._entry, bytes(self._body)
+        self._entry = None
+        self._body = bytearray()
+        if entry is None:
+            return None
+
+        if entry.type == tarfile.GNUTYPE_LONGNAME:
+            self._next_name = body.rstrip(b'\0').decode('utf-8', 'surrogateescape')
+        elif entry.type == tarfile.XHDTYPE:
+            # Pax records: "<length> <key>=<value>\n"
+            while body:
+                length = int(body.split(b' ', 1)[0])
+                key, _, value = body[:length].split(b' ', 1)[1].partition(b'=')
+                if key == b'path':
+                    self._next_name = value[:-1].decode('utf-8', 'surrogateescape')
+                body = body[length:]
+        else:
+            return entry.name, body
+        return None
+
+    # ----------------------------------------------------------------
+    def feed(self, chunk):
+        """
+        Feed the next chunk of the archive
+
+        Parameters:
+            chunk (bytes): data received
+
+        Return:
+            List of (name, body) of the files completed by this chunk
+        """
+        if self._end:
+            return []
+        self._buffer += chunk
+        files = []
+        offset = 0
+        while not self._end:
+            available = len(self._buffer) - offset
+            if self._remaining:
+                # Entry data, consumed as it arrives
+                size = min(self._remaining, available)
+                if size == 0:
+                    break
+                if self._entry is not None:
+                    self._body += self._buffer[offset:offset+size]
+                offset += size
+                self._remaining -= size
+                if self._remaining == 0 and self._padding == 0:
+                    pair = self.finish_entry()
+                    if pair is not None:
+                        files.append(pair)
+            elif self._padding:
+                size = min(self._padding, available)
+                if size == 0:
+                    break
+                offset += size
+                self._padding -= size
+                if self._padding == 0:
+                    pair = self.finish_entry()
+                    if pair is not None:
+                        files.append(pair)
+            else:
+                if available < BLOCK_SIZE:
+                    break
+                block = self._buffer[offset:offset+BLOCK_SIZE]
+                offset += BLOCK_SIZE
+                if block.count(0) == BLOCK_SIZE:
+                    # End of archive marker, anything after it is ignored
+                    self._end = True
+                    break
+                self.start_entry(block)
+                if self._remaining == 0:
+                    pair = self.finish_entry()
+                    if pair is not None:
+                        files.append(pair)
+
+        del self._buffer[:offset]
+        return files
+
+    # ----------------------------------------------------------------
+    def close(self):
+        """
+        Check the archive was complete
+        """
+        if not self._end or self._remaining or self._padding:
+            raise UnvalidBatchUpload(reason = 'incomplete')
+
+
+class MultipartStreamParser(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, boundary, max_entry_size):
+        """
+        MultipartStreamParser, an incremental parser of multipart/form-data
+        bodies. Only parts carrying a file (with a filename) are handed out.
+
+        Parameters:
+            boundary (bytes): multipart boundary
+            max_entry_size (int): maximum size of a file in bytes
+        """
+        self._max_entry_size = max_entry_size
+        self._delimiter = b'\r\n--'+boundary
+        # The body starts right at the first delimiter, without a preceding line break
+        self._buffer = bytearray(b'\r\n')
+        self._state = 'preamble'
+        self._name = None
+        self._body = bytearray()
+
+    # ----------------------------------------------------------------
+    @staticmethod
+    def part_filename(headers):
+        """
+        Get the filename of a part from its headers
+
+        Parameters:
+            headers (bytes): headers of the part
+
+        Return:
+            Filename, None for parts without a file
+        """
+        message = Message()
+        for line in headers.decode('utf-8', 'surrogateescape').split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-disposition':
+                message['Content-Disposition'] = value.strip()
+        return message.get_param('filename', header = 'content-disposition')
+
+    # ----------------------------------------------------------------
+    def feed(self, chunk):
+        """
+        Feed the next chunk of the body
+
+        Parameters:
+            chunk (bytes): data received
+
+        Return:
+            List of (name, body) of the files completed by this chunk
+        """
+        self._buffer += chunk
+        files = []
+        while True:
+            if self._state == 'preamble':
+                index = self._buffer.find(self._delimiter)
+                if index < 0:
+                    # Keep the tail, the delimiter may be split over two chunks
+                    del self._buffer[:max(0, len(self._buffer)-len(self._delimiter))]
+                    break
+                del self._buffer[:index+len(self._delimiter)]
+                self._state = 'delimiter'
+
+            elif self._state == 'delimiter':
+                if len(self._buffer) < 2:
+                    break
+                if self._buffer[:2] == b'--':
+                    self._state = 'end'
+                elif self._buffer[:2] == b'\r\n':
+                    self._state = 'headers'
+                else:
+                    raise UnvalidBatchUpload(reason = 'format')
+                del self._buffer[:2]
+
+            elif self._state == 'headers':
+                index = self._buffer.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(self._buffer) > MAX_PART_HEADERS_SIZE:
+                        raise UnvalidBatchUpload(reason = 'format')
+                    break
+                self._name = self.part_filename(bytes(self._buffer[:index]))
+                self._body = bytearray()
+                del self._buffer[:index+4]
+                self._state = 'body'
+
+            elif self._state == 'body':
+                index = self._buffer.find(self._delimiter)
+                # Everything but a possible partial delimiter belongs to the part
+                end = index if index >= 0 else max(0, len(self._buffer)-len(self._delimiter)+1)
+                if self._name is not None:
+                    if len(self._body)+end > self._max_entry_size:
+                        raise UnvalidBatchUpload(reason = 'entry_size')
+                    self._body += self._buffer[:end]
+                del self._buffer[:end]
+                if index < 0:
+                    break
+                del self._buffer[:len(self._delimiter)]
+                if self._name is not None:
+                    files.append((self._name, bytes(self._body)))
+                self._name = None
+                self._body = bytearray()
+                self._state = 'delimiter'
+
+            else:
+                # Epilogue is ignored
+                self._buffer = bytearray()
+                break
+
+        return files
+
+    # ----------------------------------------------------------------
+    def close(self):
+        """
+        Check the body was complete
+        """
+        if self._state != 'end':
+            raise UnvalidBatchUpload(reason = 'incomplete')
+
+
+class PairAssembler(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, max_unpaired, max_unpaired_bytes = None):
+        """
+        PairAssembler, matches the image and annotation files of a batch by
+        their unique id. A file waits until its partner arrives, the number
+        and the size of waiting files are bounded so that pairs must be sent
+        close together.
+
+        Parameters:
+            max_unpaired (int): maximum number of files waiting for their partner
+            max_unpaired_bytes (int): maximum bytes of files waiting for their partner,
+                                      unbounded if None
+        """
+        self._max_unpaired = max_unpaired
+        self._max_unpaired_bytes = max_unpaired_bytes
+        self._waiting = {}
+        self._waiting_bytes = 0
+        self._seen = set()
+
+    # ----------------------------------------------------------------
+    def add(self, name, body):
+        """
+        Add a file of the batch
+
+        Parameters:
+            name (str): file name, folders are ignored
+            body (bytes): file content
+
+        Return:
+            Tuple of (unique id, image bytes, annotations bytes) once both files
+            of the pair arrived, None otherwise
+        """
+        name = posixpath.basename(name.replace('\\', '/'))
+        stem, extension = posixpath.splitext(name)
+        if extension not in ('.jpg', '.txt') or not stem or name.startswith('.'):
+            raise UnvalidBatchUpload(reason = 'extension')
+        if name in self._seen:
+            raise UnvalidBatchUpload(reason = 'duplicate')
+        self._seen.add(name)
+
+        partner = stem+('.txt' if extension == '.jpg' else '.jpg')
+        if partner not in self._waiting:
+            if len(self._waiting) >= self._max_unpaired:
+                raise UnvalidBatchUpload(reason = 'unpaired')
+            if self._max_unpaired_bytes is not None and \
+               self._waiting_bytes + len(body) > self._max_unpaired_bytes:
+                raise UnvalidBatchUpload(reason = 'unpaired')
+            self._waiting[name] = body
+            self._waiting_bytes += len(body)
+            return None
+
+        partner_body = self._waiting.pop(partner)
+        self._waiting_bytes -= len(partner_body)
+        if extension == '.jpg':
+            return stem, body, partner_body
+        return stem, partner_body, body
+
+    # ----------------------------------------------------------------
+    def unpaired(self):
+        """
+        Get the files whose partner never arrived
+
+        Return:
+            Sorted list of file names
+        """
+        return sorted(self._waiting)
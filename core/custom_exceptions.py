@@ -14,23 +14,33 @@ Copyright:
 class UnvalidAnnotationsFile(Exception):
     """Exception raised when the annotation files do not follow technical assignment requirements"""
 
-    def __init__(self, reason):
-        
+    def __init__(self, reason, line = None):
+
+        self.reason = reason
+        self.line = line
+
         messages = {
             'class': 'Missing class name',
             'unvalid_class': 'Unvalid class name',
             'box': 'Only bounding box are permitted',
-            'unvalid_box': 'Unvalid bounding box'
+            'unvalid_box': 'Unvalid bounding box',
+            'unexported_class': 'Class name not among the exported classes'
         }
         
         super().__init__(messages[reason])
 
+    def __reduce__(self):
+        # Rebuilt from its reason when sent back by a worker process
+        return (type(self), (self.reason, self.line))
+
 
 class UnvalidKittiFolderFormat(Exception):
     """Exception raised when input folder does not follow Kitti Format"""
 
     def __init__(self, reason):
 
+        self.reason = reason
+
         messages = {
             'folder': 'Directory structure does not follow Kitti Format',
             'empty': 'Data unavialable',
@@ -45,6 +55,8 @@ class NoSuchPath(Exception):
 
     def __init__(self, reason):
 
+        self.reason = reason
+
         messages = {
             'input_exist': 'Input path does not exist',
             'input_dir': 'Input path is not a directory',
@@ -52,4 +64,49 @@ class NoSuchPath(Exception):
             'output_dir': 'Output path is not a directory'
         }
         super().__init__(messages[reason])
-        
\ No newline at end of file
+
+class UnvalidImageFile(Exception):
+    """Exception raised when an image file is not a complete JPEG file"""
+
+    def __init__(self, reason):
+
+        self.reason = reason
+        messages = {
+            'header': 'Missing JPEG start of image marker',
+            'truncated': 'Missing JPEG end of image marker'
+        }
+        super().__init__(messages[reason])
+
+class UnvalidBatchUpload(Exception):
+    """Exception raised when a streamed batch of image and annotation files can not be processed"""
+
+    def __init__(self, reason):
+
+        self.reason = reason
+        messages = {
+            'format': 'Malformed batch, expected a tar archive or a multipart/form-data body',
+            'entry_size': 'File in the batch exceeds the maximum size',
+            'extension': 'Wrong file extension. Images should be .jpg and annotations .txt',
+            'duplicate': 'File appears more than once in the batch',
+            'unpaired': 'Too many files waiting for their image or annotations file, send pairs next to each other',
+            'incomplete': 'Batch ended before its last file was complete'
+        }
+        super().__init__(messages[reason])
+
+class ObjectStoreError(Exception):
+    """Exception raised when an S3-compatible object store can not be used or rejects a request"""
+
+    def __init__(self, reason, detail = None):
+
+        self.reason = reason
+        self.detail = detail
+        messages = {
+            'url': 'Object store URL should be s3://<bucket>/<prefix>',
+            'credentials': 'Missing object store credentials, set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY',
+            'request': 'Object store request failed'
+        }
+        super().__init__(messages[reason] if detail is None else f'{messages[reason]}: {detail}')
+
+    def __reduce__(self):
+        # Rebuilt from its reason when sent back by a worker process
+        return (type(self), (self.reason, self.detail))
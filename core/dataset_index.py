@@ -0,0 +1,299 @@
+"""
+dataset_index.py
+
+Description:
+    Persisted index over a Kitti Format dataset. Stores, for every
+    frame, the image dimensions and the bounding boxes of all its
+    annotations, so that queries such as "all frames containing a
+    class" or "boxes smaller than N px once scaled" are answered with
+    vectorized operations instead of a full scan of the label files.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import re
+import hashlib
+import numpy as np
+from PIL import Image
+from core.annotations import Annotations
+from core.custom_exceptions import UnvalidAnnotationsFile
+
+INDEX_CACHE_FOLDER = 'kitti_index'
+
+
+# ----------------------------------------------------------------
+def default_index_path(path_to_data):
+    """
+    Get the default location of the index of a dataset. Indexes live in
+    the user cache directory, keyed by the real path of the dataset, so
+    that the input folder is never written.
+
+    Parameters:
+        path_to_data (str): path to the Kitti Format dataset
+
+    Return:
+        Path to the persisted index (.npz)
+    """
+    path_to_cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    digest = hashlib.blake2b(os.path.realpath(path_to_data).encode('utf-8'), digest_size = 16).hexdigest()
+    return os.path.join(path_to_cache, INDEX_CACHE_FOLDER, f'{digest}.npz')
+
+
+class DatasetIndex(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path_to_images, path_to_annotations, path_to_index):
+        """
+        DatasetIndex, a columnar index of a Kitti Format dataset. Frames
+        are stored once and boxes reference them by position, therefore
+        all queries reduce to numpy masks over flat arrays.
+
+        Parameters:
+            path_to_images (str): path to the images folder
+            path_to_annotations (str): path to the annotations folder
+            path_to_index (str): path to the persisted index (.npz)
+        """
+        self._path_to_images = path_to_images
+        self._path_to_annotations = path_to_annotations
+        self._path_to_index = path_to_index
+
+        # Per-frame arrays
+        self._frame_ids = np.array([], dtype=str)
+        self._signatures = np.zeros((0, 4), dtype=np.int64)
+        self._image_sizes = np.zeros((0, 2), dtype=np.int64)
+        self._valid = np.zeros(0, dtype=bool)
+
+        # Per-box arrays
+        self._class_names = np.array([], dtype=str)
+        self._box_frames = np.zeros(0, dtype=np.int64)
+        self._box_classes = np.zeros(0, dtype=np.int64)
+        self._boxes = np.zeros((0, 4), dtype=np.float64)
+
+        if os.path.isfile(self._path_to_index):
+            self.load()
+
+    # ----------------------------------------------------------------
+    @property
+    def frame_ids(self):
+        return self._frame_ids
+
+    @property
+    def image_sizes(self):
+        return self._image_sizes
+
+    @property
+    def class_names(self):
+        return self._class_names
+
+    @property
+    def invalid_frame_ids(self):
+        return self._frame_ids[~self._valid]
+
+    # ----------------------------------------------------------------
+    def load(self):
+        """
+        Load the persisted index
+        """
+        with np.load(self._path_to_index, allow_pickle=False) as data:
+            self._frame_ids = data['frame_ids']
+            self._signatures = data['signatures']
+            self._image_sizes = data['image_sizes']
+            self._valid = data['valid']
+            self._class_names = data['class_names']
+            self._box_frames = data['box_frames']
+            self._box_classes = data['box_classes']
+            self._boxes = data['boxes']
+
+    # ----------------------------------------------------------------
+    def save(self):
+        """
+        Persist the index. The file is written aside and renamed so that
+        a concurrent reader never sees a partially written index.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self._path_to_index)), exist_ok = True)
+        path_to_tmp = self._path_to_index + '.tmp.npz'
+        np.savez(path_to_tmp,
+                 frame_ids = self._frame_ids,
+                 signatures = self._signatures,
+                 image_sizes = self._image_sizes,
+                 valid = self._valid,
+                 class_names = self._class_names,
+                 box_frames = self._box_frames,
+                 box_classes = self._box_classes,
+                 boxes = self._boxes
+                 )
+        os.replace(path_to_tmp, self._path_to_index)
+
+    # ----------------------------------------------------------------
+    def scan_signatures(self):
+        """
+        Get the (image mtime, image size, annotations mtime, annotations size)
+        signature of every pair of image and annotation files
+
+        Return:
+            Dictionary {frame id: signature tuple}
+        """
+        images = {}
+        with os.scandir(self._path_to_images) as entries:
+            for entry in entries:
+                if entry.name.endswith('.jpg'):
+                    stat = entry.stat()
+                    images[re.sub(r'\.jpg$', '', entry.name)] = (stat.st_mtime_ns, stat.st_size)
+
+        signatures = {}
+        with os.scandir(self._path_to_annotations) as entries:
+            for entry in entries:
+                frame_id = re.sub(r'\.txt$', '', entry.name)
+                if entry.name.endswith('.txt') and frame_id in images:
+                    stat = entry.stat()
+                    signatures[frame_id] = images[frame_id] + (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    # ----------------------------------------------------------------
+    def update(self):
+        """
+        Incremental update of the index. Only frames whose image or annotations
+        file changed (or are new) are read again, removed frames are dropped
+        and everything else is kept as is.
+
+        Return:
+            Number of frames that were (re)indexed
+        """
+        signatures = self.scan_signatures()
+        frame_ids = np.array(sorted(signatures), dtype=str)
+        new_signatures = np.array([signatures[frame_id] for frame_id in frame_ids],
+                                  dtype=np.int64).reshape(-1, 4)
+
+        # Match current frames against the indexed ones
+        old_position = {frame_id: position for position, frame_id in enumerate(self._frame_ids)}
+        old_rows = np.array([old_position.get(frame_id, -1) for frame_id in frame_ids], dtype=np.int64)
+        known = old_rows >= 0
+        unchanged = known.copy()
+        unchanged[known] = np.all(self._signatures[old_rows[known]] == new_signatures[known], axis=1)
+
+        # Remap boxes of unchanged frames to their new frame positions
+        remap = np.full(len(self._frame_ids), -1, dtype=np.int64)
+        remap[old_rows[unchanged]] = np.nonzero(unchanged)[0]
+        keep_boxes = remap[self._box_frames] >= 0 if len(self._box_frames) else np.zeros(0, dtype=bool)
+
+        image_sizes = np.zeros((len(frame_ids), 2), dtype=np.int64)
+        image_sizes[unchanged] = self._image_sizes[old_rows[unchanged]]
+        valid = np.zeros(len(frame_ids), dtype=bool)
+        valid[unchanged] = self._valid[old_rows[unchanged]]
+
+        class_names = list(self._class_names)
+        class_position = {class_name: position for position, class_name in enumerate(class_names)}
+        box_frames = [remap[self._box_frames[keep_boxes]]]
+        box_classes = [self._box_classes[keep_boxes]]
+        boxes = [self._boxes[keep_boxes]]
+
+        # Read changed and new frames
+        changed_rows = np.nonzero(~unchanged)[0]
+        for row in changed_rows:
+            frame_id = str(frame_ids[row])
+            try:
+                with Image.open(os.path.join(self._path_to_images, frame_id+'.jpg')) as image:
+                    image_sizes[row] = image.size
+                annotations = Annotations(os.path.join(self._path_to_annotations, frame_id+'.txt'))
+            except (OSError, UnvalidAnnotationsFile):
+                # Unreadable frames are kept (not valid) so they are only read again once they change
+                continue
+            valid[row] = True
+
+            for class_name in annotations.class_names:
+                if class_name not in class_position:
+                    class_position[class_name] = len(class_names)
+                    class_names.append(class_name)
+            box_frames.append(np.full(len(annotations.class_names), row, dtype=np.int64))
+            box_classes.append(np.array([class_position[class_name] for class_name in annotations.class_names],
+                                        dtype=np.int64))
+            boxes.append(annotations.bounding_boxes)
+
+        self._frame_ids = frame_ids
+        self._signatures = new_signatures
+        self._image_sizes = image_sizes
+        self._valid = valid
+        self._class_names = np.array(class_names, dtype=str)
+        self._box_frames = np.concatenate(box_frames)
+        self._box_classes = np.concatenate(box_classes)
+        self._boxes = np.concatenate(boxes).reshape(-1, 4)
+
+        return len(changed_rows)
+
+    # ================================================================
+    # Queries
+
+    # ----------------------------------------------------------------
+    def frames_by_class(self):
+        """
+        Get the class -> frame ids mapping
+
+        Return:
+            Dictionary {class name: sorted list of frame ids}
+        """
+        return {str(class_name): self.frames_with_classes([class_name])
+                for class_name in self._class_names}
+
+    # ----------------------------------------------------------------
+    def frames_with_classes(self, classes):
+        """
+        Get all frames containing at least one box of any of the given classes
+
+        Parameters:
+            classes (list): class names
+
+        Return:
+            Sorted list of frame ids
+        """
+        class_ids = np.nonzero(np.isin(self._class_names, list(classes)))[0]
+        rows = np.unique(self._box_frames[np.isin(self._box_classes, class_ids)])
+        return self._frame_ids[rows].tolist()
+
+    # ----------------------------------------------------------------
+    def box_statistics(self, target_width = None, target_height = None):
+        """
+        Get width, height and area of every indexed box, optionally after
+        scaling its image to the target size
+
+        Parameters:
+            target_width (int): target width to scale the image
+            target_height (int): target height to scale the image
+
+        Return:
+            Tuple of (widths, heights, areas) arrays, one entry per box
+        """
+        widths = self._boxes[:, 2] - self._boxes[:, 0]
+        heights = self._boxes[:, 3] - self._boxes[:, 1]
+
+        if target_width is not None:
+            widths = widths * target_width / self._image_sizes[self._box_frames, 0]
+        if target_height is not None:
+            heights = heights * target_height / self._image_sizes[self._box_frames, 1]
+
+        return widths, heights, widths * heights
+
+    # ----------------------------------------------------------------
+    def frames_with_boxes_smaller_than(self, size, target_width = None, target_height = None):
+        """
+        Get all frames with at least one box whose width or height is
+        smaller than the given size, optionally after scaling
+
+        Parameters:
+            size (float): size in pixels
+            target_width (int): target width to scale the image
+            target_height (int): target height to scale the image
+
+        Return:
+            Sorted list of frame ids
+        """
+        widths, heights, _ = self.box_statistics(target_width, target_height)
+        rows = np.unique(self._box_frames[np.minimum(widths, heights) < size])
+        return self._frame_ids[rows].tolist()
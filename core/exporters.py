@@ -0,0 +1,247 @@
+"""
+exporters.py
+
+Description:
+    Export sinks writing the scaled annotations in other formats than
+    Kitti, in the same pass as the scaling. COCO JSON is written
+    incrementally, never holding the images or annotations lists in
+    memory; YOLO boxes are normalized for a whole frame at once.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+from core.custom_exceptions import UnvalidAnnotationsFile
+
+EXPORT_FORMATS = ('coco', 'yolo')
+
+
+# ----------------------------------------------------------------
+def check_classes(class_names, classes):
+    """
+    Check that every class of a frame is among the exported classes
+
+    Parameters:
+        class_names (list): class name of every annotation
+        classes (list or dict): exported class names
+    """
+    for line, class_name in enumerate(class_names, start = 1):
+        if class_name not in classes:
+            raise UnvalidAnnotationsFile(reason = 'unexported_class', line = line)
+
+
+class Exporter(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, classes = None, fixed_classes = False):
+        """
+        Exporter, base of the export sinks. Class ids follow the given
+        classes, unknown classes get the next id when first seen.
+
+        Parameters:
+            classes (list): class names, in the order of their ids
+            fixed_classes (bool): unknown classes are an error instead, i.e. when
+                                  several runs write ids to the same folder
+        """
+        self._classes = {}
+        for class_name in classes if classes else []:
+            self._classes.setdefault(class_name, len(self._classes))
+        self._fixed_classes = fixed_classes
+
+    # ----------------------------------------------------------------
+    @property
+    def classes(self):
+        return list(self._classes)
+
+    # ----------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ----------------------------------------------------------------
+    def check(self, class_names):
+        """
+        Check that a frame can be exported, before any of its files is written
+
+        Parameters:
+            class_names (list): class name of every annotation
+        """
+        if self._fixed_classes:
+            check_classes(class_names, self._classes)
+
+    # ----------------------------------------------------------------
+    def class_id(self, class_name):
+        if class_name not in self._classes:
+            if self._fixed_classes:
+                check_classes([class_name], self._classes)
+            self._classes[class_name] = len(self._classes)
+        return self._classes[class_name]
+
+    # ----------------------------------------------------------------
+    def add(self, filename, class_names, parameters, width, height):
+        """
+        Export the annotations of a frame
+
+        Parameters:
+            filename (str): unique id of the pair of image and annotations file
+            class_names (list): class name of every annotation
+            parameters (array): (N, 14) Kitti numeric parameters
+            width (int): width of the image
+            height (int): height of the image
+        """
+        raise NotImplementedError
+
+    # ----------------------------------------------------------------
+    def close(self):
+        pass
+
+
+class YoloExporter(Exporter):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path_to_labels, classes = None, fixed_classes = False):
+        """
+        YoloExporter, a labels file per image with a line per box:
+        class id, center x, center y, width and height normalized by the
+        size of the image. Class names are listed in classes.txt.
+
+        Parameters:
+            path_to_labels (str): path to the labels folder, created if missing
+            classes (list): class names, in the order of their ids
+            fixed_classes (bool): unknown classes are an error, see Exporter
+        """
+        super().__init__(classes, fixed_classes)
+        self._path_to_labels = path_to_labels
+        os.makedirs(self._path_to_labels, exist_ok = True)
+
+    # ----------------------------------------------------------------
+    def add(self, filename, class_names, parameters, width, height):
+        boxes = np.asarray(parameters, dtype = np.float64).reshape(-1, 14)[:, 3:7]
+        class_ids = [self.class_id(class_name) for class_name in class_names]
+        labels = np.empty((len(boxes), 5))
+        labels[:, 0] = class_ids
+        labels[:, 1] = (boxes[:, 0] + boxes[:, 2]) / (2*width)
+        labels[:, 2] = (boxes[:, 1] + boxes[:, 3]) / (2*height)
+        labels[:, 3] = (boxes[:, 2] - boxes[:, 0]) / width
+        labels[:, 4] = (boxes[:, 3] - boxes[:, 1]) / height
+        text = ('%d %.6f %.6f %.6f %.6f\n' * len(labels)) % tuple(labels.flatten().tolist())
+        with open(os.path.join(self._path_to_labels, filename+'.txt'), 'w') as file:
+            file.write(text)
+
+    # ----------------------------------------------------------------
+    def close(self):
+        with open(os.path.join(self._path_to_labels, 'classes.txt'), 'w') as file:
+            file.write(''.join(class_name+'\n' for class_name in self._classes))
+
+
+class CocoExporter(Exporter):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path, image_extension = '.jpg', classes = None):
+        """
+        CocoExporter, a COCO JSON file written while frames are added.
+        Images go straight to the file, annotations to a spool file
+        appended once closed, the file is complete only then.
+
+        Parameters:
+            path (str): path to the JSON file
+            image_extension (str): extension of the image files
+            classes (list): class names, in the order of their ids
+        """
+        super().__init__(classes)
+        self._path = path
+        self._image_extension = image_extension
+        self._images = 0
+        self._annotations = 0
+        self._file = open(self._path+'.part', 'w')
+        self._file.write('{"images": [')
+        self._spool = tempfile.TemporaryFile('w+', dir = os.path.dirname(os.path.abspath(self._path)))
+
+    # ----------------------------------------------------------------
+    @property
+    def path(self):
+        return self._path
+
+    # ----------------------------------------------------------------
+    def add(self, filename, class_names, parameters, width, height):
+        self._images += 1
+        image_id = self._images
+        image = {'id': image_id, 'file_name': filename+self._image_extension, 'width': width, 'height': height}
+        self._file.write((',' if image_id > 1 else '')+'\n'+json.dumps(image))
+
+        boxes = np.asarray(parameters, dtype = np.float64).reshape(-1, 14)[:, 3:7]
+        # x, y, width and height of every box
+        bboxes = np.round(np.hstack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]]), 2)
+        areas = np.round(bboxes[:, 2] * bboxes[:, 3], 2)
+        lines = []
+        for class_name, bbox, area in zip(class_names, bboxes.tolist(), areas.tolist()):
+            self._annotations += 1
+            lines.append((',' if self._annotations > 1 else '')+'\n'+json.dumps({
+                'id': self._annotations, 'image_id': image_id, 'category_id': self.class_id(class_name) + 1,
+                'bbox': bbox, 'area': area, 'iscrowd': 0}))
+        self._spool.write(''.join(lines))
+
+    # ----------------------------------------------------------------
+    def close(self):
+        """
+        Append the annotations and the categories, then move the file in place
+        """
+        if self._file is None:
+            return
+        self._file.write('\n], "annotations": [')
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, self._file)
+        self._spool.close()
+        categories = [{'id': class_id + 1, 'name': class_name} for class_name, class_id in self._classes.items()]
+        self._file.write('\n], "categories": '+json.dumps(categories)+'}\n')
+        self._file.close()
+        self._file = None
+        os.replace(self._path+'.part', self._path)
+
+
+# ----------------------------------------------------------------
+def open_exporters(formats, path_to_output_folder, suffix = '', classes = None, fixed_classes = False):
+    """
+    Open the exporters of the given formats in an output folder
+
+    Parameters:
+        formats (list): formats out of EXPORT_FORMATS
+        path_to_output_folder (str): path to the output folder
+        suffix (str): suffix of the COCO file name, i.e. to tell shards apart
+        classes (list): class names, in the order of their ids
+        fixed_classes (bool): YOLO labels only use the given classes, required when shards
+                              or resumed runs share the labels folder and classes.txt
+
+    Return:
+        List of Exporter
+    """
+    exporters = []
+    for export_format in formats:
+        if export_format == 'coco':
+            exporters.append(CocoExporter(os.path.join(path_to_output_folder, f'coco{suffix}.json'),
+                                          classes = classes))
+        elif export_format == 'yolo':
+            exporters.append(YoloExporter(os.path.join(path_to_output_folder, 'labels'), classes = classes,
+                                          fixed_classes = fixed_classes))
+        else:
+            raise ValueError(f'Unknown export format {export_format}, expected one of {EXPORT_FORMATS}')
+    return exporters
@@ -0,0 +1,117 @@
+"""
+failure_report.py
+
+Description:
+    This class records the pairs of image and annotations file
+    that could not be scaled, so that a batch run can skip them
+    and carry on instead of aborting
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import json
+import shutil
+from pathlib import Path
+from collections import Counter
+from core.custom_exceptions import UnvalidAnnotationsFile
+
+ON_ERROR_POLICIES = ('abort', 'skip', 'quarantine')
+
+
+class FailureReport(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path_to_report, path_to_quarantine = None):
+        """
+        FailureReport, a JSONL report with one entry per failed pair of
+        image and annotations file. When a quarantine folder is given the
+        failed inputs are copied aside (Kitti Format) for re-annotation.
+
+        Parameters:
+            path_to_report (str): path to the JSONL report
+            path_to_quarantine (str): path to the quarantine folder
+        """
+        self._path_to_report = path_to_report
+        self._path_to_quarantine = path_to_quarantine
+        self._file = None
+        self._counts = Counter()
+
+        if self._path_to_quarantine is not None:
+            Path(os.fspath(os.path.join(self._path_to_quarantine, 'images'))).mkdir(parents=True, exist_ok=True)
+            Path(os.fspath(os.path.join(self._path_to_quarantine, 'annotations'))).mkdir(parents=True, exist_ok=True)
+
+    # ----------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # ----------------------------------------------------------------
+    @property
+    def path_to_report(self):
+        return self._path_to_report
+
+    @property
+    def counts(self):
+        return dict(self._counts)
+
+    @property
+    def total(self):
+        return sum(self._counts.values())
+
+    # ----------------------------------------------------------------
+    def record(self, filename, path_to_image, path_to_annotations, error):
+        """
+        Record a failed pair of image and annotations file
+
+        Parameters:
+            filename (str): unique id of the pair
+            path_to_image (str): path to input image
+            path_to_annotations (str): path to input annotations
+            error (Exception): raised exception
+        """
+        if isinstance(error, UnvalidAnnotationsFile):
+            reason, line, path_to_file = error.reason, error.line, path_to_annotations
+        elif isinstance(error, OSError):
+            # Unreadable or truncated images
+            reason, line, path_to_file = type(error).__name__, None, path_to_image
+        else:
+            reason, line, path_to_file = type(error).__name__, None, None
+
+        entry = {
+            'filename': filename,
+            'reason': reason,
+            'message': str(error),
+            'file': path_to_file,
+            'line': line
+        }
+
+        if self._path_to_quarantine is not None:
+            for path, folder in ((path_to_image, 'images'), (path_to_annotations, 'annotations')):
+                if os.path.isfile(path):
+                    shutil.copy2(path, os.path.join(self._path_to_quarantine, folder))
+            entry['quarantine'] = self._path_to_quarantine
+
+        # The report is opened lazily so that clean runs do not leave an empty file
+        if self._file is None:
+            self._file = open(self._path_to_report, 'a')
+        self._file.write(json.dumps(entry)+'\n')
+        self._counts[reason] += 1
+
+    # ----------------------------------------------------------------
+    def close(self):
+        """
+        Flush and close the report
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,44 @@
+"""
+fingerprint.py
+
+Description:
+    Cheap fingerprint of the Kitti Format input folders, built from
+    the name, size and modification time of every file (content is
+    never read). Two runs over the same fingerprint see the same data.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import hashlib
+from core.path_consistensy import OUTPUT_FOLDER_PREFIX
+
+
+# ----------------------------------------------------------------
+def input_fingerprint(path_to_data):
+    """
+    Fingerprint the image and annotation folders of a dataset. Output folders
+    of previous runs and files next to the folders (i.e. the dataset index)
+    are left out, they do not change what a run produces.
+
+    Parameters:
+        path_to_data (str): path to where the data is stored
+
+    Return:
+        Hexadecimal digest
+    """
+    digest = hashlib.blake2b(digest_size = 16)
+    with os.scandir(path_to_data) as entries:
+        folders = sorted(entry.name for entry in entries
+                         if entry.is_dir() and not entry.name.startswith(OUTPUT_FOLDER_PREFIX))
+
+    for folder in folders:
+        with os.scandir(os.path.join(path_to_data, folder)) as entries:
+            files = sorted((entry.name, entry.stat()) for entry in entries if entry.is_file())
+        for name, stat in files:
+            digest.update(f'{folder}/{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
@@ -0,0 +1,221 @@
+"""
+frame_dedup.py
+
+Description:
+    Content-addressed deduplication of the input images. Static cameras
+    and duplicated exports produce byte-identical frames, which scale to
+    byte-identical images: every image is hashed (BLAKE2b, streamed)
+    before it is decoded, the first image of a digest is scaled and the
+    next ones get its scaled image through a reflink, a hardlink or a
+    copy. Annotations are still scaled per file.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import sys
+import time
+import errno
+import shutil
+import hashlib
+
+# auto tries reflink, then hardlink, then copy
+LINK_METHODS = ('auto', 'reflink', 'hardlink', 'copy')
+# Linux ioctl sharing the extents of a file (Btrfs, XFS, ...)
+FICLONE = 0x40049409
+HASH_CHUNK_SIZE = 1024**2
+
+
+# ----------------------------------------------------------------
+def content_digest(path, chunk_size = HASH_CHUNK_SIZE):
+    """
+    BLAKE2b digest of a file, read in chunks so that it is never held in memory
+
+    Parameters:
+        path (str): path to the file
+        chunk_size (int): bytes read at once
+
+    Return:
+        Tuple of (hexadecimal digest, size in bytes)
+    """
+    digest = hashlib.blake2b()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(path, 'rb', buffering = 0) as file:
+        while True:
+            read = file.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            size += read
+    return digest.hexdigest(), size
+
+# ----------------------------------------------------------------
+def reflink(source, destination):
+    """
+    Copy-on-write clone of a file, raises OSError where the filesystem or
+    the platform can not share extents
+
+    Parameters:
+        source (str): path to the file
+        destination (str): path to the clone, must not exist
+    """
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are only supported on Linux')
+    import fcntl
+    with open(source, 'rb') as src, open(destination, 'xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination)
+            raise
+
+# ----------------------------------------------------------------
+def link_or_copy(source, destination, method = 'auto'):
+    """
+    Give a file a second name, falling back to a plain copy. The file is
+    linked aside and renamed over the destination, so an existing file
+    sharing its inode with other names is replaced rather than overwritten.
+
+    Parameters:
+        source (str): path to the file
+        destination (str): path to the new file
+        method (str): one of LINK_METHODS
+
+    Return:
+        Method actually used, 'reflink', 'hardlink' or 'copy'
+    """
+    if method not in LINK_METHODS:
+        raise ValueError(f'Unknown link method {method}, expected one of {LINK_METHODS}')
+    methods = ('reflink', 'hardlink', 'copy') if method == 'auto' else (method, 'copy')
+    path_to_tmp = destination+'.tmp'
+    for candidate in methods:
+        if os.path.lexists(path_to_tmp):
+            os.remove(path_to_tmp)
+        try:
+            if candidate == 'reflink':
+                reflink(source, path_to_tmp)
+            elif candidate == 'hardlink':
+                os.link(source, path_to_tmp)
+            else:
+                shutil.copyfile(source, path_to_tmp)
+        except OSError:
+            if candidate == 'copy':
+                raise
+            continue
+        os.replace(path_to_tmp, destination)
+        return candidate
+
+
+class FrameDeduplicator(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, method = 'auto', sink = None):
+        """
+        FrameDeduplicator, the scaled images of a run by digest of their
+        input image. All images of a run must be scaled the same way.
+
+        Parameters:
+            method (str): one of LINK_METHODS
+            sink (OutputSink): sink the scaled images are written to,
+                               the links are then stored along with them
+        """
+        if method not in LINK_METHODS:
+            raise ValueError(f'Unknown link method {method}, expected one of {LINK_METHODS}')
+        self._method = method
+        self._sink = sink
+        # {digest: (path to the scaled image, seconds to scale and write the pair)}
+        self._scaled = {}
+        self._duplicates = 0
+        self._bytes_hashed = 0
+        self._hash_seconds = 0.0
+        self._saved_seconds = 0.0
+        self._links = {'reflink': 0, 'hardlink': 0, 'copy': 0}
+
+    # ----------------------------------------------------------------
+    @property
+    def report(self):
+        """Duplicates found and time saved, scaling time avoided net of the links"""
+        return {'unique': len(self._scaled),
+                'duplicates': self._duplicates,
+                'links': dict(self._links),
+                'bytes_hashed': self._bytes_hashed,
+                'hash_seconds': round(self._hash_seconds, 3),
+                'saved_seconds': round(self._saved_seconds, 3)}
+
+    # ----------------------------------------------------------------
+    def digest(self, path_to_image):
+        """
+        Digest of an input image
+
+        Parameters:
+            path_to_image (str): path to the image
+
+        Return:
+            Hexadecimal digest
+        """
+        start = time.perf_counter()
+        digest, size = content_digest(path_to_image)
+        self._hash_seconds += time.perf_counter() - start
+        self._bytes_hashed += size
+        return digest
+
+    # ----------------------------------------------------------------
+    def reuse(self, digest, path_to_scaled_image):
+        """
+        Provide the scaled image of an already scaled duplicate
+
+        Parameters:
+            digest (str): digest of the input image
+            path_to_scaled_image (str): path to the scaled image to provide
+
+        Return:
+            True if the image was a duplicate and got its scaled image,
+            False if it has to be scaled (then register() it)
+        """
+        scaled = self._scaled.get(digest)
+        if scaled is None:
+            return False
+        if os.path.abspath(scaled[0]) == os.path.abspath(path_to_scaled_image):
+            return False
+
+        if self._sink is None:
+            method = link_or_copy(scaled[0], path_to_scaled_image, self._method)
+        else:
+            method = self._sink.link(scaled[0], path_to_scaled_image, self._method)
+        self._links[method] += 1
+        self._duplicates += 1
+        return True
+
+    # ----------------------------------------------------------------
+    def account(self, digest, seconds):
+        """
+        Record the time a duplicate took, the time saved is the difference
+        with the pair first scaled
+
+        Parameters:
+            digest (str): digest of the input image
+            seconds (float): time spent on the duplicate pair, link included
+        """
+        self._saved_seconds += self._scaled[digest][1] - seconds
+
+    # ----------------------------------------------------------------
+    def register(self, digest, path_to_scaled_image, seconds):
+        """
+        Record the scaled image of a digest
+
+        Parameters:
+            digest (str): digest of the input image
+            path_to_scaled_image (str): path to the scaled image
+            seconds (float): time spent scaling and writing the pair
+        """
+        self._scaled.setdefault(digest, (path_to_scaled_image, seconds))
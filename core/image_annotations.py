@@ -13,8 +13,13 @@ Copyright:
     Copyright © 2023, Trifork, All Rights Reserved
 """
 
+import io
+import os
 from PIL import Image
 from core.annotations import Annotations
+from core.serializer import AnnotationSerializer
+from core.resize import resize_image
+from core.output_sink import AtomicFileSink
 
 
 class ImageAnnotations(object):
@@ -24,14 +29,15 @@ class ImageAnnotations(object):
 
     # ----------------------------------------------------------------
     def __init__(self, path_to_input_image, path_to_input_annotations, 
-                 path_to_scaled_image, path_to_scaled_annotations):
+                 path_to_scaled_image = None, path_to_scaled_annotations = None):
         """
         ImageAnnotations, an abstract representation of a pair of image
         and annotations file. Provides methods to scale and save results.
 
         Parameters:
-            path_to_input_image (str): path to input image
-            path_to_input_annotations (str): path to input annotations
+            path_to_input_image (str, file object or PIL.Image): path to input image,
+                                                                 or the decoded image
+            path_to_input_annotations (str or Annotations): path to input annotations
             path_to_scaled_image (str): path to scaled image
             path_to_scaled_annotations (str): path to scaled annotations
         """
@@ -39,36 +45,177 @@ class ImageAnnotations(object):
         self._path_to_input_annotations = path_to_input_annotations
         self._path_to_scaled_image = path_to_scaled_image
         self._path_to_scaled_annotations = path_to_scaled_annotations
-        self._image = Image.open(self._path_to_input_image)
-        self._annotations = Annotations(self._path_to_input_annotations)
+        if isinstance(path_to_input_image, Image.Image):
+            self._image = path_to_input_image
+        else:
+            self._image = Image.open(self._path_to_input_image)
+        if isinstance(path_to_input_annotations, Annotations):
+            self._annotations = path_to_input_annotations
+        else:
+            self._annotations = Annotations(self._path_to_input_annotations)
         self._scaled_image = None
+        self._scaled_size = None
+        # (class names, numeric parameters) and their annotations file content
+        self._scaled_frame = None
+        self._scaled_text = None
         self._scaled_annotations = None
+        self._serializer = AnnotationSerializer()
+        self._profile = None
+
+    # ----------------------------------------------------------------
+    @classmethod
+    def from_bytes(cls, image_bytes, annotations_text,
+                   path_to_scaled_image = None, path_to_scaled_annotations = None):
+        """
+        Create an ImageAnnotations from an encoded image and the annotations
+        file content, without reading from the filesystem
+
+        Parameters:
+            image_bytes (bytes): encoded image
+            annotations_text (str): annotations file content
+            path_to_scaled_image (str): path to scaled image, only needed to write()
+            path_to_scaled_annotations (str): path to scaled annotations, only needed to write()
+
+        Return:
+            ImageAnnotations
+        """
+        return cls(io.BytesIO(image_bytes), Annotations(text = annotations_text),
+                   path_to_scaled_image, path_to_scaled_annotations)
+
+    # ----------------------------------------------------------------
+    @property
+    def scaled_image(self):
+        return self._scaled_image
+
+    @property
+    def scaled_annotations(self):
+        return self._scaled_annotations
+
+    @property
+    def scaled_frame(self):
+        return self._scaled_frame
+
+    @property
+    def scaled_size(self):
+        return self._scaled_size
     
     # ----------------------------------------------------------------  
-    def scale(self, target_width, target_height):
+    def scale(self, target_width, target_height, resize_backend = 'pil', profile = None):
         """
         Scale both image and annotations
 
+        Parameters:
+            target_width (int): Target width to scale the image
+            target_height (int): Target height to scale the image
+            resize_backend (str): one of resize.RESIZE_BACKENDS
+            profile (ScaleProfile): resampling and encoding settings, also used
+                                    by write() and encode(), Pillow defaults if None
+        """
+        self._profile = profile
+        resize_kwargs = profile.resize_kwargs() if profile is not None else {}
+        # Before a JPEG draft decode shrinks the image
+        self.scale_annotations(target_width, target_height)
+        self._scaled_image = resize_image(self._image, (target_width, target_height), resize_backend,
+                                          **resize_kwargs)
+
+    # ----------------------------------------------------------------
+    def scale_annotations(self, target_width, target_height):
+        """
+        Scale the annotations only, the image header gives its size and
+        the image is never decoded. The scaled image is then left to the
+        caller, see write(write_image = False).
+
         Parameters:
             target_width (int): Target width to scale the image
             target_height (int): Target height to scale the image
         """
-        self._scaled_image = self._image.resize((target_width, target_height))
         image_width, image_height = self._image.size
-        self._scaled_annotations = self._annotations.scale(image_width, 
-                                                           image_height, 
-                                                           target_width, 
-                                                           target_height
-                                                           )
+        self._scaled_size = (target_width, target_height)
+        self._scaled_frame = (self._annotations.class_names,
+                              self._annotations.scale_parameters(image_width, 
+                                                                 image_height, 
+                                                                 target_width, 
+                                                                 target_height
+                                                                 ))
+        self.format_scaled_annotations()
 
     # ----------------------------------------------------------------
-    def write(self):
+    def transform(self, transforms):
+        """
+        Apply a chain of transforms to both image and annotations, the
+        image is resampled once whatever the number of transforms
+
+        Parameters:
+            transforms (Compose): chain of transforms
+        """
+        matrix, size = transforms.fold(*self._image.size)
+        self._scaled_image = transforms.apply_image(self._image, matrix, size)
+        self._scaled_size = size
+        self._scaled_frame = self._annotations.transform_parameters(matrix, size, transforms.min_size)
+        self.format_scaled_annotations()
+
+    # ----------------------------------------------------------------
+    def format_scaled_annotations(self):
+        """
+        Format the scaled annotations in one batch, kept for write()
+        """
+        self._scaled_text = self._serializer.format(*self._scaled_frame)
+        self._scaled_annotations = self._scaled_text.splitlines()
+
+    # ----------------------------------------------------------------
+    def check_exports(self, exporters):
+        """
+        Check that the scaled annotations can be exported, before anything
+        is written, i.e. their classes with fixed class ids
+
+        Parameters:
+            exporters (list): Exporter objects
+        """
+        for exporter in exporters:
+            exporter.check(self._scaled_frame[0])
+
+    # ----------------------------------------------------------------
+    def write(self, exporters = (), write_image = True, sink = None):
         """
         Save scaled image and annotations
+
+        Parameters:
+            exporters (list): Exporter objects also writing the annotations
+                              in other formats, i.e. COCO or YOLO
+            write_image (bool): save the scaled image, False when the caller
+                                provides it, i.e. a duplicate of another image
+            sink (OutputSink): stores the files, i.e. in batches or to an object
+                               store, each file is renamed in place once complete if None
+        """
+        self.check_exports(exporters)
+        if sink is None:
+            sink = AtomicFileSink('none')
+        if write_image:
+            with sink.open(self._path_to_scaled_image) as file:
+                self._scaled_image.save(file, format = 'JPEG', **self.save_kwargs('JPEG'))
+        sink.write(self._path_to_scaled_annotations, self._scaled_text)
+
+        if exporters:
+            filename = os.path.splitext(os.path.basename(self._path_to_scaled_image))[0]
+            for exporter in exporters:
+                exporter.add(filename, *self._scaled_frame, *self._scaled_size)
+
+    # ----------------------------------------------------------------
+    def encode(self, format = 'JPEG'):
         """
-        self._scaled_image.save(self._path_to_scaled_image)
+        Encode the scaled image in memory
 
-        with open(self._path_to_scaled_annotations, 'w') as file:
-            for object_label in self._scaled_annotations:
-                file.write(object_label+'\n')
-        
\ No newline at end of file
+        Parameters:
+            format (str): image format
+
+        Return:
+            Encoded image bytes
+        """
+        buffer = io.BytesIO()
+        self._scaled_image.save(buffer, format = format, **self.save_kwargs(format))
+        return buffer.getvalue()
+
+    # ----------------------------------------------------------------
+    def save_kwargs(self, format):
+        """Encoder settings of the profile for the given format"""
+        return self._profile.save_kwargs(format) if self._profile is not None else {}
@@ -0,0 +1,151 @@
+"""
+image_cache.py
+
+Description:
+    Bounded LRU cache of decoded source images and parsed annotations,
+    shared by the requests of a long-running server. Entries are keyed
+    by path, modification time and size, so a changed file is decoded
+    again, and the cache is bounded by the memory of the decoded
+    pixels rather than by a number of entries.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+from core.annotations import Annotations
+
+
+class DecodedImageCache(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, max_bytes):
+        """
+        DecodedImageCache, safe to share between threads.
+
+        Parameters:
+            max_bytes (int): memory of the cached entries, 0 disables the cache
+        """
+        self._max_bytes = max_bytes
+        # {key: (value, bytes)}, least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    # ----------------------------------------------------------------
+    @property
+    def metrics(self):
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'evictions': self._evictions,
+                    'entries': len(self._entries),
+                    'bytes': self._bytes,
+                    'max_bytes': self._max_bytes}
+
+    # ----------------------------------------------------------------
+    @staticmethod
+    def key(kind, path):
+        """
+        Key of a file, a new one once the file changed
+
+        Parameters:
+            kind (str): kind of entry, 'image' or 'annotations'
+            path (str): path to the file
+
+        Return:
+            Tuple of (kind, real path, mtime in ns, size)
+        """
+        stat = os.stat(path)
+        return kind, os.path.realpath(path), stat.st_mtime_ns, stat.st_size
+
+    # ----------------------------------------------------------------
+    def get_or_load(self, key, load):
+        """
+        Get an entry, loading and caching it on a miss. Concurrent misses
+        of the same key may load it twice, the last one is kept.
+
+        Parameters:
+            key (tuple): key of the entry
+            load (callable): returns a tuple of (value, bytes)
+
+        Return:
+            Cached or loaded value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            self._misses += 1
+
+        # Decoded outside of the lock, other requests go on meanwhile
+        value, size = load()
+        if size > self._max_bytes:
+            return value
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (_, evicted) = self._entries.popitem(last = False)
+                self._bytes -= evicted
+                self._evictions += 1
+        return value
+
+    # ----------------------------------------------------------------
+    def image(self, path):
+        """
+        Decoded image of a file, read-only: callers must not modify it
+
+        Parameters:
+            path (str): path to the image
+
+        Return:
+            PIL.Image
+        """
+        def load():
+            image = Image.open(path)
+            # Decoded now, the file is closed once loaded
+            image.load()
+            return image, image.width * image.height * len(image.getbands())
+        return self.get_or_load(self.key('image', path), load)
+
+    # ----------------------------------------------------------------
+    def annotations(self, path):
+        """
+        Parsed annotations of a file, read-only: callers must not modify them
+
+        Parameters:
+            path (str): path to the annotations file
+
+        Return:
+            Annotations
+        """
+        def load():
+            annotations = Annotations(path)
+            size = annotations.parameters.nbytes + sum(len(name) for name in annotations.class_names)
+            return annotations, size
+        return self.get_or_load(self.key('annotations', path), load)
+
+    # ----------------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
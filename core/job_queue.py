@@ -0,0 +1,301 @@
+"""
+job_queue.py
+
+Description:
+    Durable queue of scaling jobs kept in a SQLite database on a volume
+    shared by several Rest API instances and worker processes, without
+    any network service. Workers claim jobs under a lease renewed by
+    heartbeats along with the progress of the job. A job whose worker
+    stopped renewing its lease (crashed, killed, node lost) is queued
+    again and resumed by the next worker from its last complete chunk.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id               TEXT PRIMARY KEY,
+    user_id          TEXT NOT NULL,
+    params           TEXT NOT NULL,
+    output_folder    TEXT NOT NULL,
+    priority         INTEGER NOT NULL,
+    status           TEXT NOT NULL,
+    created          REAL NOT NULL,
+    updated          REAL NOT NULL,
+    worker           TEXT,
+    lease_expires    REAL,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    total            INTEGER,
+    done             INTEGER NOT NULL DEFAULT 0,
+    failed           INTEGER NOT NULL DEFAULT 0,
+    chunks           INTEGER NOT NULL DEFAULT 0,
+    message          TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, priority DESC, created);
+'''
+
+
+class JobQueue(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path, lease_time = 30, max_attempts = 3, busy_timeout = 30):
+        """
+        JobQueue, a durable queue of scaling jobs shared between processes.
+        Every call opens its own connection, so a queue can be used from
+        several threads and processes at the same time.
+
+        Parameters:
+            path (str): path to the SQLite database, created if missing
+            lease_time (float): seconds a claimed job stays with its worker without a heartbeat
+            max_attempts (int): claims of a job before it is failed, i.e. a job crashing its workers
+            busy_timeout (float): seconds to wait for the lock held by another process
+        """
+        self._path = path
+        self._lease_time = lease_time
+        self._max_attempts = max_attempts
+        self._busy_timeout = busy_timeout
+        db = sqlite3.connect(self._path, timeout = self._busy_timeout)
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    # ----------------------------------------------------------------
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def lease_time(self):
+        return self._lease_time
+
+    # ----------------------------------------------------------------
+    @contextmanager
+    def transaction(self):
+        """
+        Open a connection and an immediate transaction, it holds the write
+        lock so that two workers can not claim the same job. The default
+        rollback journal is kept, WAL needs shared memory which network
+        volumes do not provide.
+
+        Return:
+            sqlite3.Connection
+        """
+        db = sqlite3.connect(self._path, timeout = self._busy_timeout, isolation_level = None)
+        db.row_factory = sqlite3.Row
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        finally:
+            db.close()
+
+    # ----------------------------------------------------------------
+    @staticmethod
+    def to_dict(row):
+        """
+        Job description of a database row
+
+        Parameters:
+            row (sqlite3.Row): row of the jobs table
+
+        Return:
+            Dictionary, None if there is no row
+        """
+        if row is None:
+            return None
+        job = dict(row)
+        job['job_id'] = job.pop('id')
+        job['params'] = json.loads(job['params'])
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    # ----------------------------------------------------------------
+    def submit(self, user_id, params, priority = 0):
+        """
+        Queue a new job
+
+        Parameters:
+            user_id (str): user submitting the job
+            params (dict): parameters of the run, input_path, output_path,
+                           target_width and target_height
+            priority (int): jobs with a higher priority are claimed first
+
+        Return:
+            Job description
+        """
+        job_id = uuid.uuid1().hex
+        now = time.time()
+        with self.transaction() as db:
+            db.execute('INSERT INTO jobs (id, user_id, params, output_folder, priority, status, created, updated) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (job_id, user_id, json.dumps(params), 'output-'+job_id, priority, 'queued', now, now))
+            return self.to_dict(db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    # ----------------------------------------------------------------
+    def get(self, job_id):
+        """
+        Get a job
+
+        Parameters:
+            job_id (str): id of the job
+
+        Return:
+            Job description, None if unknown
+        """
+        with self.transaction() as db:
+            return self.to_dict(db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    # ----------------------------------------------------------------
+    def requeue_expired(self, db, now):
+        """
+        Queue again the running jobs whose lease expired. A job cancelled
+        meanwhile is cancelled, one claimed max_attempts times is failed.
+
+        Parameters:
+            db (sqlite3.Connection): connection within a transaction
+            now (float): current time
+
+        Return:
+            Number of jobs whose lease expired
+        """
+        cursor = db.execute(
+            "UPDATE jobs SET "
+            "status = CASE WHEN cancel_requested THEN 'cancelled' "
+            "              WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "message = CASE WHEN cancel_requested THEN 'Job cancelled' "
+            "               WHEN attempts >= ? THEN 'Lease expired too many times' ELSE message END, "
+            "worker = NULL, lease_expires = NULL, updated = ? "
+            "WHERE status = 'running' AND lease_expires < ?",
+            (self._max_attempts, self._max_attempts, now, now))
+        return cursor.rowcount
+
+    # ----------------------------------------------------------------
+    def claim(self, worker_id):
+        """
+        Claim the next job, the one with the highest priority queued first
+
+        Parameters:
+            worker_id (str): id of the claiming worker
+
+        Return:
+            Job description, None if there is nothing to do
+        """
+        now = time.time()
+        with self.transaction() as db:
+            self.requeue_expired(db, now)
+            row = db.execute("SELECT id FROM jobs WHERE status = 'queued' "
+                             "ORDER BY priority DESC, created LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, "
+                       "attempts = attempts + 1, updated = ? WHERE id = ?",
+                       (worker_id, now + self._lease_time, now, row['id']))
+            return self.to_dict(db.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+
+    # ----------------------------------------------------------------
+    def heartbeat(self, job_id, worker_id, **progress):
+        """
+        Renew the lease of a claimed job and record its progress
+
+        Parameters:
+            job_id (str): id of the job
+            worker_id (str): id of the worker holding the job
+            progress (dict): total, done, failed and chunks of the job
+
+        Return:
+            True to go on, False if the lease was lost or the job cancelled
+        """
+        fields = {key: progress[key] for key in ('total', 'done', 'failed', 'chunks') if key in progress}
+        assignments = ''.join(f', {key} = ?' for key in fields)
+        now = time.time()
+        with self.transaction() as db:
+            cursor = db.execute(f"UPDATE jobs SET lease_expires = ?, updated = ?{assignments} "
+                                f"WHERE id = ? AND worker = ? AND status = 'running'",
+                                (now + self._lease_time, now, *fields.values(), job_id, worker_id))
+            if cursor.rowcount == 0:
+                return False
+            row = db.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            return not row['cancel_requested']
+
+    # ----------------------------------------------------------------
+    def finish(self, job_id, worker_id, success, message = None):
+        """
+        Record the end of a claimed job
+
+        Parameters:
+            job_id (str): id of the job
+            worker_id (str): id of the worker holding the job
+            success (bool): whether the run succeeded
+            message (str): error message
+
+        Return:
+            False if the worker no longer held the job
+        """
+        with self.transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN cancel_requested THEN 'cancelled' ELSE ? END, "
+                "message = CASE WHEN cancel_requested THEN 'Job cancelled' ELSE ? END, "
+                "worker = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                ('done' if success else 'failed', message, time.time(), job_id, worker_id))
+            return cursor.rowcount == 1
+
+    # ----------------------------------------------------------------
+    def release(self, job_id, worker_id):
+        """
+        Give a claimed job back to the queue without counting the attempt,
+        i.e. when its worker is shut down
+
+        Parameters:
+            job_id (str): id of the job
+            worker_id (str): id of the worker holding the job
+
+        Return:
+            False if the worker no longer held the job
+        """
+        with self.transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END, "
+                "attempts = attempts - 1, worker = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker_id))
+            return cursor.rowcount == 1
+
+    # ----------------------------------------------------------------
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job is cancelled right away, a running one
+        is stopped by its worker at its next heartbeat.
+
+        Parameters:
+            job_id (str): id of the job
+
+        Return:
+            Job description, None if unknown
+        """
+        with self.transaction() as db:
+            db.execute("UPDATE jobs SET status = 'cancelled', message = 'Job cancelled', updated = ? "
+                       "WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+            return self.to_dict(db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
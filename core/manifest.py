@@ -0,0 +1,204 @@
+"""
+manifest.py
+
+Description:
+    This class keeps track of what a run was asked to produce and
+    what it actually produced, and stores it as a JSON manifest in
+    the output folder. Commit points in the middle of a run append
+    what changed to a JSONL journal next to the manifest, which is
+    rewritten once the journal grows as large as it
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import json
+from pathlib import Path
+from datetime import datetime
+
+# Lists of the manifest the journal appends to
+JOURNALED = ('assigned', 'produced', 'failed', 'commits')
+# Entries appended to the journal before the manifest is rewritten, at least
+JOURNAL_MIN_ENTRIES = 4096
+
+
+# ----------------------------------------------------------------
+def journal_path(path):
+    """Path to the journal of a manifest, i.e. shard-00000-of-00001.journal.jsonl"""
+    return os.path.splitext(path)[0]+'.journal.jsonl'
+
+
+class RunManifest(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path, **metadata):
+        """
+        RunManifest, the record of a (possibly sharded) run.
+
+        Parameters:
+            path (str): path to the JSON manifest
+            metadata (dict): run parameters stored along with the results
+        """
+        self._path = path
+        self._data = {
+            'metadata': metadata,
+            'started': datetime.utcnow().isoformat()+'Z',
+            'finished': None,
+            'complete': False,
+            'assigned': [],
+            'produced': [],
+            'failed': [],
+            'commits': [],
+            'reports': {},
+            # Sequence number of the last journal entry the manifest includes
+            'journal': 0
+        }
+        # Length of every journaled list at the last write() or update()
+        self._marks = {key: 0 for key in JOURNALED}
+        # Entries in the journal, and in the manifest when it was last written
+        self._journaled = 0
+        self._written = 0
+
+    # ----------------------------------------------------------------
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def data(self):
+        return self._data
+
+    # ----------------------------------------------------------------
+    @staticmethod
+    def read(path):
+        """
+        Read a manifest along with the entries of its journal
+
+        Parameters:
+            path (str): path to the JSON manifest
+
+        Return:
+            Dictionary with the manifest content
+        """
+        with open(path, 'r') as file:
+            data = json.load(file)
+        if not os.path.exists(journal_path(path)):
+            return data
+        with open(journal_path(path), 'r') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Cut short by a crash, nothing follows
+                    break
+                # Already in the manifest if it was rewritten before the journal was removed
+                if entry['sequence'] <= data.get('journal', 0):
+                    continue
+                for key in JOURNALED:
+                    data.setdefault(key, []).extend(entry[key])
+        return data
+
+    # ----------------------------------------------------------------
+    def assign(self, filenames):
+        """
+        Store the unique ids of the pairs this run has to produce. Can be
+        called several times, i.e. while watching the input folders.
+
+        Parameters:
+            filenames (list): unique ids of the pairs
+        """
+        self._data['assigned'].extend(filenames)
+
+    # ----------------------------------------------------------------
+    def add(self, filename):
+        """
+        Record a successfully produced pair
+
+        Parameters:
+            filename (str): unique id of the pair
+        """
+        self._data['produced'].append(filename)
+
+    # ----------------------------------------------------------------
+    def add_failure(self, filename):
+        """
+        Record a pair that could not be produced
+
+        Parameters:
+            filename (str): unique id of the pair
+        """
+        self._data['failed'].append(filename)
+
+    # ----------------------------------------------------------------
+    def add_commit(self):
+        """
+        Record a commit point, the files of the pairs produced so far are
+        in place and as durable as the output sink makes them
+        """
+        self._data['commits'].append({'time': datetime.utcnow().isoformat()+'Z',
+                                      'produced': len(self._data['produced']),
+                                      'failed': len(self._data['failed'])})
+
+    # ----------------------------------------------------------------
+    def add_report(self, name, report):
+        """
+        Store the report of a stage of the run, i.e. the deduplication
+
+        Parameters:
+            name (str): name of the stage
+            report (dict): JSON serializable report
+        """
+        self._data['reports'][name] = report
+
+    # ----------------------------------------------------------------
+    def update(self):
+        """
+        Record what changed since the last write() or update(), i.e. at a
+        commit point in the middle of the run. The changes are appended to
+        the journal, the whole manifest is only rewritten once the journal
+        holds as many entries as it, so a long run (i.e. watching) writes
+        every entry a bounded number of times.
+        """
+        changes = {key: self._data[key][self._marks[key]:] for key in JOURNALED}
+        entries = sum(len(values) for values in changes.values())
+        if self._journaled + entries >= max(JOURNAL_MIN_ENTRIES, self._written):
+            self.write()
+            return
+
+        self._data['journal'] += 1
+        with open(journal_path(self._path), 'a') as file:
+            file.write(json.dumps({'sequence': self._data['journal'], **changes})+'\n')
+        self._journaled += entries
+        self._marks = {key: len(self._data[key]) for key in JOURNALED}
+
+    # ----------------------------------------------------------------
+    def write(self, complete = False):
+        """
+        Write the whole manifest and remove its journal. It is written aside
+        and renamed so that it is never left half written.
+
+        Parameters:
+            complete (bool): whether the run finished
+        """
+        self._data['complete'] = complete
+        if complete:
+            self._data['finished'] = datetime.utcnow().isoformat()+'Z'
+
+        Path(os.fspath(os.path.dirname(self._path))).mkdir(parents=True, exist_ok=True)
+        path_to_tmp = self._path+'.tmp'
+        with open(path_to_tmp, 'w') as file:
+            json.dump(self._data, file)
+        os.replace(path_to_tmp, self._path)
+        if os.path.exists(journal_path(self._path)):
+            os.remove(journal_path(self._path))
+
+        self._journaled = 0
+        self._written = sum(len(self._data[key]) for key in JOURNALED)
+        self._marks = {key: len(self._data[key]) for key in JOURNALED}
@@ -0,0 +1,585 @@
+"""
+output_sink.py
+
+Description:
+    Output sinks of the scaled files: the filesystem, a tar archive or
+    an S3-compatible object store (see s3_sink.py). Files are given by
+    their local path under the output path, other sinks store them under
+    that relative name.
+
+    Filesystem writes are atomic. Files are written to a hidden temporary
+    name next to their final name and renamed once complete, so a crash
+    never leaves a truncated file under its final name. The durability
+    level sets when the data reaches the disk: never (none), once per
+    batch with a single fsync per directory (batch), or before every
+    rename (every-file).
+
+    A buffered sink holds the files written whole (i.e. the annotations
+    files, and every file of an archive) in memory and stores them in one
+    batch once the buffer is full or at the next commit, so that archives
+    and shard outputs are not written a small file at a time.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import io
+import os
+import re
+import time
+import tarfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from core.frame_dedup import link_or_copy
+
+# none: atomic renames only, batch: fsync on commit(), every-file: fsync before every rename
+DURABILITY_LEVELS = ('none', 'batch', 'every-file')
+# Files waiting for commit() before one is forced
+BATCH_SIZE = 1024
+# Bytes held by a buffered sink before they are stored, see OutputSink
+WRITE_BUFFER_SIZE = 1024 * 1024
+# fs, tar:<path to the archive> or s3://<bucket>/<prefix>
+OUTPUT_SINKS = ('fs', 'tar:', 's3://')
+# Temporary name of a file written by AtomicFileSink: .<name>.<pid>.tmp
+TEMPORARY_NAME = re.compile(r'^\.(.+)\.(\d+)\.tmp$')
+
+
+# ----------------------------------------------------------------
+def fsync_path(path):
+    """
+    Flush a file or a directory to disk, directories can not be opened
+    on every platform and are then skipped
+
+    Parameters:
+        path (str): path to the file or directory
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (IsADirectoryError, PermissionError):
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# ----------------------------------------------------------------
+def sweep_temporaries(path_to_folder, owns = None):
+    """
+    Remove the temporary files left in a folder by runs that crashed or
+    were killed before their commit
+
+    Parameters:
+        path_to_folder (str): path to the folder, skipped if missing
+        owns (callable): tells whether a pair, given its unique id, belongs to
+                         this run (i.e. its shard), only its temporaries are
+                         removed. Runs sharing the folder keep theirs. All if None
+
+    Return:
+        Number of files removed
+    """
+    if not os.path.isdir(path_to_folder):
+        return 0
+    removed = 0
+    for entry in os.scandir(path_to_folder):
+        match = TEMPORARY_NAME.match(entry.name)
+        if match is None or entry.is_dir(follow_symlinks = False):
+            continue
+        if owns is not None and not owns(os.path.splitext(match.group(1))[0]):
+            continue
+        try:
+            os.remove(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+# ----------------------------------------------------------------
+def open_sink(spec, root, durability = 'batch', buffer_size = 0):
+    """
+    Open the output sink of a specification
+
+    Parameters:
+        spec (str): 'fs', 'tar:<path to the archive>' or 's3://<bucket>/<prefix>'
+        root (str): output path, files are stored under their name relative to it
+        durability (str): one of DURABILITY_LEVELS, object stores are always durable
+        buffer_size (int): bytes of files held before they are stored in one batch,
+                           0 to store every file as it comes. Object stores take a
+                           request per file and are never buffered
+
+    Return:
+        OutputSink
+    """
+    if spec in (None, '', 'fs'):
+        return AtomicFileSink(durability, buffer_size = buffer_size)
+    if spec.startswith('tar:'):
+        return ArchiveSink(spec[len('tar:'):], root, durability, buffer_size = buffer_size)
+    if spec.startswith('s3://'):
+        from core.s3_sink import S3Sink
+        return S3Sink(spec, root)
+    raise ValueError(f'Unknown output sink {spec}, expected one of {OUTPUT_SINKS}')
+
+
+class OutputSink(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, root = None, buffer_size = 0):
+        """
+        OutputSink, base of the output sinks. Files written since the last
+        commit() may not be stored yet, they all are once it returns.
+
+        Parameters:
+            root (str): output path, files are stored under their name relative to it
+            buffer_size (int): bytes of files given to write() held in memory before
+                               they are stored in one batch (see put_many()), 0 to
+                               store every file as it comes
+        """
+        self._root = root
+        self._buffer_size = buffer_size
+        # {path: bytes} of the files held by the buffer
+        self._buffer = {}
+        self._buffered = 0
+
+    # ----------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+        self.close()
+
+    # ----------------------------------------------------------------
+    def name(self, path):
+        """Name of a file relative to the output path, with '/' separators"""
+        return Path(os.path.relpath(path, self._root)).as_posix()
+
+    # ----------------------------------------------------------------
+    def makedirs(self, path, exist_ok = True):
+        """
+        Create a folder, only the filesystem has folders
+
+        Parameters:
+            path (str): path to the folder
+            exist_ok (bool): whether the folder may already exist
+        """
+        pass
+
+    # ----------------------------------------------------------------
+    @contextmanager
+    def open(self, path, mode = 'wb'):
+        """
+        Open a file to write, it is stored from memory once closed.
+        Nothing is stored if the writing fails.
+
+        Parameters:
+            path (str): path to the file
+            mode (str): 'wb' or 'w'
+        """
+        buffer = io.BytesIO() if 'b' in mode else io.StringIO()
+        yield buffer
+        self.write(path, buffer.getvalue())
+
+    # ----------------------------------------------------------------
+    @property
+    def buffered(self):
+        return len(self._buffer)
+
+    # ----------------------------------------------------------------
+    def write(self, path, data):
+        """
+        Write a whole file, held by the buffer of a buffered sink
+
+        Parameters:
+            path (str): path to the file
+            data (bytes or str): content of the file
+        """
+        data = data if isinstance(data, (bytes, bytearray, memoryview)) else data.encode('utf-8')
+        if self._buffer_size <= 0:
+            self.put(path, data)
+            return
+        previous = self._buffer.pop(path, None)
+        self._buffered += len(data) - (len(previous) if previous is not None else 0)
+        self._buffer[path] = data
+        if self._buffered >= self._buffer_size:
+            self.flush_buffer()
+
+    # ----------------------------------------------------------------
+    def flush_buffer(self):
+        """
+        Store the files held by the buffer in one batch
+        """
+        if self._buffer:
+            files, self._buffer, self._buffered = self._buffer, {}, 0
+            self.put_many(files.items())
+
+    # ----------------------------------------------------------------
+    def drop_buffer(self):
+        """
+        Drop the files held by the buffer, i.e. after an error
+
+        Return:
+            Number of files dropped
+        """
+        dropped, self._buffer, self._buffered = len(self._buffer), {}, 0
+        return dropped
+
+    # ----------------------------------------------------------------
+    def put_many(self, files):
+        """
+        Store a batch of files held in memory
+
+        Parameters:
+            files (iterable): (path, bytes) of every file
+        """
+        for path, data in files:
+            self.put(path, data)
+
+    # ----------------------------------------------------------------
+    def put(self, path, data):
+        """
+        Store a file held in memory
+
+        Parameters:
+            path (str): path to the file
+            data (bytes): content of the file
+        """
+        raise NotImplementedError
+
+    # ----------------------------------------------------------------
+    def link(self, source, destination, method = 'auto'):
+        """
+        Store a file with the content of another one, i.e. a duplicate
+
+        Parameters:
+            source (str): path to a file written to this sink
+            destination (str): path to the new file
+            method (str): one of frame_dedup.LINK_METHODS, a hint other sinks may ignore
+
+        Return:
+            Method actually used, 'reflink', 'hardlink' or 'copy'
+        """
+        raise NotImplementedError
+
+    # ----------------------------------------------------------------
+    def commit(self):
+        """
+        Commit point: every file written so far is stored
+
+        Return:
+            Number of files committed since the previous commit
+        """
+        self.flush_buffer()
+        return 0
+
+    # ----------------------------------------------------------------
+    def discard(self):
+        """
+        Drop the files not stored yet, i.e. after an error, close() then
+        only releases the sink
+
+        Return:
+            Number of files dropped
+        """
+        return self.drop_buffer()
+
+    # ----------------------------------------------------------------
+    def close(self):
+        self.commit()
+
+
+class AtomicFileSink(OutputSink):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, durability = 'batch', batch_size = BATCH_SIZE, buffer_size = 0):
+        """
+        AtomicFileSink, writes files aside and renames them in place. With
+        the batch durability files keep their temporary name until
+        commit(), which flushes them, renames them and flushes each of
+        their directories once. Unbuffered, it can be shared by threads
+        writing different files.
+
+        Parameters:
+            durability (str): one of DURABILITY_LEVELS
+            batch_size (int): files waiting for commit() before one is forced
+            buffer_size (int): bytes of files given to write() held in memory, see OutputSink
+        """
+        super().__init__(buffer_size = buffer_size)
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f'Unknown durability {durability}, expected one of {DURABILITY_LEVELS}')
+        self._durability = durability
+        self._batch_size = batch_size
+        # {final path: temporary path} of the files waiting for commit()
+        self._pending = {}
+        self._lock = threading.RLock()
+        # Files renamed in place since the last commit
+        self._written = 0
+
+    # ----------------------------------------------------------------
+    @property
+    def durability(self):
+        return self._durability
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    # ----------------------------------------------------------------
+    @staticmethod
+    def temporary(path):
+        """Hidden temporary name of a file, next to it so that renaming it is atomic"""
+        directory, name = os.path.split(path)
+        return os.path.join(directory, f'.{name}.{os.getpid()}.tmp')
+
+    # ----------------------------------------------------------------
+    def resolve(self, path):
+        """
+        Path holding the content of a file, its temporary name until committed
+
+        Parameters:
+            path (str): final path of the file
+
+        Return:
+            Path to read the file from
+        """
+        return self._pending.get(path, path)
+
+    # ----------------------------------------------------------------
+    def makedirs(self, path, exist_ok = True):
+        Path(os.fspath(path)).mkdir(exist_ok = exist_ok)
+
+    # ----------------------------------------------------------------
+    @contextmanager
+    def open(self, path, mode = 'wb'):
+        """
+        Open a file to write, it gets its final name once closed (or once
+        committed). The temporary file is removed if the writing fails.
+
+        Parameters:
+            path (str): final path of the file
+            mode (str): 'wb' or 'w'
+        """
+        path_to_tmp = self.temporary(path)
+        try:
+            with open(path_to_tmp, mode) as file:
+                yield file
+        except BaseException:
+            if os.path.lexists(path_to_tmp):
+                os.remove(path_to_tmp)
+            raise
+        self.add(path_to_tmp, path)
+
+    # ----------------------------------------------------------------
+    def put(self, path, data):
+        with self.open(path, 'wb') as file:
+            file.write(data)
+
+    # ----------------------------------------------------------------
+    def link(self, source, destination, method = 'auto'):
+        if source in self._buffer:
+            self.flush_buffer()
+        # The source may still wait for the commit under its temporary name
+        path_to_tmp = self.temporary(destination)
+        method = link_or_copy(self.resolve(source), path_to_tmp, method)
+        self.add(path_to_tmp, destination)
+        return method
+
+    # ----------------------------------------------------------------
+    def add(self, path_to_tmp, path):
+        """
+        Give a complete file written aside its final name, i.e. a link
+
+        Parameters:
+            path_to_tmp (str): path to the complete file, in the directory of path
+            path (str): final path of the file
+        """
+        if self._durability == 'batch':
+            with self._lock:
+                previous = self._pending.pop(path, None)
+                if previous is not None and previous != path_to_tmp and os.path.lexists(previous):
+                    os.remove(previous)
+                self._pending[path] = path_to_tmp
+                if len(self._pending) >= self._batch_size:
+                    self.commit()
+            return
+        if self._durability == 'every-file':
+            fsync_path(path_to_tmp)
+        os.replace(path_to_tmp, path)
+        if self._durability == 'every-file':
+            fsync_path(os.path.dirname(os.path.abspath(path)))
+        with self._lock:
+            self._written += 1
+
+    # ----------------------------------------------------------------
+    def commit(self):
+        """
+        Commit point: every file written so far is in place, and on disk
+        unless the durability is none
+
+        Return:
+            Number of files committed since the previous commit
+        """
+        self.flush_buffer()
+        with self._lock:
+            if self._pending:
+                # Data first, a renamed file must never point to unwritten blocks
+                for path_to_tmp in self._pending.values():
+                    fsync_path(path_to_tmp)
+                directories = set()
+                for path, path_to_tmp in self._pending.items():
+                    os.replace(path_to_tmp, path)
+                    directories.add(os.path.dirname(os.path.abspath(path)))
+                for directory in directories:
+                    fsync_path(directory)
+                self._written += len(self._pending)
+                self._pending = {}
+            committed, self._written = self._written, 0
+            return committed
+
+    # ----------------------------------------------------------------
+    def discard(self):
+        """
+        Remove the files waiting for commit() under their temporary name,
+        so that they do not pile up after an error
+
+        Return:
+            Number of files removed
+        """
+        with self._lock:
+            for path_to_tmp in self._pending.values():
+                if os.path.lexists(path_to_tmp):
+                    os.remove(path_to_tmp)
+            discarded, self._pending = len(self._pending), {}
+        return discarded + self.drop_buffer()
+
+
+class ArchiveSink(OutputSink):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path_to_archive, root, durability = 'batch', buffer_size = 0):
+        """
+        ArchiveSink, a tar archive written as files come, i.e. to ship a
+        run as a single file. It is written aside and renamed in place
+        once closed, duplicates are stored as hard links of the archive.
+
+        Parameters:
+            path_to_archive (str): path to the tar archive
+            root (str): output path, members are named relative to it
+            durability (str): one of DURABILITY_LEVELS, flushes of the archive
+            buffer_size (int): bytes of members held in memory, see OutputSink. The
+                               archive file gets a write buffer of the same size, a
+                               batch of members then takes a single write
+        """
+        super().__init__(root, buffer_size)
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f'Unknown durability {durability}, expected one of {DURABILITY_LEVELS}')
+        self._path_to_archive = path_to_archive
+        self._durability = durability
+        self._file = open(self._path_to_archive+'.part', 'wb', buffering = max(buffer_size, io.DEFAULT_BUFFER_SIZE))
+        self._tar = tarfile.open(fileobj = self._file, mode = 'w', format = tarfile.PAX_FORMAT)
+        self._members = set()
+        self._written = 0
+
+    # ----------------------------------------------------------------
+    @property
+    def path(self):
+        return self._path_to_archive
+
+    # ----------------------------------------------------------------
+    def member(self, name):
+        info = tarfile.TarInfo(name)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        return info
+
+    # ----------------------------------------------------------------
+    def put(self, path, data):
+        info = self.member(self.name(path))
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+        self.stored(info.name)
+
+    # ----------------------------------------------------------------
+    def link(self, source, destination, method = 'auto'):
+        if source in self._buffer:
+            self.flush_buffer()
+        if self.name(source) not in self._members:
+            raise FileNotFoundError(f'{source} is not in the archive')
+        info = self.member(self.name(destination))
+        info.type = tarfile.LNKTYPE
+        info.linkname = self.name(source)
+        self._tar.addfile(info)
+        self.stored(info.name)
+        return 'hardlink'
+
+    # ----------------------------------------------------------------
+    def stored(self, name):
+        self._members.add(name)
+        self._written += 1
+        if self._durability == 'every-file':
+            self.flush()
+
+    # ----------------------------------------------------------------
+    def flush(self):
+        self._file.flush()
+        if self._durability != 'none':
+            os.fsync(self._file.fileno())
+
+    # ----------------------------------------------------------------
+    def commit(self):
+        """
+        Commit point: the members written so far are flushed, the archive
+        itself is only complete once closed
+
+        Return:
+            Number of members written since the previous commit
+        """
+        if self._tar is None:
+            return 0
+        self.flush_buffer()
+        self.flush()
+        committed, self._written = self._written, 0
+        return committed
+
+    # ----------------------------------------------------------------
+    def discard(self):
+        """
+        Remove the incomplete archive
+
+        Return:
+            Number of members dropped
+        """
+        if self._tar is None:
+            return 0
+        self._file.close()
+        self._tar = None
+        os.remove(self._path_to_archive+'.part')
+        return len(self._members) + self.drop_buffer()
+
+    # ----------------------------------------------------------------
+    def close(self):
+        """
+        Write the end of the archive, then move it in place
+        """
+        if self._tar is None:
+            return
+        self.flush_buffer()
+        self._tar.close()
+        self.flush()
+        self._file.close()
+        self._tar = None
+        os.replace(self._path_to_archive+'.part', self._path_to_archive)
+        if self._durability != 'none':
+            fsync_path(os.path.dirname(os.path.abspath(self._path_to_archive)))
@@ -0,0 +1,172 @@
+"""
+parallel_scale.py
+
+Description:
+    Scale pairs of image and annotations file over worker processes.
+    Tasks only carry filenames and results only the scaled annotations:
+    every worker reads, decodes, resizes, encodes and writes its images
+    itself, so neither encoded images nor decoded pixels are ever
+    pickled between processes.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import pickle
+from functools import partial
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from core.image_annotations import ImageAnnotations
+from core.output_sink import AtomicFileSink
+from core.exporters import check_classes
+
+# Pairs scaled by a worker per task, small since a pair takes milliseconds
+CHUNK_SIZE = 16
+# Tasks submitted ahead per worker, a stop request waits for them
+TASKS_PER_WORKER = 2
+
+# Settings of the worker process, set once by init_worker()
+worker_settings = {}
+
+
+# ----------------------------------------------------------------
+def init_worker(folders, target_size, resize_backend, profile, frames, classes, make_sink):
+    """
+    Initializer of the worker processes
+
+    Parameters:
+        folders (tuple): paths to the images, annotations, scaled images and scaled annotations folders
+        target_size (tuple): (width, height) to scale the images to
+        resize_backend (str): one of resize.RESIZE_BACKENDS
+        profile (ScaleProfile): resampling and encoding settings, Pillow defaults if None
+        frames (bool): send the scaled annotations back, i.e. for the export sinks
+        classes (list): fixed exported classes every pair must stick to, any class if None
+        make_sink (callable): opens the sink of the written files, once per worker
+    """
+    worker_settings.update(folders = folders, target_size = target_size, resize_backend = resize_backend,
+                           profile = profile, frames = frames, classes = classes, sink = make_sink())
+
+# ----------------------------------------------------------------
+def picklable(error):
+    """The error, or a RuntimeError with its message if it can not be sent back"""
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError(f'{type(error).__name__}: {error}')
+
+# ----------------------------------------------------------------
+def scale_chunk(filenames):
+    """
+    Scale and write pairs of image and annotations file, in a worker process.
+    The files are committed before returning.
+
+    Parameters:
+        filenames (list): unique ids of the pairs
+
+    Return:
+        List of (filename, scaled frame, error), the frame is a tuple of
+        (class names, parameters, width, height) if asked for and the error
+        None for scaled pairs
+    """
+    path_to_images, path_to_annotations, path_to_scaled_images, path_to_scaled_annotations = \
+        worker_settings['folders']
+    target_width, target_height = worker_settings['target_size']
+    sink = worker_settings['sink']
+    results = []
+    for filename in filenames:
+        try:
+            img_ann = ImageAnnotations(os.path.join(path_to_images, filename+'.jpg'),
+                                       os.path.join(path_to_annotations, filename+'.txt'),
+                                       os.path.join(path_to_scaled_images, filename+'.jpg'),
+                                       os.path.join(path_to_scaled_annotations, filename+'.txt'))
+            img_ann.scale(target_width = target_width, target_height = target_height,
+                          resize_backend = worker_settings['resize_backend'],
+                          profile = worker_settings['profile'])
+            # The exporters run once the pair is committed, a pair they would reject is not written
+            if worker_settings['classes'] is not None:
+                check_classes(img_ann.scaled_frame[0], worker_settings['classes'])
+            img_ann.write(sink = sink)
+        except Exception as e:
+            results.append((filename, None, picklable(e)))
+            continue
+        frame = (*img_ann.scaled_frame, *img_ann.scaled_size) if worker_settings['frames'] else None
+        results.append((filename, frame, None))
+    sink.commit()
+    return results
+
+
+class ParallelScaler(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, paths, target_width, target_height, workers, resize_backend = 'pil', profile = None,
+                 frames = False, classes = None, make_sink = None, chunk_size = CHUNK_SIZE, mp_context = None):
+        """
+        ParallelScaler, a pool of worker processes kept for the whole run.
+
+        Parameters:
+            paths (InputOutputPathConsistensy): input/output paths
+            target_width (int): target width to scale the images
+            target_height (int): target height to scale the images
+            workers (int): number of worker processes
+            resize_backend (str): one of resize.RESIZE_BACKENDS
+            profile (ScaleProfile): resampling and encoding settings, Pillow defaults if None
+            frames (bool): send the scaled annotations back, i.e. for the export sinks
+            classes (list): fixed exported classes, pairs with other classes fail before
+                            being written, any class if None
+            make_sink (callable): picklable, opens the sink of the written files in every
+                                  worker (i.e. a partial of output_sink.open_sink), committed
+                                  once per task. Atomic files of the batch durability if None
+            chunk_size (int): pairs per task
+            mp_context (multiprocessing context): context used to start the workers
+        """
+        if make_sink is None:
+            make_sink = partial(AtomicFileSink, 'batch')
+        folders = (paths.path_to_images, paths.path_to_annotations,
+                   paths.path_to_scaled_images, paths.path_to_scaled_annotations)
+        self._workers = workers
+        self._chunk_size = chunk_size
+        self._executor = ProcessPoolExecutor(max_workers = workers, mp_context = mp_context,
+                                             initializer = init_worker,
+                                             initargs = (folders, (target_width, target_height),
+                                                         resize_backend, profile, frames, classes,
+                                                         make_sink))
+
+    # ----------------------------------------------------------------
+    def scale(self, filenames, stop = None):
+        """
+        Scale and write pairs, results come in the order of the filenames
+
+        Parameters:
+            filenames (list): unique ids of the pairs
+            stop (callable): no more tasks are submitted once it returns True,
+                             the results of the submitted ones still come
+
+        Return:
+            Generator of (filename, scaled frame, error), see scale_chunk()
+        """
+        chunks = deque(filenames[i:i+self._chunk_size] for i in range(0, len(filenames), self._chunk_size))
+        pending = deque()
+        try:
+            while chunks or pending:
+                while chunks and len(pending) < self._workers * TASKS_PER_WORKER \
+                      and not (stop is not None and stop()):
+                    pending.append(self._executor.submit(scale_chunk, chunks.popleft()))
+                if not pending:
+                    break
+                yield from pending.popleft().result()
+        finally:
+            # Left early, i.e. aborting on the first error
+            for future in pending:
+                future.cancel()
+
+    # ----------------------------------------------------------------
+    def close(self):
+        self._executor.shutdown()
@@ -19,6 +19,10 @@ from pathlib import Path
 import uuid
 import re
 from core.custom_exceptions import UnvalidKittiFolderFormat, NoSuchPath
+from core.output_sink import sweep_temporaries
+
+# Output folders created by the runs, maybe inside the input path
+OUTPUT_FOLDER_PREFIX = 'output-'
 
 
 class InputOutputPathConsistensy(object):
@@ -27,7 +31,8 @@ class InputOutputPathConsistensy(object):
     # Initialization
 
     # ----------------------------------------------------------------
-    def __init__(self, input_path, output_path):
+    def __init__(self, input_path, output_path = None, check_input = True, target_folder = None, sink = None,
+                 owns = None):
         """
         Input and output paths should be checked for consistensy and 
         ensure the structure follows Kitti Format. This class provides
@@ -35,21 +40,35 @@ class InputOutputPathConsistensy(object):
         
         Parameters:
             input_path (str): path to where the data to be sacaled is stored
-            output_path (str): path to where the scaled data must be stored
+            output_path (str): path to where the scaled data must be stored,
+                               None to work with the input path only
+            check_input (bool): check the input path on initialization
+            target_folder (str): name of the output folder, an unique 'output-<uuid>'
+                                 folder is created if None. Several runs can share it
+            sink (OutputSink): sink of the scaled files, creates the images and
+                               annotations folders if given
+            owns (callable): tells the pairs of this run given their unique id, i.e.
+                             its shard, when other runs share the target folder
         """
         self._path_to_data = input_path
         self._path_to_output = output_path
+        self._target_folder = target_folder
+        self._sink = sink
+        self._owns = owns
         self._path_to_images = None
         self._path_to_annotations = None
         self._path_to_scaled_images = None
         self._path_to_scaled_annotations = None
 
         # Check input/output consistensy
-        self.self_input_check()
-        self.self_output_check()
+        if check_input:
+            self.self_input_check()
+
+        if self._path_to_output is not None:
+            self.self_output_check()
 
-        # Prepare output folder following Kitti format
-        self.prepare_output_folders()
+            # Prepare output folder following Kitti format
+            self.prepare_output_folders()
     
     # ----------------------------------------------------------------
     @property
@@ -67,6 +86,10 @@ class InputOutputPathConsistensy(object):
     @property
     def path_to_scaled_annotations(self):
         return self._path_to_scaled_annotations
+
+    @property
+    def path_to_output_folder(self):
+        return os.path.dirname(self._path_to_scaled_images)
     
     # ----------------------------------------------------------------
     def self_input_check(self):
@@ -74,6 +97,19 @@ class InputOutputPathConsistensy(object):
         Consistency check for input path. Data should be stored following
         Kitti Format. 
         """
+        self.locate_input_folders()
+
+        # There should be a one-to-one match between image and annotation files
+        images_only, annotations_only = self.get_unmatched_filenames()
+        if images_only or annotations_only:
+            raise UnvalidKittiFolderFormat(reason = 'length')
+
+    # ----------------------------------------------------------------
+    def locate_input_folders(self):
+        """
+        Check the input folder structure and store the paths to the image
+        and annotation folders
+        """
 
         # Basic checks for folder existance
         if not Path(os.fspath(self._path_to_data)).exists():
@@ -81,8 +117,14 @@ class InputOutputPathConsistensy(object):
         if not Path(os.fspath(self._path_to_data)).is_dir():
             raise NoSuchPath(reason = 'input_dir')
         
-        # There should be only two subdirectories according to Kitti Format
-        subfolders = [f.path for f in os.scandir(self._path_to_data) if f.is_dir()]
+        # There should be only two subdirectories according to Kitti Format, besides
+        # the output folders of runs writing inside the input path
+        resumed = None
+        if self._path_to_output is not None and self._target_folder is not None:
+            resumed = os.path.realpath(os.path.join(self._path_to_output, self._target_folder))
+        subfolders = [f.path for f in os.scandir(self._path_to_data)
+                      if f.is_dir() and not f.name.startswith(OUTPUT_FOLDER_PREFIX)
+                      and os.path.realpath(f.path) != resumed]
 
         if len(subfolders) != 2:
             raise UnvalidKittiFolderFormat(reason = 'folder')
@@ -109,15 +151,30 @@ class InputOutputPathConsistensy(object):
         else:
             raise UnvalidKittiFolderFormat(reason = 'extension')
 
-        # There should be a one-to-one match between image and annotation files
+        # Both folders can not hold the same kind of files
+        if self._path_to_images is None or self._path_to_annotations is None:
+            raise UnvalidKittiFolderFormat(reason = 'extension')
+
+    # ----------------------------------------------------------------
+    def get_unmatched_filenames(self):
+        """
+        Get the files without a one-to-one match between the image and
+        annotations folders
+
+        Return:
+            Tuple of (image files without annotations, annotation files without image)
+        """
         image_names = os.listdir(self._path_to_images)
         annotations = os.listdir(self._path_to_annotations)
 
-        file_image_no_extension = [re.sub(r'\.jpg$', '', image_name) for image_name in image_names]
-        file_annotations_no_extension = [re.sub(r'\.txt$', '', filename) for filename in annotations]
+        file_image_no_extension = {re.sub(r'\.jpg$', '', image_name): image_name for image_name in image_names}
+        file_annotations_no_extension = {re.sub(r'\.txt$', '', filename): filename for filename in annotations}
 
-        if set(file_image_no_extension) != set(file_annotations_no_extension):
-            raise UnvalidKittiFolderFormat(reason = 'length')
+        images_only = [file_image_no_extension[name] for name in
+                       sorted(set(file_image_no_extension) - set(file_annotations_no_extension))]
+        annotations_only = [file_annotations_no_extension[name] for name in
+                            sorted(set(file_annotations_no_extension) - set(file_image_no_extension))]
+        return images_only, annotations_only
 
     # ----------------------------------------------------------------
     def self_output_check(self):
@@ -134,12 +191,26 @@ class InputOutputPathConsistensy(object):
     def prepare_output_folders(self):
         """
         Create Kitti Format output folder structure and store paths to 
-        image and annotation folders
+        image and annotation folders. The output folder itself is always
+        local, it holds the manifest and reports of the run. A reused
+        folder is swept of the temporary files of interrupted runs.
         """
-        target_folder = 'output-'+uuid.uuid1().hex
-        Path(os.fspath(os.path.join(self._path_to_output, target_folder))).mkdir()
-        Path(os.fspath(os.path.join(self._path_to_output, target_folder, 'images'))).mkdir()
-        Path(os.fspath(os.path.join(self._path_to_output, target_folder, 'annotations'))).mkdir()
+        if self._target_folder is None:
+            target_folder = OUTPUT_FOLDER_PREFIX+uuid.uuid1().hex
+            exist_ok = False
+        else:
+            # A named output folder may already have been created by another run
+            target_folder = self._target_folder
+            exist_ok = True
+        Path(os.fspath(os.path.join(self._path_to_output, target_folder))).mkdir(exist_ok=exist_ok)
+        for folder in ('images', 'annotations'):
+            path = os.path.join(self._path_to_output, target_folder, folder)
+            if self._sink is None:
+                Path(os.fspath(path)).mkdir(exist_ok=exist_ok)
+            else:
+                self._sink.makedirs(path, exist_ok=exist_ok)
+            if exist_ok:
+                sweep_temporaries(path, self._owns)
 
         self._path_to_scaled_images = os.path.join(self._path_to_output, target_folder, 'images')
         self._path_to_scaled_annotations = os.path.join(self._path_to_output, target_folder, 'annotations')
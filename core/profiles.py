@@ -0,0 +1,74 @@
+"""
+profiles.py
+
+Description:
+    Named speed/quality profiles of the scaled images: the resampling
+    filter and reducing_gap of the resize, and the quality, chroma
+    subsampling, optimize and progressive settings of the JPEG encoder.
+    Their cost in time, bytes and PSNR is measured by
+    benchmarks/bench_profiles.py.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+from dataclasses import dataclass
+from PIL import Image
+
+
+@dataclass(frozen = True)
+class ScaleProfile:
+    name: str
+    resample: int
+    # Image.resize first reduces by an integer factor keeping the image
+    # this many times larger than the target, None resamples at once
+    reducing_gap: float
+    quality: int
+    subsampling: str
+    optimize: bool
+    progressive: bool
+
+    # ----------------------------------------------------------------
+    def resize_kwargs(self):
+        return {'resample': self.resample, 'reducing_gap': self.reducing_gap}
+
+    # ----------------------------------------------------------------
+    def save_kwargs(self, format = 'JPEG'):
+        """
+        Keyword arguments of Image.save(), only JPEG has encoder settings
+
+        Parameters:
+            format (str): image format
+        """
+        if format.upper() not in ('JPEG', 'JPG'):
+            return {}
+        return {'quality': self.quality, 'subsampling': self.subsampling,
+                'optimize': self.optimize, 'progressive': self.progressive}
+
+
+PROFILES = {
+    'fast': ScaleProfile('fast', Image.BILINEAR, 2.0, 75, '4:2:0', False, False),
+    'balanced': ScaleProfile('balanced', Image.BICUBIC, 3.0, 85, '4:2:0', True, False),
+    'quality': ScaleProfile('quality', Image.LANCZOS, None, 95, '4:4:4', True, True),
+}
+
+
+# ----------------------------------------------------------------
+def get_profile(name):
+    """
+    Get a profile by name
+
+    Parameters:
+        name (str): one of PROFILES, None or '' for the Pillow defaults
+
+    Return:
+        ScaleProfile, None for the Pillow defaults
+    """
+    if not name:
+        return None
+    if name not in PROFILES:
+        raise ValueError(f'Unknown profile {name}, expected one of {list(PROFILES)}')
+    return PROFILES[name]
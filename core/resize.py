@@ -0,0 +1,145 @@
+"""
+resize.py
+
+Description:
+    Resize backends of the scaled images. Downscaling by integer factors
+    (i.e. 1136x568 to 284x284) is a plain box filter, the average of
+    every block of pixels, much cheaper than the generic resampling
+    kernel of Image.resize. JPEG images are first decoded at 1/2, 1/4
+    or 1/8 of their size when that keeps the factors integer. Other
+    sizes fall back to Image.resize.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import numpy as np
+from PIL import Image
+
+# pil: Image.resize, area: box filter of Image.reduce, numpy: box filter in NumPy
+RESIZE_BACKENDS = ('pil', 'area', 'numpy')
+# Scales of the JPEG draft decode
+DRAFT_SCALES = (8, 4, 2)
+# Modes the NumPy box filter handles, 8 bits per channel
+NUMPY_MODES = ('L', 'RGB', 'RGBA')
+
+
+# ----------------------------------------------------------------
+def integer_factors(size, target_size):
+    """
+    Integer downscale factors between two sizes
+
+    Parameters:
+        size (tuple): (width, height) of the image
+        target_size (tuple): (width, height) to scale the image to
+
+    Return:
+        Tuple of (width factor, height factor), None if any is not an integer
+    """
+    (width, height), (target_width, target_height) = size, target_size
+    if target_width <= 0 or target_height <= 0 or width % target_width or height % target_height:
+        return None
+    return width // target_width, height // target_height
+
+# ----------------------------------------------------------------
+def draft_scale(size, target_size):
+    """
+    Largest scale of the JPEG draft decode leaving integer factors
+
+    Parameters:
+        size (tuple): (width, height) of the image
+        target_size (tuple): (width, height) to scale the image to
+
+    Return:
+        Scale out of DRAFT_SCALES, None if none fits
+    """
+    width, height = size
+    for scale in DRAFT_SCALES:
+        if width % scale or height % scale:
+            continue
+        if integer_factors((width // scale, height // scale), target_size) is not None:
+            return scale
+    return None
+
+# ----------------------------------------------------------------
+def area_downscale_numpy(image, factors):
+    """
+    Box filter with NumPy, the pixels of every block are summed with
+    strided views, which unlike reshape().mean() never goes through
+    a floating point copy of the image
+
+    Parameters:
+        image (PIL.Image): image in one of NUMPY_MODES
+        factors (tuple): (width factor, height factor)
+
+    Return:
+        PIL.Image
+    """
+    factor_x, factor_y = factors
+    pixels = np.asarray(image)
+    height, width = pixels.shape[0] // factor_y, pixels.shape[1] // factor_x
+    # Up to 255 blocks of 255*255 pixels fit in 32 bits
+    total = np.zeros((height, width) + pixels.shape[2:], dtype = np.uint32)
+    for y in range(factor_y):
+        for x in range(factor_x):
+            total += pixels[y::factor_y, x::factor_x]
+    count = factor_x * factor_y
+    return Image.fromarray(((total + count // 2) // count).astype(np.uint8), mode = image.mode)
+
+# ----------------------------------------------------------------
+def resize_image(image, target_size, backend = 'pil', draft = True, resample = None, reducing_gap = None):
+    """
+    Resize an image, with a box filter whenever the backend and the
+    factors allow it
+
+    Parameters:
+        image (PIL.Image): image, a JPEG not loaded yet can be decoded at a lower scale
+        target_size (tuple): (width, height) to scale the image to
+        backend (str): one of RESIZE_BACKENDS
+        draft (bool): allow the JPEG draft decode
+        resample (int): filter of Image.resize, its default if None
+        reducing_gap (float): reducing_gap of Image.resize
+
+    Return:
+        PIL.Image
+    """
+    if backend not in RESIZE_BACKENDS:
+        raise ValueError(f'Unknown resize backend {backend}, expected one of {RESIZE_BACKENDS}')
+    target_size = tuple(target_size)
+    if backend == 'pil':
+        return image.resize(target_size, resample = resample, reducing_gap = reducing_gap)
+
+    if draft and image.format == 'JPEG':
+        scale = draft_scale(image.size, target_size)
+        if scale is not None:
+            width, height = image.size
+            image.draft(image.mode, (width // scale, height // scale))
+
+    factors = integer_factors(image.size, target_size)
+    if factors is None:
+        return image.resize(target_size, resample = resample, reducing_gap = reducing_gap)
+    if factors == (1, 1):
+        return image.copy()
+    if backend == 'numpy' and image.mode in NUMPY_MODES:
+        return area_downscale_numpy(image, factors)
+    return image.reduce(factors)
+
+# ----------------------------------------------------------------
+def psnr(image, reference):
+    """
+    Peak signal-to-noise ratio of an image against a reference
+
+    Parameters:
+        image (PIL.Image): image
+        reference (PIL.Image): reference image of the same size and mode
+
+    Return:
+        PSNR in dB, infinite for identical images
+    """
+    error = np.mean((np.asarray(image, dtype = np.float64) - np.asarray(reference, dtype = np.float64)) ** 2)
+    if error == 0:
+        return float('inf')
+    return float(10 * np.log10(255 ** 2 / error))
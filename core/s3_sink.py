@@ -0,0 +1,362 @@
+"""
+s3_sink.py
+
+Description:
+    Output sink uploading the scaled files to an S3-compatible object
+    store (AWS S3, MinIO, ...) straight from memory. Requests are signed
+    with AWS Signature Version 4 and sent over a pool of keep-alive
+    connections by a pool of threads. Large files are uploaded as
+    multipart uploads whose parts go in parallel, and the bytes held by
+    uploads in flight are bounded so that scaling waits for the network
+    instead of filling the memory.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import hmac
+import hashlib
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlparse, quote
+from xml.sax.saxutils import escape
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from core.output_sink import OutputSink
+from core.custom_exceptions import ObjectStoreError
+
+# Files larger than a part are uploaded as multipart uploads, S3 parts are at least 5 MiB
+PART_SIZE = 8 * 1024 * 1024
+# Keep-alive connections, and threads sending requests over them
+MAX_CONNECTIONS = 8
+# Bytes of the files being uploaded held in memory, a larger file is uploaded alone
+MAX_IN_FLIGHT_BYTES = 64 * 1024 * 1024
+# Seconds to connect and to wait for a response
+TIMEOUT = (10, 120)
+
+
+# ----------------------------------------------------------------
+def hmac_sha256(key, message):
+    return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+# ----------------------------------------------------------------
+def canonical_query(query):
+    """Query string of a request, sorted and encoded as signed"""
+    return '&'.join(f"{quote(key, safe = '~')}={quote(value, safe = '~')}" for key, value in sorted(query.items()))
+
+# ----------------------------------------------------------------
+def authorization_v4(method, path, query, headers, access_key, secret_key, region, service = 's3'):
+    """
+    Authorization header of a request, AWS Signature Version 4
+
+    Parameters:
+        method (str): HTTP method
+        path (str): encoded path of the request
+        query (dict): query parameters, {'uploads': ''} for a bare one
+        headers (dict): lower case headers to sign, with host, x-amz-date
+                        and x-amz-content-sha256 (hash of the payload)
+        access_key (str): access key id
+        secret_key (str): secret access key
+        region (str): region of the store, i.e. us-east-1
+        service (str): signed service name
+
+    Return:
+        Value of the Authorization header
+    """
+    amz_date = headers['x-amz-date']
+    scope = f'{amz_date[:8]}/{region}/{service}/aws4_request'
+    signed_headers = ';'.join(sorted(headers))
+    canonical_headers = ''.join(f'{name}:{" ".join(str(headers[name]).split())}\n' for name in sorted(headers))
+    canonical_request = '\n'.join((method, path, canonical_query(query), canonical_headers,
+                                   signed_headers, headers['x-amz-content-sha256']))
+    string_to_sign = '\n'.join(('AWS4-HMAC-SHA256', amz_date, scope,
+                                hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()))
+
+    key = ('AWS4'+secret_key).encode('utf-8')
+    for part in (amz_date[:8], region, service, 'aws4_request'):
+        key = hmac_sha256(key, part)
+    signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f'AWS4-HMAC-SHA256 Credential={access_key}/{scope},SignedHeaders={signed_headers},Signature={signature}'
+
+
+class MultipartUpload(object):
+
+    # ----------------------------------------------------------------
+    def __init__(self, key, upload_id, size, parts):
+        """
+        MultipartUpload, the parts of a file being uploaded. The future
+        is done once the upload is completed, or aborted.
+        """
+        self.key = key
+        self.upload_id = upload_id
+        self.size = size
+        self.etags = [None] * parts
+        self.remaining = parts
+        self.error = None
+        self.lock = threading.Lock()
+        self.future = Future()
+
+
+class S3Sink(OutputSink):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, url, root, endpoint_url = None, access_key = None, secret_key = None,
+                 session_token = None, region = None, part_size = PART_SIZE,
+                 max_connections = MAX_CONNECTIONS, max_in_flight_bytes = MAX_IN_FLIGHT_BYTES):
+        """
+        S3Sink, files are stored as objects named by the prefix and their
+        name relative to the output path. Settings not given come from the
+        environment, as for the AWS tools.
+
+        Parameters:
+            url (str): s3://<bucket>/<prefix>
+            root (str): output path
+            endpoint_url (str): i.e. http://localhost:9000 for a local MinIO,
+                                S3_ENDPOINT_URL or AWS_ENDPOINT_URL, else AWS S3
+            access_key (str): AWS_ACCESS_KEY_ID
+            secret_key (str): AWS_SECRET_ACCESS_KEY
+            session_token (str): AWS_SESSION_TOKEN, for temporary credentials
+            region (str): AWS_REGION or AWS_DEFAULT_REGION, else us-east-1
+            part_size (int): size of the parts of multipart uploads
+            max_connections (int): keep-alive connections and upload threads
+            max_in_flight_bytes (int): bytes of the files being uploaded
+        """
+        super().__init__(root)
+        parsed = urlparse(url)
+        if parsed.scheme != 's3' or not parsed.netloc:
+            raise ObjectStoreError('url', url)
+        self._bucket = parsed.netloc
+        self._prefix = parsed.path.strip('/')
+
+        self._region = region or os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or 'us-east-1'
+        self._endpoint = (endpoint_url or os.environ.get('S3_ENDPOINT_URL') or os.environ.get('AWS_ENDPOINT_URL')
+                          or f'https://s3.{self._region}.amazonaws.com').rstrip('/')
+        self._host = urlparse(self._endpoint).netloc
+        self._access_key = access_key or os.environ.get('AWS_ACCESS_KEY_ID')
+        self._secret_key = secret_key or os.environ.get('AWS_SECRET_ACCESS_KEY')
+        self._session_token = session_token or os.environ.get('AWS_SESSION_TOKEN')
+        if not self._access_key or not self._secret_key:
+            raise ObjectStoreError('credentials')
+        self._part_size = part_size
+        self._max_in_flight_bytes = max_in_flight_bytes
+
+        # Threads never wait for a connection of their own pool
+        self._session = requests.Session()
+        self._session.mount(self._endpoint, HTTPAdapter(pool_connections = 1, pool_maxsize = max_connections,
+                                                        pool_block = True))
+        self._executor = ThreadPoolExecutor(max_workers = max_connections, thread_name_prefix = 's3-sink')
+        self._in_flight = 0
+        self._in_flight_changed = threading.Condition()
+        # {key: future of its upload} since the last commit
+        self._futures = {}
+        self._closed = False
+
+    # ----------------------------------------------------------------
+    @property
+    def bucket(self):
+        return self._bucket
+
+    @property
+    def in_flight(self):
+        """Bytes of the files being uploaded"""
+        return self._in_flight
+
+    # ----------------------------------------------------------------
+    def key(self, path):
+        """Object key of a file"""
+        name = self.name(path)
+        return f'{self._prefix}/{name}' if self._prefix else name
+
+    # ----------------------------------------------------------------
+    def request(self, method, key, query = None, data = b'', headers = None):
+        """
+        Send a signed request about an object, path-style so that any
+        bucket name works with any endpoint
+
+        Parameters:
+            method (str): HTTP method
+            key (str): object key
+            query (dict): query parameters
+            data (bytes-like): payload, sent as it is
+            headers (dict): lower case headers, signed along
+
+        Return:
+            requests.Response
+        """
+        query = query or {}
+        path = quote(f'/{self._bucket}/{key}', safe = '/~')
+        headers = dict(headers or {})
+        headers.update({'host': self._host,
+                        'x-amz-date': datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ'),
+                        'x-amz-content-sha256': hashlib.sha256(data).hexdigest()})
+        if self._session_token:
+            headers['x-amz-security-token'] = self._session_token
+        headers['authorization'] = authorization_v4(method, path, query, headers,
+                                                    self._access_key, self._secret_key, self._region)
+
+        url = self._endpoint + path + ('?'+canonical_query(query) if query else '')
+        response = self._session.request(method, url, data = data, headers = headers, timeout = TIMEOUT)
+        # Copies and completions may fail after a 200 response has started
+        if response.status_code >= 300 or (method != 'GET' and response.content.lstrip().startswith(b'<Error>')):
+            raise ObjectStoreError('request', f'{method} {key} returned {response.status_code} {response.text[:200]}')
+        return response
+
+    # ----------------------------------------------------------------
+    def reserve(self, size):
+        """Wait until a file fits in the bytes in flight, an oversized one waits for all others"""
+        with self._in_flight_changed:
+            while self._in_flight and self._in_flight + size > self._max_in_flight_bytes:
+                self._in_flight_changed.wait()
+            self._in_flight += size
+
+    def release(self, size):
+        with self._in_flight_changed:
+            self._in_flight -= size
+            self._in_flight_changed.notify_all()
+
+    # ----------------------------------------------------------------
+    def put(self, path, data):
+        """
+        Upload a file held in memory, the upload goes on in the background.
+        The data must not be modified until commit().
+
+        Parameters:
+            path (str): path to the file
+            data (bytes): content of the file
+        """
+        key = self.key(path)
+        view = memoryview(data)
+        self.reserve(len(view))
+        if len(view) <= self._part_size:
+            self._futures[key] = self._executor.submit(self.upload, key, view)
+            return
+
+        try:
+            response = self.request('POST', key, {'uploads': ''})
+            upload_id = response.text.split('<UploadId>')[1].split('</UploadId>')[0]
+        except Exception:
+            self.release(len(view))
+            raise
+        parts = range(0, len(view), self._part_size)
+        upload = MultipartUpload(key, upload_id, len(view), len(parts))
+        for number, start in enumerate(parts):
+            self._executor.submit(self.upload_part, upload, number, view[start:start+self._part_size])
+        self._futures[key] = upload.future
+
+    # ----------------------------------------------------------------
+    def upload(self, key, view):
+        try:
+            self.request('PUT', key, data = view)
+        finally:
+            self.release(len(view))
+
+    # ----------------------------------------------------------------
+    def upload_part(self, upload, number, view):
+        """Upload a part, the last part done completes the upload"""
+        etag, error = None, None
+        try:
+            response = self.request('PUT', upload.key, {'partNumber': str(number+1), 'uploadId': upload.upload_id},
+                                    data = view)
+            etag = response.headers['ETag']
+        except Exception as e:
+            error = e
+        with upload.lock:
+            upload.etags[number] = etag
+            upload.error = upload.error or error
+            upload.remaining -= 1
+            if upload.remaining:
+                return
+        self.complete(upload)
+
+    # ----------------------------------------------------------------
+    def complete(self, upload):
+        """Complete a multipart upload, or abort it if a part failed"""
+        try:
+            if upload.error is not None:
+                raise upload.error
+            body = ''.join(f'<Part><PartNumber>{number+1}</PartNumber><ETag>{escape(etag)}</ETag></Part>'
+                           for number, etag in enumerate(upload.etags))
+            self.request('POST', upload.key, {'uploadId': upload.upload_id},
+                         data = f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode('utf-8'))
+            upload.future.set_result(upload.key)
+        except Exception as e:
+            # Uploaded parts are billed until the upload is aborted
+            try:
+                self.request('DELETE', upload.key, {'uploadId': upload.upload_id})
+            except Exception:
+                pass
+            upload.future.set_exception(e)
+        finally:
+            self.release(upload.size)
+
+    # ----------------------------------------------------------------
+    def link(self, source, destination, method = 'auto'):
+        """
+        Copy an object server side once its upload is done, nothing goes
+        through this host
+
+        Return:
+            'copy'
+        """
+        source_key = self.key(source)
+        self._futures[self.key(destination)] = self._executor.submit(self.copy, source_key, self.key(destination),
+                                                                     self._futures.get(source_key))
+        return 'copy'
+
+    # ----------------------------------------------------------------
+    def copy(self, source_key, destination_key, upload = None):
+        # Submitted after the upload of the source, which has started by now
+        if upload is not None:
+            upload.result()
+        self.request('PUT', destination_key, headers = {'x-amz-copy-source': quote(f'/{self._bucket}/{source_key}')})
+
+    # ----------------------------------------------------------------
+    def commit(self):
+        """
+        Commit point: wait for the uploads, raise the first failure
+
+        Return:
+            Number of objects stored since the previous commit
+        """
+        futures, self._futures = self._futures, {}
+        error = None
+        for future in futures.values():
+            try:
+                future.result()
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return len(futures)
+
+    # ----------------------------------------------------------------
+    def discard(self):
+        """
+        Wait for the uploads in flight without raising, i.e. after an error.
+        Objects already stored are kept, an object is never left partial
+
+        Return:
+            Number of files that failed to upload
+        """
+        futures, self._futures = self._futures, {}
+        wait(futures.values())
+        return sum(1 for future in futures.values() if future.exception() is not None)
+
+    # ----------------------------------------------------------------
+    def close(self):
+        if self._closed:
+            return
+        try:
+            self.commit()
+        finally:
+            self._closed = True
+            self._executor.shutdown()
+            self._session.close()
@@ -0,0 +1,233 @@
+"""
+scheduler.py
+
+Description:
+    Fair-share scheduler of worker slots between users. Jobs ask for a
+    slot before every chunk of work, so a large job is preempted between
+    chunks whenever someone else is waiting. Slots are handed out with
+    start-time fair queuing: each user is charged the cost of the chunk
+    divided by the weight of its priority class, and the user charged
+    the least gets the next slot, within a per-user concurrency quota.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import asyncio
+import itertools
+
+
+class SchedulerTicket(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, scheduler, user_id, weight, seq):
+        """
+        SchedulerTicket, the place of a job in the scheduler queue.
+
+        Parameters:
+            scheduler (FairShareScheduler): scheduler of the ticket
+            user_id (str): user the job is charged to
+            weight (float): weight of the priority class of the job
+            seq (int): arrival order, ties are broken first come first served
+        """
+        self._scheduler = scheduler
+        self.user_id = user_id
+        self.weight = weight
+        self.seq = seq
+        self.cost = 1
+        self.future = None
+        self.holding = False
+
+    # ----------------------------------------------------------------
+    @property
+    def waiting(self):
+        return self.future is not None and not self.future.done()
+
+    # ----------------------------------------------------------------
+    def position(self):
+        """
+        Position in the queue
+
+        Return:
+            1 for the next ticket to get a slot, None if not waiting
+        """
+        return self._scheduler.position(self)
+
+
+class FairShareScheduler(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, slots, default_quota, quotas = None):
+        """
+        FairShareScheduler, shares a number of worker slots between users.
+
+        Parameters:
+            slots (int): chunks of work running at the same time
+            default_quota (int): slots a user can hold at the same time
+            quotas (dict): {user id: slots} overriding the default quota
+        """
+        self._free = slots
+        self._default_quota = default_quota
+        self._quotas = quotas if quotas else {}
+        self._waiting = []
+        self._holding = {}
+        # Start-time fair queuing: virtual time and finish tag of every user
+        self._virtual_time = 0.0
+        self._finish = {}
+        self._seq = itertools.count()
+        self._dispatch_scheduled = False
+
+    # ----------------------------------------------------------------
+    @property
+    def free(self):
+        return self._free
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    # ----------------------------------------------------------------
+    def ticket(self, user_id, weight):
+        """
+        Get a ticket for a new job
+
+        Parameters:
+            user_id (str): user the job is charged to
+            weight (float): weight of the priority class of the job
+
+        Return:
+            SchedulerTicket
+        """
+        return SchedulerTicket(self, user_id, weight, next(self._seq))
+
+    # ----------------------------------------------------------------
+    def quota(self, user_id):
+        return self._quotas.get(user_id, self._default_quota)
+
+    # ----------------------------------------------------------------
+    def sort_key(self, ticket):
+        """Order of the waiting tickets, the smallest first"""
+        start = max(self._virtual_time, self._finish.get(ticket.user_id, 0.0))
+        return (start, -ticket.weight, ticket.seq)
+
+    # ----------------------------------------------------------------
+    def position(self, ticket):
+        """
+        Position of a waiting ticket in the queue
+
+        Parameters:
+            ticket (SchedulerTicket): ticket
+
+        Return:
+            1 for the next ticket to get a slot, None if not waiting
+        """
+        if ticket not in self._waiting:
+            return None
+        key = self.sort_key(ticket)
+        return 1 + sum(1 for other in self._waiting if self.sort_key(other) < key)
+
+    # ----------------------------------------------------------------
+    def schedule_dispatch(self):
+        """
+        Dispatch on the next iteration of the event loop. A job releasing its
+        slot asks for the next one right away, deferring lets it compete with
+        the others instead of handing the slot to whoever is already waiting.
+        """
+        if not self._dispatch_scheduled:
+            self._dispatch_scheduled = True
+            asyncio.get_running_loop().call_soon(self.dispatch)
+
+    # ----------------------------------------------------------------
+    def dispatch(self):
+        """
+        Hand out the free slots to the waiting tickets
+        """
+        self._dispatch_scheduled = False
+        while self._free > 0:
+            eligible = [ticket for ticket in self._waiting
+                        if self._holding.get(ticket.user_id, 0) < self.quota(ticket.user_id)]
+            if not eligible:
+                return
+
+            ticket = min(eligible, key = self.sort_key)
+            start = self.sort_key(ticket)[0]
+            self._virtual_time = start
+            self._finish[ticket.user_id] = start + ticket.cost / ticket.weight
+
+            self._waiting.remove(ticket)
+            self._free -= 1
+            self._holding[ticket.user_id] = self._holding.get(ticket.user_id, 0) + 1
+            ticket.holding = True
+            ticket.future.set_result(None)
+
+    # ----------------------------------------------------------------
+    def request(self, ticket, cost = 1):
+        """
+        Queue the ticket for a slot to run the next chunk of a job
+
+        Parameters:
+            ticket (SchedulerTicket): ticket of the job
+            cost (float): cost of the chunk, i.e. its number of files
+
+        Return:
+            Future done once the slot is granted
+        """
+        ticket.cost = cost
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._waiting.append(ticket)
+        self.schedule_dispatch()
+        return ticket.future
+
+    # ----------------------------------------------------------------
+    def withdraw(self, ticket):
+        """
+        Leave the queue, or give the slot back if it was granted meanwhile
+
+        Parameters:
+            ticket (SchedulerTicket): ticket of the job
+        """
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            ticket.future.cancel()
+        else:
+            self.release(ticket)
+
+    # ----------------------------------------------------------------
+    async def acquire(self, ticket, cost = 1):
+        """
+        Wait for a slot to run the next chunk of a job
+
+        Parameters:
+            ticket (SchedulerTicket): ticket of the job
+            cost (float): cost of the chunk, i.e. its number of files
+        """
+        future = self.request(ticket, cost)
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.withdraw(ticket)
+            raise
+
+    # ----------------------------------------------------------------
+    def release(self, ticket):
+        """
+        Give the slot back once the chunk is done
+
+        Parameters:
+            ticket (SchedulerTicket): ticket of the job
+        """
+        if not ticket.holding:
+            return
+        ticket.holding = False
+        self._free += 1
+        self._holding[ticket.user_id] -= 1
+        self.schedule_dispatch()
@@ -0,0 +1,112 @@
+"""
+serializer.py
+
+Description:
+    Serializer of annotations files. A whole frame, the class names and
+    the (N, 14) numeric parameters matrix, is formatted in one batched
+    step and written at once. The bounding box follows a fixed float
+    format, the other parameters keep their exact value.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import re
+import numpy as np
+
+# Decimals of the bounding box coordinates
+DECIMALS = 2
+# Columns of the bounding box in the numeric parameters
+BOX_COLUMNS = slice(3, 7)
+
+# Trailing zeros of the fractional part, and the point if nothing is left
+TRAILING_ZEROS = re.compile(r'\.?0+(?=[ \n])')
+
+
+class AnnotationSerializer(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, decimals = DECIMALS, trim = True):
+        """
+        AnnotationSerializer, formats the annotations of a frame. Bounding
+        box coordinates are rounded to a fixed number of decimals, the other
+        parameters are never rounded: they are written with as many decimals
+        as their value needs (i.e. -1.567), and never in exponent notation.
+
+        Parameters:
+            decimals (int): decimals of the bounding box coordinates
+            trim (bool): drop trailing zeros, i.e. 101.1 and 0 instead of 101.10 and 0.00
+        """
+        self._decimals = decimals
+        self._trim = trim
+
+    # ----------------------------------------------------------------
+    def format(self, class_names, parameters):
+        """
+        Format the annotations of a frame
+
+        Parameters:
+            class_names (list): class name of every annotation
+            parameters (array): (N, 14) numeric parameters
+
+        Return:
+            Content of the annotations file, a line per annotation
+        """
+        if len(class_names) == 0:
+            return ''
+        # Adding zero turns -0.0 into 0.0
+        parameters = np.asarray(parameters, dtype = np.float64) + 0.0
+        rounded = np.round(parameters, self._decimals) + 0.0
+        exact = np.all(rounded == parameters, axis = 0)
+        exact[BOX_COLUMNS] = True
+        formats = [f' %.{self._decimals}f'] * parameters.shape[1]
+        # Usually zeros outside the box, the fixed format then writes them exactly in the same step
+        if not exact.all():
+            rounded = rounded.astype(object)
+            for column in np.flatnonzero(~exact):
+                formats[column] = ' %s'
+                rounded[:, column] = [np.format_float_positional(value, trim = '0')
+                                      for value in parameters[:, column]]
+        parameters = rounded
+        values = []
+        for class_name, row in zip(class_names, parameters.tolist()):
+            values.append(class_name)
+            values.extend(row)
+        line = '%s' + ''.join(formats) + '\n'
+        text = (line * len(class_names)) % tuple(values)
+        if self._trim and self._decimals > 0:
+            text = TRAILING_ZEROS.sub('', text)
+        return text
+
+    # ----------------------------------------------------------------
+    def lines(self, class_names, parameters):
+        """
+        Format the annotations of a frame
+
+        Return:
+            List of annotations, without line breaks
+        """
+        return self.format(class_names, parameters).splitlines()
+
+    # ----------------------------------------------------------------
+    def to_bytes(self, class_names, parameters):
+        return self.format(class_names, parameters).encode('utf-8')
+
+    # ----------------------------------------------------------------
+    def write(self, path, class_names, parameters):
+        """
+        Write an annotations file with a single write
+
+        Parameters:
+            path (str): path to the annotations file
+            class_names (list): class name of every annotation
+            parameters (array): (N, 14) numeric parameters
+        """
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes(class_names, parameters))
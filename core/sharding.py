@@ -0,0 +1,128 @@
+"""
+sharding.py
+
+Description:
+    Deterministic partition of a dataset across several runs (i.e.
+    nodes). Each pair of image and annotation files is assigned to a
+    shard by a stable hash of its unique id, so shards are disjoint,
+    balanced and independent of the file listing order. Provides the
+    merge step that checks every pair was produced exactly once.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import re
+import hashlib
+from collections import Counter
+from core.manifest import RunManifest
+
+MANIFESTS_FOLDER = 'manifests'
+
+
+# ----------------------------------------------------------------
+def shard_of(filename, num_shards):
+    """
+    Get the shard a pair of image and annotation files belongs to
+
+    Parameters:
+        filename (str): unique id of the pair
+        num_shards (int): number of shards
+
+    Return:
+        Shard index
+    """
+    digest = hashlib.blake2b(filename.encode('utf-8'), digest_size = 8).digest()
+    return int.from_bytes(digest, 'big') % num_shards
+
+
+# ----------------------------------------------------------------
+def select_shard(filenames, num_shards, shard_index):
+    """
+    Keep the unique ids belonging to a shard
+
+    Parameters:
+        filenames (list): unique ids of the pairs
+        num_shards (int): number of shards
+        shard_index (int): index of the shard, from 0 to num_shards - 1
+
+    Return:
+        Sorted list of unique ids
+    """
+    return sorted(filename for filename in filenames if shard_of(filename, num_shards) == shard_index)
+
+
+# ----------------------------------------------------------------
+def manifest_path(path_to_output_folder, num_shards, shard_index):
+    """
+    Get the path to the manifest of a shard
+
+    Parameters:
+        path_to_output_folder (str): path to the shared output folder
+        num_shards (int): number of shards
+        shard_index (int): index of the shard
+
+    Return:
+        Path to the JSON manifest
+    """
+    return os.path.join(path_to_output_folder, MANIFESTS_FOLDER,
+                        f'shard-{shard_index:05d}-of-{num_shards:05d}.json')
+
+
+# ----------------------------------------------------------------
+def merge_shards(path_to_output_folder, expected_filenames = None):
+    """
+    Check the manifests of all shards of a run. Every shard must be present
+    and complete, shards must be disjoint and every assigned pair must have
+    been produced exactly once.
+
+    Parameters:
+        path_to_output_folder (str): path to the shared output folder
+        expected_filenames (list): unique ids of all the pairs of the dataset,
+                                   None to only check the shards against each other
+
+    Return:
+        Dictionary with the merge result, 'valid' is True if nothing is wrong
+    """
+    path_to_manifests = os.path.join(path_to_output_folder, MANIFESTS_FOLDER)
+    manifests = {}
+    num_shards = set()
+    if os.path.isdir(path_to_manifests):
+        for name in sorted(os.listdir(path_to_manifests)):
+            match = re.match(r'^shard-(\d+)-of-(\d+)\.json$', name)
+            if match:
+                manifests[int(match.group(1))] = RunManifest.read(os.path.join(path_to_manifests, name))
+                num_shards.add(int(match.group(2)))
+
+    total_shards = max(num_shards) if num_shards else 0
+    assigned = Counter()
+    produced = Counter()
+    failed = []
+    for manifest in manifests.values():
+        assigned.update(manifest['assigned'])
+        produced.update(manifest['produced'])
+        failed.extend(manifest['failed'])
+
+    expected = set(assigned) if expected_filenames is None else set(expected_filenames)
+
+    result = {
+        'num_shards': total_shards,
+        'inconsistent_num_shards': len(num_shards) > 1,
+        'missing_shards': sorted(set(range(total_shards)) - set(manifests)),
+        'incomplete_shards': sorted(index for index, manifest in manifests.items() if not manifest['complete']),
+        'unassigned': sorted(expected - set(assigned)),
+        'assigned_more_than_once': sorted(name for name, count in assigned.items() if count > 1),
+        'missing': sorted(name for name in expected if produced[name] == 0),
+        'produced_more_than_once': sorted(name for name, count in produced.items() if count > 1),
+        'unexpected': sorted(set(produced) - expected),
+        'failed': sorted(failed),
+        'produced': sum(produced.values())
+    }
+    result['valid'] = total_shards > 0 and not any(result[key] for key in (
+        'inconsistent_num_shards', 'missing_shards', 'incomplete_shards', 'unassigned',
+        'assigned_more_than_once', 'missing', 'produced_more_than_once', 'unexpected'))
+    return result
@@ -0,0 +1,286 @@
+"""
+transforms.py
+
+Description:
+    Composable geometric transforms of a pair of image and annotations
+    file: crop, resize, letterbox padding, horizontal flip and affine.
+    A chain of transforms is folded into a single 3x3 matrix, applied to
+    all bounding boxes at once and to the image in one resampling pass.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import numpy as np
+from PIL import Image
+
+
+class Transform(object):
+    """
+    Geometric transform, maps continuous pixel coordinates of its input
+    (0 at the left/top edge of the image) to those of its output.
+    """
+
+    # ----------------------------------------------------------------
+    def matrix(self, width, height):
+        """
+        Matrix of the transform for an input of the given size
+
+        Parameters:
+            width (float): width of the input
+            height (float): height of the input
+
+        Return:
+            Tuple of (3x3 matrix, (output width, output height))
+        """
+        raise NotImplementedError
+
+
+class Crop(Transform):
+
+    # ----------------------------------------------------------------
+    def __init__(self, left, top, width, height):
+        """
+        Crop, keeps a region of the image.
+
+        Parameters:
+            left (float): left edge of the region
+            top (float): top edge of the region
+            width (int): width of the region
+            height (int): height of the region
+        """
+        self._left = left
+        self._top = top
+        self._width = width
+        self._height = height
+
+    # ----------------------------------------------------------------
+    def matrix(self, width, height):
+        return translation(-self._left, -self._top), (self._width, self._height)
+
+
+class Resize(Transform):
+
+    # ----------------------------------------------------------------
+    def __init__(self, width, height):
+        """
+        Resize, scales the image to the given size.
+
+        Parameters:
+            width (int): target width
+            height (int): target height
+        """
+        self._width = width
+        self._height = height
+
+    # ----------------------------------------------------------------
+    def matrix(self, width, height):
+        return scaling(self._width/width, self._height/height), (self._width, self._height)
+
+
+class LetterboxPad(Transform):
+
+    # ----------------------------------------------------------------
+    def __init__(self, width, height):
+        """
+        LetterboxPad, scales the image to fit the given size keeping its
+        aspect ratio and centers it, the rest is padded.
+
+        Parameters:
+            width (int): target width
+            height (int): target height
+        """
+        self._width = width
+        self._height = height
+
+    # ----------------------------------------------------------------
+    def matrix(self, width, height):
+        scale = min(self._width/width, self._height/height)
+        # Whole pixel offsets, the padding is not resampled
+        left = (self._width - round(width*scale)) // 2
+        top = (self._height - round(height*scale)) // 2
+        return translation(left, top) @ scaling(scale, scale), (self._width, self._height)
+
+
+class HorizontalFlip(Transform):
+
+    # ----------------------------------------------------------------
+    def matrix(self, width, height):
+        return translation(width, 0) @ scaling(-1, 1), (width, height)
+
+
+class Affine(Transform):
+
+    # ----------------------------------------------------------------
+    def __init__(self, matrix, size = None):
+        """
+        Affine, any affine transform.
+
+        Parameters:
+            matrix (array): 2x3 or 3x3 matrix
+            size (tuple): (width, height) of the output, the size of the input if None
+        """
+        self._matrix = np.vstack([np.asarray(matrix, dtype = np.float64)[:2], [0, 0, 1]])
+        self._size = size
+
+    # ----------------------------------------------------------------
+    @classmethod
+    def rotation(cls, degrees, center, size = None):
+        """
+        Counterclockwise rotation around a point
+
+        Parameters:
+            degrees (float): angle of the rotation
+            center (tuple): (x, y) center of the rotation
+            size (tuple): (width, height) of the output, the size of the input if None
+
+        Return:
+            Affine
+        """
+        angle = np.radians(degrees)
+        cos, sin = np.cos(angle), np.sin(angle)
+        rotation = np.array([[cos, sin, 0], [-sin, cos, 0], [0, 0, 1]])
+        return cls(translation(*center) @ rotation @ translation(-center[0], -center[1]), size)
+
+    # ----------------------------------------------------------------
+    def matrix(self, width, height):
+        return self._matrix, self._size if self._size else (width, height)
+
+
+class Compose(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, transforms, fill = 0, resample = Image.BICUBIC, min_size = 1.0):
+        """
+        Compose, a chain of transforms applied at once.
+
+        Parameters:
+            transforms (list): Transform objects, in order
+            fill (int or tuple): color of the padding
+            resample (int): PIL resampling filter
+            min_size (float): boxes narrower or lower than this are dropped
+        """
+        self._transforms = list(transforms)
+        self._fill = fill
+        self._resample = resample
+        self._min_size = min_size
+
+    # ----------------------------------------------------------------
+    @property
+    def min_size(self):
+        return self._min_size
+
+    # ----------------------------------------------------------------
+    def fold(self, width, height):
+        """
+        Fold the chain of transforms into a single matrix
+
+        Parameters:
+            width (int): width of the input image
+            height (int): height of the input image
+
+        Return:
+            Tuple of (3x3 matrix, (output width, output height))
+        """
+        matrix = np.eye(3)
+        size = (width, height)
+        for transform in self._transforms:
+            step, size = transform.matrix(*size)
+            matrix = step @ matrix
+        return matrix, (int(round(size[0])), int(round(size[1])))
+
+    # ----------------------------------------------------------------
+    def apply_image(self, image, matrix, size):
+        """
+        Transform an image with a single resampling pass
+
+        Parameters:
+            image (PIL.Image): input image
+            matrix (array): folded 3x3 matrix
+            size (tuple): (width, height) of the output
+
+        Return:
+            PIL.Image
+        """
+        if matrix[0, 1] != 0 or matrix[1, 0] != 0:
+            inverse = np.linalg.inv(matrix)
+            return image.transform(size, Image.AFFINE, data = tuple(inverse[:2].flatten()),
+                                   resample = self._resample, fillcolor = self._fill)
+
+        # Axis aligned, crop, scale and flip in one resize, which unlike
+        # Image.transform filters when downscaling, then paste on the padding
+        width, height = image.size
+        corners = apply_matrix(matrix, np.array([[0, 0], [width, height]], dtype = np.float64))
+        left, right = np.clip(np.sort(corners[:, 0]), 0, size[0])
+        top, bottom = np.clip(np.sort(corners[:, 1]), 0, size[1])
+        left, top, right, bottom = (int(round(v)) for v in (left, top, right, bottom))
+        if right <= left or bottom <= top:
+            return Image.new(image.mode, size, self._fill)
+
+        source = apply_matrix(np.linalg.inv(matrix), np.array([[left, top], [right, bottom]], dtype = np.float64))
+        x_min, x_max = np.clip(np.sort(source[:, 0]), 0, width)
+        y_min, y_max = np.clip(np.sort(source[:, 1]), 0, height)
+        region = image.resize((right - left, bottom - top), resample = self._resample,
+                              box = (x_min, y_min, x_max, y_max))
+        if matrix[0, 0] < 0:
+            region = region.transpose(Image.FLIP_LEFT_RIGHT)
+        if matrix[1, 1] < 0:
+            region = region.transpose(Image.FLIP_TOP_BOTTOM)
+        if (left, top, right, bottom) == (0, 0, *size):
+            return region
+        output = Image.new(image.mode, size, self._fill)
+        output.paste(region, (left, top))
+        return output
+
+
+# ----------------------------------------------------------------
+def translation(x, y):
+    return np.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype = np.float64)
+
+# ----------------------------------------------------------------
+def scaling(x, y):
+    return np.array([[x, 0, 0], [0, y, 0], [0, 0, 1]], dtype = np.float64)
+
+# ----------------------------------------------------------------
+def apply_matrix(matrix, points):
+    """
+    Transform points
+
+    Parameters:
+        matrix (array): 3x3 matrix
+        points (array): (N, 2) x, y coordinates
+
+    Return:
+        (N, 2) transformed coordinates
+    """
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+# ----------------------------------------------------------------
+def transform_boxes(boxes, matrix, size, min_size = 1.0):
+    """
+    Transform bounding boxes, each one becomes the box enclosing its
+    transformed corners, clipped to the output image
+
+    Parameters:
+        boxes (array): (N, 4) x_min, y_min, x_max, y_max coordinates
+        matrix (array): 3x3 matrix
+        size (tuple): (width, height) of the output image
+        min_size (float): boxes narrower or lower than this once clipped are dropped
+
+    Return:
+        Tuple of ((N, 4) transformed boxes, (N,) boolean mask of the boxes kept)
+    """
+    boxes = np.asarray(boxes, dtype = np.float64).reshape(-1, 4)
+    corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    corners = corners @ matrix[:2, :2].T + matrix[:2, 2]
+    transformed = np.hstack([corners.min(axis = 1), corners.max(axis = 1)])
+    transformed[:, [0, 2]] = np.clip(transformed[:, [0, 2]], 0, size[0])
+    transformed[:, [1, 3]] = np.clip(transformed[:, [1, 3]], 0, size[1])
+    keep = ((transformed[:, 2] - transformed[:, 0]) >= min_size) & ((transformed[:, 3] - transformed[:, 1]) >= min_size)
+    return transformed, keep
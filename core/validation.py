@@ -0,0 +1,207 @@
+"""
+validation.py
+
+Description:
+    Validate-only mode. Checks a whole Kitti Format dataset against
+    the same rules applied while scaling (folder structure, one-to-one
+    match between image and annotation files, annotation requirements)
+    without producing any output. Images are never decoded, their JPEG
+    markers are only verified when asked.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from core.annotations import Annotations
+from core.path_consistensy import InputOutputPathConsistensy
+from core.custom_exceptions import (
+    NoSuchPath,
+    UnvalidAnnotationsFile,
+    UnvalidKittiFolderFormat,
+    UnvalidImageFile
+)
+
+# Pairs checked by a worker per task, big enough to amortize inter-process overhead
+CHUNK_SIZE = 2048
+
+
+# ----------------------------------------------------------------
+def violation(path, reason, message, line = None):
+    """
+    Build a violation entry
+
+    Parameters:
+        path (str): path to the offending file or folder
+        reason (str): reason of the violation
+        message (str): human readable description
+        line (int): line number of the offending annotation
+
+    Return:
+        Dictionary with the violation
+    """
+    return {'file': path, 'line': line, 'reason': reason, 'message': message}
+
+
+# ----------------------------------------------------------------
+def check_jpeg_markers(path):
+    """
+    Check the start and end of image markers of a JPEG file without decoding it
+
+    Parameters:
+        path (str): path to the image
+
+    Return:
+        Reason of the violation, None if the markers are fine
+    """
+    with open(path, 'rb') as file:
+        if file.read(3) != b'\xff\xd8\xff':
+            return 'header'
+        file.seek(0, os.SEEK_END)
+        if file.tell() < 5:
+            return 'truncated'
+        file.seek(-2, os.SEEK_END)
+        if file.read(2) != b'\xff\xd9':
+            return 'truncated'
+    return None
+
+
+# ----------------------------------------------------------------
+def validate_pairs(path_to_images, path_to_annotations, filenames, check_jpeg = False):
+    """
+    Validate pairs of image and annotations file. Module level so that it
+    can be shipped to worker processes.
+
+    Parameters:
+        path_to_images (str): path to the images folder
+        path_to_annotations (str): path to the annotations folder
+        filenames (list): unique ids of the pairs
+        check_jpeg (bool): verify the JPEG markers of the images
+
+    Return:
+        List of violations
+    """
+    violations = []
+
+    for filename in filenames:
+        path_to_file = os.path.join(path_to_annotations, filename+'.txt')
+        try:
+            annotations = Annotations(path_to_file, check = False)
+            for line, reason in annotations.violations():
+                violations.append(violation(path_to_file, reason, str(UnvalidAnnotationsFile(reason)), line))
+        except (OSError, UnicodeDecodeError) as e:
+            violations.append(violation(path_to_file, type(e).__name__, str(e)))
+
+        if check_jpeg:
+            path_to_file = os.path.join(path_to_images, filename+'.jpg')
+            try:
+                reason = check_jpeg_markers(path_to_file)
+                if reason is not None:
+                    violations.append(violation(path_to_file, reason, str(UnvalidImageFile(reason))))
+            except OSError as e:
+                violations.append(violation(path_to_file, type(e).__name__, str(e)))
+
+    return violations
+
+
+class DatasetValidator(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, input_path, check_jpeg = False, workers = None, mp_context = None):
+        """
+        DatasetValidator, checks all pairs of image and annotations file of
+        a dataset in parallel and collects every violation.
+
+        Parameters:
+            input_path (str): path to where the data is stored
+            check_jpeg (bool): verify the JPEG markers of the images
+            workers (int): number of worker processes, defaults to the number of CPUs
+            mp_context (multiprocessing context): context used to start the workers
+        """
+        self._path_to_data = input_path
+        self._check_jpeg = check_jpeg
+        self._workers = workers if workers else os.cpu_count()
+        self._mp_context = mp_context
+        self._violations = []
+        self._pairs = 0
+
+    # ----------------------------------------------------------------
+    @property
+    def violations(self):
+        return self._violations
+
+    @property
+    def pairs(self):
+        return self._pairs
+
+    @property
+    def valid(self):
+        return len(self._violations) == 0
+
+    # ----------------------------------------------------------------
+    def run(self):
+        """
+        Validate the dataset
+
+        Return:
+            List of violations
+        """
+        self._violations = []
+        self._pairs = 0
+
+        # Folder structure
+        paths = InputOutputPathConsistensy(self._path_to_data, check_input = False)
+        try:
+            paths.locate_input_folders()
+        except (NoSuchPath, UnvalidKittiFolderFormat) as e:
+            self._violations.append(violation(self._path_to_data, e.reason, str(e)))
+            return self._violations
+
+        # One-to-one match between image and annotation files
+        images_only, annotations_only = paths.get_unmatched_filenames()
+        message = str(UnvalidKittiFolderFormat(reason = 'length'))
+        for name in images_only:
+            self._violations.append(violation(os.path.join(paths.path_to_images, name), 'length', message))
+        for name in annotations_only:
+            self._violations.append(violation(os.path.join(paths.path_to_annotations, name), 'length', message))
+
+        unmatched = set(images_only)
+        filenames = sorted(name[:-len('.jpg')] for name in os.listdir(paths.path_to_images)
+                           if name not in unmatched and name.endswith('.jpg'))
+        self._pairs = len(filenames)
+
+        # Pairs, in chunks spread over the workers
+        chunks = [filenames[i:i+CHUNK_SIZE] for i in range(0, len(filenames), CHUNK_SIZE)]
+        if self._workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                self._violations.extend(validate_pairs(paths.path_to_images, paths.path_to_annotations,
+                                                       chunk, self._check_jpeg))
+        else:
+            with ProcessPoolExecutor(max_workers = min(self._workers, len(chunks)),
+                                     mp_context = self._mp_context) as executor:
+                futures = [executor.submit(validate_pairs, paths.path_to_images, paths.path_to_annotations,
+                                           chunk, self._check_jpeg)
+                           for chunk in chunks]
+                for future in futures:
+                    self._violations.extend(future.result())
+
+        return self._violations
+
+    # ----------------------------------------------------------------
+    def write_report(self, path_to_report):
+        """
+        Write every violation to a JSONL report
+
+        Parameters:
+            path_to_report (str): path to the JSONL report
+        """
+        with open(path_to_report, 'w') as file:
+            file.writelines(json.dumps(entry)+'\n' for entry in self._violations)
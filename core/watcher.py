@@ -0,0 +1,147 @@
+"""
+watcher.py
+
+Description:
+    This class polls the input image and annotation folders and
+    reports the pairs of image and annotation files that are new
+    and complete, so that they can be scaled as they land instead
+    of re-running over the whole dataset
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import time
+
+# Folders modified more recently than this are listed again on the next poll
+RACY_WINDOW_NS = 1000000000
+
+
+class InputWatcher(object):
+
+    # ================================================================
+    # Initialization
+
+    # ----------------------------------------------------------------
+    def __init__(self, path_to_images, path_to_annotations, settle_time = 2.0, clock = time.time, reported = None):
+        """
+        InputWatcher, a polling watcher over the Kitti Format input folders.
+        A folder is only listed again when its mtime changed (new, renamed or
+        deleted files), files still being written are tracked individually.
+        A file is complete once its size and mtime did not change for
+        settle_time seconds, and a pair is ready once both files are complete.
+
+        Parameters:
+            path_to_images (str): path to the images folder
+            path_to_annotations (str): path to the annotations folder
+            settle_time (float): seconds a file must stay unchanged to be complete
+            clock (callable): time source, in seconds
+            reported (iterable): unique ids of the pairs already scaled, i.e. by a
+                                 previous watch, only reported again if their files
+                                 are deleted and land again
+        """
+        self._folders = {'.jpg': path_to_images, '.txt': path_to_annotations}
+        self._settle_time = settle_time
+        self._clock = clock
+
+        # Folder mtime cursors
+        self._cursors = {extension: None for extension in self._folders}
+        # Filenames currently present in each folder
+        self._known = {extension: set() for extension in self._folders}
+        # {(extension, filename): (size, mtime_ns, time the signature was first seen)}
+        self._pending = {}
+        # {(extension, filename): (size, mtime_ns)} of complete files
+        self._complete = {}
+        # Filenames with a file completed since the last poll
+        self._fresh = set()
+        # Filenames of the reported pairs
+        self._reported = set(reported) if reported is not None else set()
+
+    # ----------------------------------------------------------------
+    def scan(self, extension):
+        """
+        List a folder if it changed since the last poll and track its new files
+
+        Parameters:
+            extension (str): '.jpg' for images, '.txt' for annotations
+        """
+        path = self._folders[extension]
+        mtime = os.stat(path).st_mtime_ns
+        if mtime == self._cursors[extension]:
+            return
+
+        # The cursor is taken before listing, a change while listing is caught next poll.
+        # Timestamps are coarse, a folder modified within the last second could change
+        # again keeping the same mtime, so such a cursor is not trusted
+        racy = time.time_ns() - mtime < RACY_WINDOW_NS
+        self._cursors[extension] = None if racy else mtime
+        known = self._known[extension]
+        present = set()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not entry.name.endswith(extension) or entry.name.startswith('.'):
+                    continue
+                filename = entry.name[:-len(extension)]
+                present.add(filename)
+                if filename not in known:
+                    stat = entry.stat()
+                    self._pending[(extension, filename)] = (stat.st_size, stat.st_mtime_ns, self._clock())
+
+        # Forget deleted files, a pair landing again under the same name is reported again
+        for filename in known - present:
+            self._pending.pop((extension, filename), None)
+            self._complete.pop((extension, filename), None)
+            self._reported.discard(filename)
+        self._known[extension] = present
+
+    # ----------------------------------------------------------------
+    def settle(self):
+        """
+        Check the files still being written, complete ones are promoted
+        """
+        now = self._clock()
+        for key, (size, mtime, since) in list(self._pending.items()):
+            extension, filename = key
+            try:
+                stat = os.stat(os.path.join(self._folders[extension], filename+extension))
+            except FileNotFoundError:
+                del self._pending[key]
+                self._known[extension].discard(filename)
+                continue
+
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                self._pending[key] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - since >= self._settle_time:
+                del self._pending[key]
+                self._complete[key] = (size, mtime)
+                self._fresh.add(filename)
+
+    # ----------------------------------------------------------------
+    def poll(self):
+        """
+        Get the pairs of image and annotation files that became ready since
+        the last poll. Only folders that changed are listed again, and only
+        files that are not complete yet are checked.
+
+        Return:
+            Sorted list of unique ids
+        """
+        for extension in self._folders:
+            self.scan(extension)
+        self.settle()
+
+        ready = []
+        for filename in self._fresh:
+            if filename in self._reported:
+                continue
+            if ('.jpg', filename) in self._complete and ('.txt', filename) in self._complete:
+                self._reported.add(filename)
+                ready.append(filename)
+
+        # Files whose partner is still missing are checked again once it completes
+        self._fresh = set()
+        return sorted(ready)
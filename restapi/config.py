@@ -21,4 +21,73 @@ DDOS_THROTTLE = 5
 JWT_DECODE_OPTIONS = {
     'require': ['user_id', 'exp', 'iat'], 
     'verify': ['exp', 'iat']
-}
\ No newline at end of file
+}
+
+# In-memory scaling (POST /scale)
+SCALE_EXECUTOR_WORKERS = 4
+# Requests waiting for or running in the executor before rejecting new ones
+SCALE_MAX_PENDING = 64
+# Latency objective checked by ./benchmarks/bench_scale_endpoint.py in milliseconds
+SCALE_P99_TARGET_MS = 50
+# Memory of the decoded source images and parsed annotations kept for POST /scale
+# requests naming a file of the server (input_path and filename), 0 disables the cache
+IMAGE_CACHE_MAX_BYTES = 512 * 1024**2
+
+# Streaming batch uploads (POST /batch). A batch holds at most the file being received,
+# the files waiting for their partner and the pairs being scaled: 16 + 16 + 2 * 2 * 16 MiB,
+# so 96 MiB, and 384 MiB for the concurrent batches (decoded images not included)
+UPLOAD_MAX_BODY_SIZE = 8 * 1024**3
+# Maximum size of a single image or annotations file in a batch
+UPLOAD_MAX_FILE_SIZE = 16 * 1024**2
+# Batches being uploaded at the same time before rejecting new ones
+UPLOAD_MAX_CONCURRENT = 4
+# Pairs of a batch being scaled at the same time, reading the body pauses beyond it
+UPLOAD_MAX_INFLIGHT = 2
+# Files of a batch waiting for their image or annotations file, and their total bytes
+UPLOAD_MAX_UNPAIRED = 8
+UPLOAD_MAX_UNPAIRED_BYTES = 16 * 1024**2
+
+# Jobs started through /images, finished jobs kept for status and download
+JOBS_MAX_FINISHED = 1000
+# Seconds an identical /images request gets the result of a finished job instead of
+# running again, 0 to only attach identical requests to running jobs
+JOBS_RESULT_TTL = 600
+# Seconds a job may run before it is cancelled, 0 for no limit. A request may ask
+# for a shorter deadline with the timeout parameter
+JOBS_MAX_DURATION = 0
+# Seconds a cancelled job has to stop between two files before it is killed
+JOBS_STOP_TIMEOUT = 10
+# Remove the output folder of cancelled jobs instead of keeping it with an incomplete manifest
+JOBS_CLEANUP_CANCELLED = False
+# Cancel a job when the client waiting for it disconnects and nobody else follows it
+JOBS_CANCEL_ON_DISCONNECT = False
+# Seconds between two checks of a job run by the workers of the shared job queue
+# (rest_api.py --job_queue_path) while a request waits for it
+QUEUE_POLL_INTERVAL = 1
+# Bytes of a request body written to the debug log, the rest is left out
+DEBUG_LOG_MAX_BODY = 1024
+# Size of the chunks of job downloads (GET /jobs/{id}/download) in bytes
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Job events (GET /jobs/{id}/events), minimum seconds between two progress events
+# sent to a client, changes in between are coalesced
+EVENTS_MIN_INTERVAL = 0.5
+# Seconds without changes before sending a keep-alive comment
+EVENTS_KEEPALIVE = 15
+# Failure events queued for a slow client before dropping them
+EVENTS_MAX_QUEUED_FAILURES = 100
+
+# Fair-share scheduler of /images jobs. Jobs run in chunks of files, each chunk
+# needs one of the worker slots and a job is preempted between chunks
+SCHEDULER_SLOTS = 4
+SCHEDULER_CHUNK_SIZE = 256
+# Slots a user can hold at the same time, overridden per user in USER_QUOTAS
+SCHEDULER_DEFAULT_QUOTA = 2
+USER_QUOTAS = {}
+# Share of the slots of each priority class relative to the others
+PRIORITY_WEIGHTS = {
+    'interactive': 8,
+    'normal': 4,
+    'batch': 1
+}
+DEFAULT_PRIORITY = 'normal'
@@ -0,0 +1,302 @@
+"""
+    Author:
+        Joan Pont
+
+    Copyright:
+        Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import time
+import uuid
+import asyncio
+from collections import deque
+from datetime import datetime
+
+# Seconds of history used to compute the current rate of a job
+RATE_WINDOW = 10
+# Minimum seconds between two samples of the rate history
+RATE_SAMPLE_INTERVAL = 0.5
+# Most recent failures kept in the job description
+RECENT_FAILURES = 20
+CANCEL_MESSAGES = {
+    'cancelled': 'Job cancelled',
+    'timeout': 'Job cancelled, deadline exceeded',
+    'disconnected': 'Job cancelled, the client disconnected'
+}
+
+
+class JobSubscription(object):
+    '''
+    Changes of a job for one client. Progress updates are coalesced into a
+    single flag, a slow client only gets the latest state. Failures are
+    queued up to a bound, the ones beyond it are counted as dropped.
+    '''
+
+    def __init__(self, max_failures):
+        '''
+        Parameters:
+            max_failures (int): failures queued before dropping them
+        '''
+        self._max_failures = max_failures
+        self._changed = asyncio.Event()
+        self._failures = deque()
+        self.dropped = 0
+
+    def notify(self, failure = None):
+        '''Record a change of the job'''
+        if failure is not None:
+            if len(self._failures) < self._max_failures:
+                self._failures.append(failure)
+            else:
+                self.dropped += 1
+        self._changed.set()
+
+    async def wait(self, timeout):
+        '''Wait for a change, return False on timeout'''
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._changed.clear()
+        return True
+
+    def take_failures(self):
+        '''Get and forget the queued failures'''
+        failures = list(self._failures)
+        self._failures.clear()
+        return failures
+
+
+class Job(object):
+    '''A scaling job started through the REST API and the folder it produces'''
+
+    def __init__(self, user_id, params, output_path, key = None):
+        '''
+        Parameters:
+            user_id (str): user that started the job
+            params (dict): request parameters
+            output_path (str): path where the job output folder is created
+            key (str): identical requests share the same key, None if the job can not be shared
+        '''
+        self.id = uuid.uuid1().hex
+        # Users allowed to follow the job, the ones whose identical request attached to it
+        self.users = {user_id}
+        self.params = params
+        self.key = key
+        # Task running the job and its place in the scheduler
+        self.task = None
+        self.ticket = None
+        self.priority = None
+        # Requests waiting for the end of the job
+        self.waiting = 0
+        # Reason of the cancellation ('cancelled', 'timeout' or 'disconnected'), set to stop the job
+        self.cancelled = None
+        self.stop = asyncio.Event()
+        # Remove the output folder once the cancelled job stopped
+        self.cleanup = False
+        self.finished_at = None
+        self.output_folder = 'output-'+self.id
+        self.path_to_output_folder = os.path.join(output_path, self.output_folder)
+        self.status = 'running'
+        self.message = None
+        # Exit status of the scaling script once it ended
+        self.exit_status = None
+        self.created = datetime.utcnow().isoformat()+'Z'
+        self.finished = None
+
+        # Progress reported by run.py
+        self.total = None
+        self.done = 0
+        self.failed = 0
+        self.recent_failures = deque(maxlen = RECENT_FAILURES)
+        # (time, files processed) samples over the last RATE_WINDOW seconds
+        self._samples = deque([(time.monotonic(), 0)])
+        self._subscriptions = set()
+
+    def subscribe(self, max_failures):
+        '''Follow the changes of the job'''
+        subscription = JobSubscription(max_failures)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        '''Stop following the changes of the job'''
+        self._subscriptions.discard(subscription)
+
+    def notify(self, failure = None):
+        '''Tell every subscription the job changed'''
+        for subscription in self._subscriptions:
+            subscription.notify(failure)
+
+    def update(self, event):
+        '''
+        Apply a progress event printed by run.py --progress
+
+        Parameters:
+            event (dict): 'total', 'done', 'failed' or 'end' event
+        '''
+        failure = None
+        if event.get('event') == 'total':
+            self.total = event['total']
+        elif event.get('event') == 'done':
+            self.done += 1
+        elif event.get('event') == 'failed':
+            self.failed += 1
+            failure = {key: event.get(key) for key in ('filename', 'reason', 'message')}
+            self.recent_failures.append(failure)
+        else:
+            return
+
+        now = time.monotonic()
+        if now - self._samples[-1][0] >= RATE_SAMPLE_INTERVAL:
+            self._samples.append((now, self.done + self.failed))
+            while now - self._samples[0][0] > RATE_WINDOW and len(self._samples) > 2:
+                self._samples.popleft()
+        self.notify(failure)
+
+    @property
+    def remaining(self):
+        '''Files left to process, None until the total is known'''
+        if self.total is None:
+            return None
+        return max(0, self.total - self.done - self.failed)
+
+    def rate(self):
+        '''Files processed per second over the last RATE_WINDOW seconds'''
+        now = time.monotonic()
+        since, processed = self._samples[0]
+        if now - since <= 0:
+            return 0.0
+        return (self.done + self.failed - processed) / (now - since)
+
+    def cancel(self, reason):
+        '''
+        Ask the running job to stop between two files
+
+        Parameters:
+            reason (str): 'cancelled', 'timeout' or 'disconnected'
+
+        Return:
+            False if the job was not running
+        '''
+        if self.status != 'running':
+            return False
+        if self.cancelled is None:
+            self.cancelled = reason
+            self.stop.set()
+            self.notify()
+        return True
+
+    def finish(self, success, message = None):
+        '''Record the end of the job'''
+        if self.cancelled is not None:
+            self.status = 'cancelled'
+            message = CANCEL_MESSAGES[self.cancelled]
+        else:
+            self.status = 'done' if success else 'failed'
+        self.message = message
+        self.finished = datetime.utcnow().isoformat()+'Z'
+        self.finished_at = time.monotonic()
+        self.notify()
+
+    def progress(self):
+        '''Current progress of the job'''
+        rate = self.rate()
+        eta = None
+        if self.status == 'running' and self.total is not None and rate > 0:
+            eta = self.remaining / rate
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'files_per_second': round(rate, 2),
+            'eta_seconds': None if eta is None else round(eta, 1),
+            'priority': self.priority,
+            'queue_position': self.ticket.position() if self.ticket is not None else None
+        }
+
+    def to_dict(self):
+        '''Job description sent to clients'''
+        return {
+            **self.progress(),
+            'message': self.message,
+            'cancelled': self.cancelled,
+            'exit_status': self.exit_status,
+            'output_folder': self.output_folder,
+            'created': self.created,
+            'finished': self.finished,
+            'recent_failures': list(self.recent_failures)
+        }
+
+
+class JobRegistry(object):
+    '''In-memory registry of the jobs of the server'''
+
+    def __init__(self, max_finished, result_ttl):
+        '''
+        Parameters:
+            max_finished (int): finished jobs kept, the oldest ones are forgotten
+            result_ttl (float): seconds a finished job is reused by identical requests, 0 to never reuse it
+        '''
+        self._max_finished = max_finished
+        self._result_ttl = result_ttl
+        # Insertion ordered, the oldest job first
+        self._jobs = {}
+        # {key: job id} of the latest job of every key
+        self._by_key = {}
+
+    def create(self, user_id, params, output_path, key = None):
+        '''Register a new running job'''
+        job = Job(user_id, params, output_path, key)
+        self._jobs[job.id] = job
+        if key is not None:
+            self._by_key[key] = job.id
+        self.forget_oldest()
+        return job
+
+    def get(self, job_id, user_id = None):
+        '''Get a job, None if unknown or not shared with the user'''
+        job = self._jobs.get(job_id)
+        if job is None or (user_id is not None and user_id not in job.users):
+            return None
+        return job
+
+    def find(self, key, user_id):
+        '''
+        Get the job of an identical request, either still running or finished
+        successfully less than result_ttl seconds ago with its output in place.
+        The user is allowed to follow it.
+
+        Parameters:
+            key (str): key of the request
+            user_id (str): user sending the request
+
+        Return:
+            Job, None if the request has to run
+        '''
+        job = self._jobs.get(self._by_key.get(key))
+        if job is None:
+            return None
+        if job.status == 'done':
+            expired = time.monotonic() - job.finished_at > self._result_ttl
+            if expired or not os.path.isdir(job.path_to_output_folder):
+                job = None
+        elif job.status != 'running':
+            job = None
+
+        if job is None:
+            del self._by_key[key]
+            return None
+        job.users.add(user_id)
+        return job
+
+    def forget_oldest(self):
+        '''Keep at most max_finished finished jobs'''
+        finished = [job_id for job_id, job in self._jobs.items() if job.status != 'running']
+        for job_id in finished[:max(0, len(finished)-self._max_finished)]:
+            job = self._jobs.pop(job_id)
+            if job.key is not None and self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
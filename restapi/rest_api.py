@@ -16,8 +16,14 @@ import sys
 import argparse
 import json
 import time
+import logging
+import shutil
 import jwt
+import base64
+import hashlib
 import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from datetime import (
     datetime,
     timedelta
@@ -29,7 +35,10 @@ from tornado.web import (
     URLSpec,
     HTTPError,
     MissingArgumentError,
+    stream_request_body,
 )
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
 
 path_to_self = os.path.join(os.path.dirname(__file__))
 path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
@@ -39,9 +48,26 @@ from token_check_handler import (
     TokenCheckHandler
 )
 from json_payload_conversion_handler import JSONPayloadConversionHandler
+from jobs import JobRegistry
 from importlib import reload
 import config
-import subprocess
+from core.validation import DatasetValidator
+from core.image_annotations import ImageAnnotations
+from core.path_consistensy import InputOutputPathConsistensy
+from core.archive import TarStream, zip_chunks
+from core.fingerprint import input_fingerprint
+from core.scheduler import FairShareScheduler
+from core.job_queue import JobQueue
+from core.profiles import PROFILES, get_profile
+from core.image_cache import DecodedImageCache
+from core.output_sink import AtomicFileSink
+from core.batch_stream import (
+    TarStreamParser,
+    MultipartStreamParser,
+    PairAssembler,
+    multipart_boundary
+)
+from core.custom_exceptions import UnvalidAnnotationsFile, UnvalidBatchUpload, NoSuchPath
 
 #For debugging
 import traceback
@@ -54,6 +80,25 @@ args = {}
 
 PYTHON3_9 = sys.version_info[0] == 3 and sys.version_info[1] == 9
 
+# Bounded CPU executor for in-memory scaling. Pillow releases the GIL
+# while decoding, resizing and encoding so threads scale over cores
+scale_executor = ThreadPoolExecutor(max_workers = config.SCALE_EXECUTOR_WORKERS)
+
+# Source images decoded for POST /scale requests naming a file of the server
+image_cache = DecodedImageCache(max_bytes = config.IMAGE_CACHE_MAX_BYTES)
+
+# Worker slots shared by the /images jobs
+scheduler = FairShareScheduler(slots = config.SCHEDULER_SLOTS,
+                               default_quota = config.SCHEDULER_DEFAULT_QUOTA,
+                               quotas = config.USER_QUOTAS)
+
+# Jobs started through /images
+jobs = JobRegistry(max_finished = config.JOBS_MAX_FINISHED, result_ttl = config.JOBS_RESULT_TTL)
+
+# Job queue shared with other instances, /images jobs are run by script/worker.py
+# processes instead of this instance when set (--job_queue_path)
+job_queue = None
+
 # ----------------------------------------------------------------
 def debug_log_prepare(handler):
     """Log message received before process it
@@ -62,11 +107,16 @@ def debug_log_prepare(handler):
         handler (ptr): Caller function 
 
     """
+    # Formatting the request is not free, skip it unless it gets logged
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     name = type(handler).__name__
+    body = handler.request.body
     logger.debug(f'{name} > Request Received : {handler.request}')
     logger.debug(f'{name} > Headers : {handler.request.headers}')
     logger.debug(f'{name} > Arguments: {handler.request.arguments}')
-    logger.debug(f'{name} > Body: {handler.request.body}')
+    logger.debug(f'{name} > Body: {body[:config.DEBUG_LOG_MAX_BODY]}'
+                 + (f' ({len(body)} bytes)' if len(body) > config.DEBUG_LOG_MAX_BODY else ''))
 
 
 # ----------------------------------------------------------------
@@ -77,6 +127,8 @@ def debug_log_onfinish(handler):
         handler (ptr): Caller function 
 
     """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     name = type(handler).__name__
     logger.debug(f'{name} > Response Code : {handler._status_code}')
     logger.debug(f'{name} > Write buffer  : {handler._write_buffer}')
@@ -193,6 +245,48 @@ def extract_parameters(handler, expected_param):
                 params[p] = expected_param[p]
     return params 
 
+# ----------------------------------------------------------------
+def parse_bool(value):
+    """
+    Parse a boolean parameter that may come as a string from the query arguments
+
+    Parameters:
+        value (bool or str): parameter value
+
+    Return:
+        bool
+    """
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+# ----------------------------------------------------------------
+def parse_range(range_header, size):
+    """
+    Parse a single byte range of a Range header
+
+    Parameters:
+        range_header (str): Range header, i.e. 'bytes=0-499', 'bytes=500-' or 'bytes=-500'
+        size (int): size of the resource
+
+    Return:
+        Tuple of (start, end) with end exclusive, None to send the whole resource.
+        Raises ValueError if the range can not be satisfied
+    """
+    unit, _, ranges = range_header.partition('=')
+    if unit.strip() != 'bytes' or ',' in ranges:
+        # Other units and multiple ranges are not supported, the whole resource is sent
+        return None
+    first, _, last = ranges.strip().partition('-')
+    if first == '':
+        start, end = max(0, size - int(last)), size
+    else:
+        start = int(first)
+        end = size if last == '' else min(int(last) + 1, size)
+    if start >= size or start >= end:
+        raise ValueError(f'Unsatisfiable range {range_header}')
+    return start, end
+
 # ----------------------------------------------------------------
 # ----------------------------------------------------------------
 class HomeHandler(RequestHandler):
@@ -257,6 +351,200 @@ class AuthorizationHandler(JSONPayloadConversionHandler):
         except Exception as e:
             handle_exceptions(self,e)
 
+# ----------------------------------------------------------------
+async def run_job(job, command, timeout = 0):
+    """
+    Run the scaling script of a job without blocking the server. The script
+    waits for a grant on its stdin before each chunk of files, grants are
+    handed out by the fair-share scheduler, and its progress is followed
+    from the JSON lines it prints. A cancelled job waiting for a slot gets
+    the end of its stdin and exits cleanly, one in the middle of a chunk gets
+    SIGTERM and stops once the file being scaled is written. Either way the
+    manifest is left incomplete, and the script is killed if it does not stop
+    within JOBS_STOP_TIMEOUT
+
+    Parameters:
+        job (Job): job to run, with its scheduler ticket
+        command (list): command line of the script
+        timeout (float): seconds before the job is cancelled, 0 for no limit
+    """
+    deadline = None
+    if timeout > 0:
+        deadline = asyncio.get_running_loop().call_later(timeout, job.cancel, 'timeout')
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, "--progress", "--stepwise", "--chunk_size", f"{config.SCHEDULER_CHUNK_SIZE}",
+            stdin = asyncio.subprocess.PIPE, stdout = asyncio.subprocess.PIPE)
+        chunk_done = asyncio.Event()
+        # Set while the script scales a granted chunk, it is blocked reading stdin otherwise
+        in_chunk = False
+
+        async def follow():
+            async for line in process.stdout:
+                try:
+                    event = json.loads(line)
+                    job.update(event)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    logger.warning(f'Job {job.id} > Unexpected output: {line[:200]}')
+                    continue
+                if event.get('event') == 'chunk':
+                    chunk_done.set()
+            # The script exited, maybe in the middle of a chunk
+            chunk_done.set()
+
+        async def stop_when_cancelled():
+            await job.stop.wait()
+            logger.info(f'Job {job.id} > Stopping ({job.cancelled})')
+            # A read of stdin is resumed after the signal, the end of stdin stops a waiting script
+            if in_chunk:
+                try:
+                    process.terminate()
+                except ProcessLookupError:
+                    return
+            try:
+                await asyncio.wait_for(process.wait(), config.JOBS_STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f'Job {job.id} > Killed, not stopped after {config.JOBS_STOP_TIMEOUT}s')
+                process.kill()
+
+        reader = asyncio.ensure_future(follow())
+        stopper = asyncio.ensure_future(stop_when_cancelled())
+        stopping = asyncio.ensure_future(job.stop.wait())
+        while not reader.done() and not job.stop.is_set() and job.remaining != 0:
+            cost = config.SCHEDULER_CHUNK_SIZE if job.remaining is None \
+                   else min(job.remaining, config.SCHEDULER_CHUNK_SIZE)
+            granted = scheduler.request(job.ticket, cost)
+            await asyncio.wait([granted, reader, stopping], return_when = asyncio.FIRST_COMPLETED)
+            if not granted.done():
+                # The script exited or the job was cancelled while waiting for a slot
+                scheduler.withdraw(job.ticket)
+                break
+            if job.stop.is_set():
+                scheduler.release(job.ticket)
+                break
+            try:
+                in_chunk = True
+                chunk_done.clear()
+                process.stdin.write(b'\n')
+                await process.stdin.drain()
+                await chunk_done.wait()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                in_chunk = False
+                scheduler.release(job.ticket)
+        stopping.cancel()
+
+        # End of stdin stops a script waiting for its next grant
+        process.stdin.close()
+        await reader
+        returncode = await process.wait()
+        job.exit_status = returncode
+        stopper.cancel()
+    except Exception as e:
+        debug_log_Exception(job, e)
+        job.finish(False, str(e))
+        return
+    finally:
+        if deadline is not None:
+            deadline.cancel()
+
+    if job.cancelled is not None and job.cleanup:
+        await IOLoop.current().run_in_executor(
+            None, lambda: shutil.rmtree(job.path_to_output_folder, ignore_errors = True))
+
+    if returncode == 0:
+        job.finish(True)
+    else:
+        job.finish(False, f'Scaling script exited with status {returncode}')
+
+# ----------------------------------------------------------------
+async def get_queued_job(job_id, user_id):
+    """
+    Get a job of the shared job queue
+
+    Parameters:
+        job_id (str): id of the job
+        user_id (str): user asking for it
+
+    Return:
+        Job description, None if unknown, not submitted by the user or without a queue
+    """
+    if job_queue is None:
+        return None
+    job = await IOLoop.current().run_in_executor(None, job_queue.get, job_id)
+    if job is None or job['user_id'] != user_id:
+        return None
+    return job
+
+# ----------------------------------------------------------------
+async def wait_queued_job(handler, params, path_to_data, output_path):
+    """
+    Submit a scaling job to the shared job queue and answer the request,
+    once the job is queued or finished depending on the wait parameter
+
+    Parameters:
+        handler (ScaleHandler): handler of the request
+        params (dict): request parameters
+        path_to_data (str): path to the input data
+        output_path (str): path where the output folder is created
+    """
+    loop = IOLoop.current()
+    job = await loop.run_in_executor(
+        None, job_queue.submit, handler.current_user,
+        {'input_path': path_to_data,
+         'output_path': output_path,
+         'target_width': int(params['target_width']),
+         'target_height': int(params['target_height']),
+         'profile': params['profile']},
+        config.PRIORITY_WEIGHTS[params['priority']])
+    logger.info(f"ScaleHandler GET > Job {job['job_id']} queued in [{job_queue.path}]")
+
+    if not parse_bool(params['wait']):
+        handler.set_status(202)
+        handler.write({'message': 'data scaling queued', **job})
+        return
+
+    while job['status'] in ('queued', 'running'):
+        await asyncio.sleep(config.QUEUE_POLL_INTERVAL)
+        job = await loop.run_in_executor(None, job_queue.get, job['job_id'])
+
+    if job['status'] == 'cancelled':
+        handler.set_status(409)
+        handler.write({'message': job['message'], **job})
+    elif job['status'] != 'done':
+        raise Exception(job['message'])
+    else:
+        handler.write({'message': 'data successfully scaled',
+                       'job_id': job['job_id'],
+                       'output_folder': job['output_folder']})
+
+# ----------------------------------------------------------------
+def request_key(path_to_data, output_path, target_width, target_height, profile = ''):
+    """
+    Key of a scaling request, identical requests over unchanged input data
+    get the same key
+
+    Parameters:
+        path_to_data (str): path to the input data
+        output_path (str): path where the output folder is created
+        target_width (int or str): target width
+        target_height (int or str): target height
+        profile (str): name of the profile, '' for the Pillow defaults
+
+    Return:
+        Hexadecimal key, None if the input can not be fingerprinted
+    """
+    try:
+        normalized = [os.path.realpath(path_to_data), os.path.realpath(output_path),
+                      int(target_width), int(target_height), input_fingerprint(path_to_data)]
+        if profile:
+            normalized.append(profile)
+    except (OSError, ValueError):
+        # Left to the script to report
+        return None
+    return hashlib.blake2b(json.dumps(normalized).encode('utf-8'), digest_size = 16).hexdigest()
+
 # ----------------------------------------------------------------
 # ----------------------------------------------------------------
 class ScaleHandler(TokenCheckHandler, JSONPayloadConversionHandler):
@@ -272,10 +560,22 @@ class ScaleHandler(TokenCheckHandler, JSONPayloadConversionHandler):
     # ----------------------------------------------------------------
     def on_finish(self):
         debug_log_onfinish(self)
+
+    # ----------------------------------------------------------------
+    def on_connection_close(self):
+        self._disconnected = True
+        job = getattr(self, '_job', None)
+        if job is None or not self._cancel_on_disconnect:
+            return
+        # Only if nobody else waits for or follows the job
+        if job.waiting <= 1 and len(job.users) <= 1 and job.cancel('disconnected'):
+            logger.info(f'ScaleHandler > Client disconnected, job {job.id} cancelled')
         
     # ----------------------------------------------------------------
     async def get(self):
         ''' Scale images '''
+        self._job = None
+        self._disconnected = False
         try:
             params = extract_parameters(
                 handler = self, 
@@ -283,12 +583,31 @@ class ScaleHandler(TokenCheckHandler, JSONPayloadConversionHandler):
                                  'input_path': '',
                                  'output_path': '',
                                  'target_width': 284,
-                                 'target_height': 284
+                                 'target_height': 284,
+                                 'wait': True,
+                                 'priority': config.DEFAULT_PRIORITY,
+                                 'timeout': config.JOBS_MAX_DURATION,
+                                 'cancel_on_disconnect': config.JOBS_CANCEL_ON_DISCONNECT,
+                                 'profile': ''
                                  }
             )
             for p in params:
                 logger.debug(f'ScaleHandler GET > {p} = {params[p]}')
 
+            if params['priority'] not in config.PRIORITY_WEIGHTS:
+                raise HTTPError(status_code=400, reason=f"Priority must be one of {list(config.PRIORITY_WEIGHTS)}")
+            if params['profile'] and params['profile'] not in PROFILES:
+                raise HTTPError(status_code=400, reason=f"Profile must be one of {list(PROFILES)}")
+
+            # Requests may only shorten the deadline
+            try:
+                timeout = float(params['timeout'])
+            except ValueError:
+                raise HTTPError(status_code=400, reason="Timeout must be a number of seconds")
+            if config.JOBS_MAX_DURATION > 0:
+                timeout = config.JOBS_MAX_DURATION if timeout <= 0 else min(timeout, config.JOBS_MAX_DURATION)
+            self._cancel_on_disconnect = parse_bool(params['cancel_on_disconnect'])
+
             # Prepare paths to run script
             path_to_script = os.path.join(path_to_package, 'script/run.py')
 
@@ -302,19 +621,693 @@ class ScaleHandler(TokenCheckHandler, JSONPayloadConversionHandler):
             else:
                 output_path = path_to_data
             
-            # Run script
-            subprocess.run(["python3", f"{path_to_script}", 
-                            "--target_width", f"{params['target_width']}",
-                            "--target_height", f"{params['target_height']}",
-                            "--input_path", f"{path_to_data}",
-                            "--output_path", f"{output_path}"
-                            ], check = True)
+            if job_queue is not None:
+                # Run by the workers of the shared queue, on this node or another one
+                await wait_queued_job(self, params, path_to_data, output_path)
+                return
+
+            # Identical requests attach to the same job instead of redoing the work
+            key = await IOLoop.current().run_in_executor(
+                None, request_key, path_to_data, output_path, params['target_width'], params['target_height'],
+                params['profile'])
+            job = jobs.find(key, self.current_user) if key is not None else None
+            deduplicated = job is not None
+
+            if job is None:
+                # Each job writes to its own output folder so that it can be downloaded
+                job = jobs.create(self.current_user, params, output_path, key)
+
+                # Run script, chunk by chunk as the scheduler grants slots
+                job.priority = params['priority']
+                job.ticket = scheduler.ticket(self.current_user, config.PRIORITY_WEIGHTS[params['priority']])
+                job.task = asyncio.ensure_future(run_job(job, 
+                               ["python3", f"{path_to_script}", 
+                                "--target_width", f"{params['target_width']}",
+                                "--target_height", f"{params['target_height']}",
+                                "--input_path", f"{path_to_data}",
+                                "--output_path", f"{output_path}",
+                                "--output_folder", f"{job.output_folder}"
+                                ] + (["--profile", params['profile']] if params['profile'] else []), timeout))
+            else:
+                logger.info(f'ScaleHandler GET > Identical request, attached to job {job.id} ({job.status})')
+
+            if not parse_bool(params['wait']):
+                # Follow the job at /jobs/{id} or /jobs/{id}/events
+                self.set_status(202 if job.status == 'running' else 200)
+                message = 'data scaling started' if job.status == 'running' else 'data successfully scaled'
+                self.write({'message': message, 'deduplicated': deduplicated, **job.to_dict()})
+                return
+
+            # Shielded, the job goes on for the other requests attached to it
+            self._job = job
+            job.waiting += 1
+            try:
+                await asyncio.shield(job.task)
+            finally:
+                job.waiting -= 1
+            if self._disconnected:
+                return
+            if job.status == 'cancelled':
+                self.set_status(409)
+                self.write({'message': job.message, 'deduplicated': deduplicated, **job.to_dict()})
+                return
+            if job.status != 'done':
+                raise Exception(job.message)
                     
-            self.write({'message': f"data successfully scaled"})        
+            self.write({'message': f"data successfully scaled",
+                        'job_id': job.id,
+                        'output_folder': job.output_folder,
+                        'deduplicated': deduplicated})        
         except Exception as e:
             handle_exceptions(self,e)
 
 
+# ----------------------------------------------------------------
+# ----------------------------------------------------------------
+class JobHandler(TokenCheckHandler):
+    ''' Status of a scaling job '''
+
+    # ----------------------------------------------------------------
+    def prepare(self):
+        '''Check authorization'''
+        debug_log_prepare(self)
+        TokenCheckHandler.prepare(self)
+
+    # ----------------------------------------------------------------
+    def on_finish(self):
+        debug_log_onfinish(self)
+
+    # ----------------------------------------------------------------
+    async def get(self, job_id):
+        ''' Get job status '''
+        job = jobs.get(job_id, self.current_user)
+        if job is None:
+            queued = await get_queued_job(job_id, self.current_user)
+            if queued is None:
+                raise HTTPError(status_code=404, reason='Unknown job')
+            self.write(queued)
+            return
+        self.write(job.to_dict())
+
+    # ----------------------------------------------------------------
+    async def delete(self, job_id):
+        ''' Cancel a running job '''
+        job = jobs.get(job_id, self.current_user)
+        if job is None:
+            queued = await get_queued_job(job_id, self.current_user)
+            if queued is None:
+                raise HTTPError(status_code=404, reason='Unknown job')
+            if queued['status'] not in ('queued', 'running'):
+                raise HTTPError(status_code=409, reason=f"Job already {queued['status']}")
+            # A running job is stopped by its worker at its next heartbeat
+            self.write(await IOLoop.current().run_in_executor(None, job_queue.cancel, job_id))
+            return
+        if job.status != 'running':
+            raise HTTPError(status_code=409, reason=f'Job already {job.status}')
+
+        if len(job.users) > 1:
+            # Identical requests of other users are attached, the job goes on for them
+            job.users.discard(self.current_user)
+            self.write({'message': 'detached from job', 'job_id': job.id})
+            return
+
+        params = extract_parameters(handler = self, expected_param = {'cleanup': config.JOBS_CLEANUP_CANCELLED})
+        job.cleanup = parse_bool(params['cleanup'])
+        job.cancel('cancelled')
+        # The script stops between two files
+        await asyncio.shield(job.task)
+        self.write(job.to_dict())
+
+
+# ----------------------------------------------------------------
+# ----------------------------------------------------------------
+class JobEventsHandler(TokenCheckHandler):
+    '''
+    Server-Sent Events with the progress of a job. Progress events are
+    coalesced, a client gets at most one every EVENTS_MIN_INTERVAL seconds
+    and slow clients only get the latest state
+    '''
+
+    # ----------------------------------------------------------------
+    def prepare(self):
+        '''Check authorization'''
+        debug_log_prepare(self)
+        TokenCheckHandler.prepare(self)
+        self._closed = False
+        self._subscription = None
+
+    # ----------------------------------------------------------------
+    def on_finish(self):
+        debug_log_onfinish(self)
+
+    # ----------------------------------------------------------------
+    def on_connection_close(self):
+        self._closed = True
+        if self._subscription is not None:
+            # Wake the event loop up so that it notices
+            self._subscription.notify()
+
+    # ----------------------------------------------------------------
+    def write_event(self, event, data):
+        '''Write an event in the text/event-stream format'''
+        self.write(f'event: {event}\ndata: {json.dumps(data)}\n\n')
+
+    # ----------------------------------------------------------------
+    async def get(self, job_id):
+        ''' Follow job progress '''
+        job = jobs.get(job_id, self.current_user)
+        if job is None:
+            raise HTTPError(status_code=404, reason='Unknown job')
+
+        self.set_header('Content-Type', 'text/event-stream')
+        self.set_header('Cache-Control', 'no-cache')
+        # Proxies must not buffer the stream
+        self.set_header('X-Accel-Buffering', 'no')
+
+        self._subscription = job.subscribe(config.EVENTS_MAX_QUEUED_FAILURES)
+        try:
+            changed = True
+            while not self._closed:
+                if changed:
+                    for failure in self._subscription.take_failures():
+                        self.write_event('failure', failure)
+                    progress = job.progress()
+                    if self._subscription.dropped:
+                        progress['failure_events_dropped'] = self._subscription.dropped
+                    self.write_event('progress', progress)
+                    if job.status != 'running':
+                        self.write_event('end', job.to_dict())
+                        await self.flush()
+                        break
+                else:
+                    self.write(': keep-alive\n\n')
+
+                # A slow client holds the loop here, changes meanwhile are coalesced
+                await self.flush()
+                await asyncio.sleep(config.EVENTS_MIN_INTERVAL)
+                changed = await self._subscription.wait(config.EVENTS_KEEPALIVE)
+        except StreamClosedError:
+            pass
+        finally:
+            job.unsubscribe(self._subscription)
+
+# ----------------------------------------------------------------
+@dataclass
+class QueuedJobOutput:
+    ''' Output folder of a job of the shared job queue '''
+    status: str
+    output_folder: str
+    path_to_output_folder: str
+
+# ----------------------------------------------------------------
+# ----------------------------------------------------------------
+class JobDownloadHandler(TokenCheckHandler):
+    ''' Download the output folder of a job as a tar or zip archive built on the fly '''
+
+    # ----------------------------------------------------------------
+    def prepare(self):
+        '''Check authorization'''
+        debug_log_prepare(self)
+        TokenCheckHandler.prepare(self)
+
+    # ----------------------------------------------------------------
+    def on_finish(self):
+        debug_log_onfinish(self)
+
+    # ----------------------------------------------------------------
+    async def send(self, chunks):
+        '''
+        Send the chunks one by one, waiting for each one to be flushed to the
+        client so that at most one chunk is buffered whatever the archive size
+        '''
+        loop = IOLoop.current()
+        try:
+            while True:
+                # Files are read outside the IOLoop, the output may live on a network filesystem
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                self.write(chunk)
+                await self.flush()
+        except StreamClosedError:
+            logger.info(f'JobDownloadHandler > Client closed the download')
+        finally:
+            chunks.close()
+
+    # ----------------------------------------------------------------
+    async def download(self, job_id, include_body):
+        ''' Download job output '''
+        job = jobs.get(job_id, self.current_user)
+        if job is None:
+            queued = await get_queued_job(job_id, self.current_user)
+            if queued is None:
+                raise HTTPError(status_code=404, reason='Unknown job')
+            job = QueuedJobOutput(queued['status'], queued['output_folder'],
+                                  os.path.join(queued['params']['output_path'], queued['output_folder']))
+        if job.status != 'done':
+            raise HTTPError(status_code=409, reason=f'Job is {job.status}')
+
+        format = self.get_argument('format', 'tar')
+        if format not in ('tar', 'zip'):
+            raise HTTPError(status_code=400, reason='Format must be tar or zip')
+        self.set_header('Content-Disposition', f'attachment; filename="{job.output_folder}.{format}"')
+
+        if format == 'zip':
+            # Size unknown upfront, sent with chunked transfer encoding
+            self.set_header('Content-Type', 'application/zip')
+            if include_body:
+                await self.send(zip_chunks(job.path_to_output_folder, job.output_folder, config.DOWNLOAD_CHUNK_SIZE))
+            return
+
+        archive = await IOLoop.current().run_in_executor(None, TarStream, job.path_to_output_folder, job.output_folder)
+        self.set_header('Content-Type', 'application/x-tar')
+        self.set_header('Accept-Ranges', 'bytes')
+        self.set_header('Etag', f'"{archive.etag}"')
+
+        start, end = 0, archive.size
+        range_header = self.request.headers.get('Range')
+        if_range = self.request.headers.get('If-Range')
+        # A resumed download only gets a range if the output did not change meanwhile
+        if range_header is not None and (if_range is None or if_range.strip('"') == archive.etag):
+            try:
+                byte_range = parse_range(range_header, archive.size)
+            except ValueError:
+                # Not raised as HTTPError, error pages drop the Content-Range header
+                self.set_status(416)
+                self.set_header('Content-Range', f'bytes */{archive.size}')
+                self.clear_header('Content-Disposition')
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                self.set_status(206)
+                self.set_header('Content-Range', f'bytes {start}-{end-1}/{archive.size}')
+
+        self.set_header('Content-Length', end - start)
+        if include_body:
+            await self.send(archive.chunks(start, end, config.DOWNLOAD_CHUNK_SIZE))
+
+    # ----------------------------------------------------------------
+    async def get(self, job_id):
+        await self.download(job_id, include_body = True)
+
+    # ----------------------------------------------------------------
+    async def head(self, job_id):
+        await self.download(job_id, include_body = False)
+
+
+# ----------------------------------------------------------------
+# ----------------------------------------------------------------
+class ValidateHandler(TokenCheckHandler, JSONPayloadConversionHandler):
+    ''' Validate images and annotations without scaling them '''
+
+    # ----------------------------------------------------------------
+    def prepare(self):
+        '''Check authorization'''
+        debug_log_prepare(self)
+        JSONPayloadConversionHandler.prepare(self)
+        TokenCheckHandler.prepare(self)
+
+    # ----------------------------------------------------------------
+    def on_finish(self):
+        debug_log_onfinish(self)
+
+    # ----------------------------------------------------------------
+    async def get(self):
+        ''' Validate data '''
+        try:
+            params = extract_parameters(
+                handler = self, 
+                expected_param = {
+                                 'input_path': '',
+                                 'check_jpeg': False,
+                                 'workers': 0
+                                 }
+            )
+            for p in params:
+                logger.debug(f'ValidateHandler GET > {p} = {params[p]}')
+
+            if params['input_path'] == '':
+                path_to_data = os.path.join(path_to_package, 'data')
+            else:
+                path_to_data = params['input_path']
+
+            # Workers are spawned (not forked) since the server is multithreaded
+            validator = DatasetValidator(path_to_data,
+                                         check_jpeg = parse_bool(params['check_jpeg']),
+                                         workers = int(params['workers']),
+                                         mp_context = multiprocessing.get_context('spawn'))
+            violations = await IOLoop.current().run_in_executor(None, validator.run)
+
+            self.write({'message': f"data successfully validated",
+                        'pairs': validator.pairs,
+                        'valid': validator.valid,
+                        'violations': violations})
+        except Exception as e:
+            handle_exceptions(self,e)
+
+
+# ----------------------------------------------------------------
+def scale_in_memory(image_bytes, annotations_text, target_width, target_height, profile = None):
+    """
+    Scale a pair of encoded image and annotations without touching the filesystem
+
+    Parameters:
+        image_bytes (bytes): encoded image
+        annotations_text (str): annotations file content
+        target_width (int): target width to scale the image
+        target_height (int): target height to scale the image
+        profile (ScaleProfile): resampling and encoding settings, Pillow defaults if None
+
+    Return:
+        Tuple of (encoded scaled image, list of scaled annotations)
+    """
+    img_ann = ImageAnnotations.from_bytes(image_bytes, annotations_text)
+    img_ann.scale(target_width = target_width, target_height = target_height, profile = profile)
+    return img_ann.encode(), img_ann.scaled_annotations
+
+# ----------------------------------------------------------------
+def scale_cached(path_to_image, path_to_annotations, target_width, target_height, profile = None):
+    """
+    Scale a pair of image and annotations file of the server, decoded
+    once and kept in the image cache for the next requests
+
+    Parameters:
+        path_to_image (str): path to the image
+        path_to_annotations (str): path to the annotations file
+        target_width (int): target width to scale the image
+        target_height (int): target height to scale the image
+        profile (ScaleProfile): resampling and encoding settings, Pillow defaults if None
+
+    Return:
+        Tuple of (encoded scaled image, list of scaled annotations)
+    """
+    img_ann = ImageAnnotations(image_cache.image(path_to_image), image_cache.annotations(path_to_annotations))
+    img_ann.scale(target_width = target_width, target_height = target_height, profile = profile)
+    return img_ann.encode(), img_ann.scaled_annotations
+
+# ----------------------------------------------------------------
+# ----------------------------------------------------------------
+class InMemoryScaleHandler(TokenCheckHandler, JSONPayloadConversionHandler):
+    ''' Scale a single image and its annotations sent in the request '''
+
+    # Requests waiting for or running in the executor
+    pending = 0
+
+    # ----------------------------------------------------------------
+    def prepare(self):
+        '''Check authorization'''
+        debug_log_prepare(self)
+        TokenCheckHandler.prepare(self)
+
+    # ----------------------------------------------------------------
+    def on_finish(self):
+        debug_log_onfinish(self)
+
+    # ----------------------------------------------------------------
+    def read_input(self):
+        '''
+        Get the encoded image and annotations from a multipart/form-data body
+        (fields 'image' and 'annotations') or from a raw image body with the
+        annotations in the 'annotations' argument
+        '''
+        if 'image' in self.request.files:
+            image_bytes = self.request.files['image'][0]['body']
+        elif self.request.headers.get('Content-Type', '').startswith('image/'):
+            image_bytes = self.request.body
+        else:
+            raise HTTPError(status_code=400, reason='Missing image')
+
+        if 'annotations' in self.request.files:
+            annotations_text = self.request.files['annotations'][0]['body'].decode('utf-8')
+        else:
+            annotations_text = self.get_argument('annotations')
+        return image_bytes, annotations_text
+
+    # ----------------------------------------------------------------
+    def server_pair(self, params):
+        '''
+        Get the paths to a pair of image and annotations file of the server,
+        named by the 'filename' argument in the 'input_path' dataset
+        '''
+        if os.path.basename(params['filename']) != params['filename']:
+            raise HTTPError(status_code=400, reason='Filename must not contain a path')
+        path_to_data = params['input_path'] if params['input_path'] != '' \
+                       else os.path.join(path_to_package, 'data')
+        return (os.path.join(path_to_data, 'images', params['filename']+'.jpg'),
+                os.path.join(path_to_data, 'annotations', params['filename']+'.txt'))
+
+    # ----------------------------------------------------------------
+    async def post(self):
+        ''' Scale image and annotations '''
+        try:
+            params = extract_parameters(
+                handler = self, 
+                expected_param = {
+                                 'target_width': 284,
+                                 'target_height': 284,
+                                 'format': 'json',
+                                 'profile': '',
+                                 'input_path': '',
+                                 'filename': ''
+                                 }
+            )
+            try:
+                profile = get_profile(params['profile'])
+            except ValueError as e:
+                raise HTTPError(status_code=400, reason=str(e))
+            if params['filename']:
+                scale, scale_args = scale_cached, self.server_pair(params)
+            else:
+                scale, scale_args = scale_in_memory, self.read_input()
+
+            if InMemoryScaleHandler.pending >= config.SCALE_MAX_PENDING:
+                raise HTTPError(status_code=503, reason='Too many scaling requests')
+
+            InMemoryScaleHandler.pending += 1
+            try:
+                scaled_image, scaled_annotations = await IOLoop.current().run_in_executor(
+                    scale_executor, scale, *scale_args,
+                    int(params['target_width']), int(params['target_height']), profile)
+            except (UnvalidAnnotationsFile, OSError) as e:
+                # Unvalid input is answered right away, it is not a server error
+                raise HTTPError(status_code=400, reason=str(e))
+            finally:
+                InMemoryScaleHandler.pending -= 1
+
+            if params['format'] == 'jpeg':
+                self.set_header('Content-Type', 'image/jpeg')
+                self.set_header('X-Scaled-Annotations', json.dumps(scaled_annotations))
+                self.write(scaled_image)
+            else:
+                self.write({'annotations': scaled_annotations,
+                            'image': base64.b64encode(scaled_image).decode('ascii')})
+        except HTTPError as e:
+            if e.status_code in (400, 503):
+                debug_log_HTTPException(self, e)
+                raise
+            handle_exceptions(self,e)
+        except Exception as e:
+            handle_exceptions(self,e)
+
+# ----------------------------------------------------------------
+def scale_and_write(image_bytes, annotations_bytes, path_to_scaled_image, path_to_scaled_annotations,
+                    target_width, target_height, profile = None, sink = None):
+    """
+    Scale a pair of encoded image and annotations and store the result
+
+    Parameters:
+        image_bytes (bytes): encoded image
+        annotations_bytes (bytes): annotations file content
+        path_to_scaled_image (str): path to scaled image
+        path_to_scaled_annotations (str): path to scaled annotations
+        target_width (int): target width to scale the image
+        target_height (int): target height to scale the image
+        profile (ScaleProfile): resampling and encoding settings, Pillow defaults if None
+        sink (AtomicFileSink): sink of the batch, the files keep a temporary name until committed
+    """
+    img_ann = ImageAnnotations.from_bytes(image_bytes, annotations_bytes.decode('utf-8'),
+                                          path_to_scaled_image, path_to_scaled_annotations)
+    img_ann.scale(target_width = target_width, target_height = target_height, profile = profile)
+    img_ann.write(sink = sink)
+
+# ----------------------------------------------------------------
+# ----------------------------------------------------------------
+@stream_request_body
+class BatchUploadHandler(TokenCheckHandler):
+    '''
+    Scale a batch of images and annotations streamed in the request body,
+    either as a tar archive or as multipart/form-data files. Pairs are
+    scaled as soon as both files arrived, the body is never held in memory.
+    Scaled files keep a temporary name until the whole batch is received,
+    they are removed if the upload is interrupted
+    '''
+
+    # Batches being uploaded
+    active = 0
+
+    # ----------------------------------------------------------------
+    def prepare(self):
+        '''Check authorization and limits, choose the body parser'''
+        debug_log_prepare(self)
+        TokenCheckHandler.prepare(self)
+        self._counted = False
+
+        content_length = self.request.headers.get('Content-Length')
+        if content_length is not None and int(content_length) > config.UPLOAD_MAX_BODY_SIZE:
+            raise HTTPError(status_code=413, reason='Batch too large')
+        if BatchUploadHandler.active >= config.UPLOAD_MAX_CONCURRENT:
+            raise HTTPError(status_code=503, reason='Too many batch uploads')
+        self.request.connection.set_max_body_size(config.UPLOAD_MAX_BODY_SIZE)
+
+        content_type = self.request.headers.get('Content-Type', '')
+        try:
+            if content_type.startswith('multipart/form-data'):
+                self._parser = MultipartStreamParser(multipart_boundary(content_type), config.UPLOAD_MAX_FILE_SIZE)
+            elif content_type.startswith(('application/x-tar', 'application/tar')):
+                self._parser = TarStreamParser(config.UPLOAD_MAX_FILE_SIZE)
+            else:
+                raise HTTPError(status_code=415, reason='Batch must be a tar archive or multipart/form-data')
+
+            params = extract_parameters(
+                handler = self, 
+                expected_param = {
+                                 'output_path': '',
+                                 'target_width': 284,
+                                 'target_height': 284,
+                                 'profile': ''
+                                 }
+            )
+            self._profile = get_profile(params['profile'])
+            self._target_width = int(params['target_width'])
+            self._target_height = int(params['target_height'])
+            output_path = params['output_path'] if params['output_path'] != '' \
+                          else os.path.join(path_to_package, 'data')
+            self._paths = InputOutputPathConsistensy(None, output_path, check_input = False)
+        except (UnvalidBatchUpload, NoSuchPath, ValueError) as e:
+            raise HTTPError(status_code=400, reason=str(e))
+
+        BatchUploadHandler.active += 1
+        self._counted = True
+        self._assembler = PairAssembler(config.UPLOAD_MAX_UNPAIRED, config.UPLOAD_MAX_UNPAIRED_BYTES)
+        self._inflight = []
+        self._scaled = 0
+        self._failed = []
+        self._error = None
+        self._sink = AtomicFileSink('batch')
+
+    # ----------------------------------------------------------------
+    def release(self):
+        '''Stop counting this batch as active'''
+        if getattr(self, '_counted', False):
+            BatchUploadHandler.active -= 1
+            self._counted = False
+
+    # ----------------------------------------------------------------
+    def on_finish(self):
+        self.release()
+        debug_log_onfinish(self)
+
+    # ----------------------------------------------------------------
+    def on_connection_close(self):
+        self.release()
+        if getattr(self, '_sink', None) is not None:
+            IOLoop.current().add_callback(self.discard)
+
+    # ----------------------------------------------------------------
+    async def discard(self):
+        '''Remove the scaled files of an interrupted batch, once its pairs being scaled are done'''
+        sink, self._sink = self._sink, None
+        while self._inflight:
+            await self.collect()
+        discarded = await IOLoop.current().run_in_executor(scale_executor, sink.discard)
+        logger.warning(f'BatchUploadHandler > Batch interrupted, {discarded} scaled files removed')
+
+    # ----------------------------------------------------------------
+    async def collect(self):
+        '''Wait for the oldest pair being scaled, any error only fails its pair'''
+        filename, future = self._inflight.pop(0)
+        try:
+            await future
+            self._scaled += 1
+        except Exception as e:
+            logger.error(f'BatchUploadHandler > {filename}: {e}')
+            self._failed.append({'filename': filename, 'reason': getattr(e, 'reason', type(e).__name__),
+                                 'message': str(e)})
+
+    # ----------------------------------------------------------------
+    async def data_received(self, chunk):
+        '''Parse the chunk and scale the pairs it completes'''
+        if self._error is not None or self._sink is None:
+            # The rest of a malformed or interrupted batch is drained and dropped
+            return
+        try:
+            for name, body in self._parser.feed(chunk):
+                pair = self._assembler.add(name, body)
+                if pair is None:
+                    continue
+                filename, image_bytes, annotations_bytes = pair
+                future = IOLoop.current().run_in_executor(
+                    scale_executor, scale_and_write, image_bytes, annotations_bytes,
+                    os.path.join(self._paths.path_to_scaled_images, filename+'.jpg'),
+                    os.path.join(self._paths.path_to_scaled_annotations, filename+'.txt'),
+                    self._target_width, self._target_height, self._profile, self._sink)
+                self._inflight.append((filename, future))
+                # Waiting here pauses reading the body, memory stays bounded (see config.UPLOAD_*)
+                while len(self._inflight) >= config.UPLOAD_MAX_INFLIGHT:
+                    await self.collect()
+        except UnvalidBatchUpload as e:
+            logger.error(f'BatchUploadHandler > Unvalid batch: {e}')
+            self._error = e
+
+    # ----------------------------------------------------------------
+    async def post(self):
+        '''Wait for the last pairs and report'''
+        try:
+            while self._inflight:
+                await self.collect()
+            if self._error is None:
+                try:
+                    self._parser.close()
+                except UnvalidBatchUpload as e:
+                    self._error = e
+            # The pairs reported as scaled are in place
+            await IOLoop.current().run_in_executor(scale_executor, self._sink.commit)
+
+            result = {'output_folder': self._paths.path_to_output_folder,
+                      'scaled': self._scaled,
+                      'failed': self._failed,
+                      'unpaired': self._assembler.unpaired()}
+            if self._error is not None:
+                self.set_status(400)
+                result['message'] = str(self._error)
+            else:
+                result['message'] = 'batch successfully scaled'
+            self.write(result)
+        except Exception as e:
+            # Nothing is left under a temporary name
+            self._sink.discard()
+            handle_exceptions(self,e)
+
+# ----------------------------------------------------------------
+# ----------------------------------------------------------------
+class MetricsHandler(TokenCheckHandler):
+    ''' Metrics of the in-memory scaling '''
+
+    # ----------------------------------------------------------------
+    def prepare(self):
+        '''Check authorization'''
+        debug_log_prepare(self)
+        TokenCheckHandler.prepare(self)
+
+    # ----------------------------------------------------------------
+    def on_finish(self):
+        debug_log_onfinish(self)
+
+    # ----------------------------------------------------------------
+    def get(self):
+        self.write({'image_cache': image_cache.metrics,
+                    'scale_pending': InMemoryScaleHandler.pending})
+
 # ----------------------------------------------------------------
 # ----------------------------------------------------------------
 
@@ -333,7 +1326,21 @@ def make_app():
         URLSpec(r'^/auth$', \
                 AuthorizationHandler, name='auth'),
         URLSpec(r'^/images', \
-                ScaleHandler, name='scale')
+                ScaleHandler, name='scale'),
+        URLSpec(r'^/validate$', \
+                ValidateHandler, name='validate'),
+        URLSpec(r'^/scale$', \
+                InMemoryScaleHandler, name='scale_in_memory'),
+        URLSpec(r'^/batch$', \
+                BatchUploadHandler, name='batch'),
+        URLSpec(r'^/metrics$', \
+                MetricsHandler, name='metrics'),
+        URLSpec(r'^/jobs/([0-9a-f]+)$', \
+                JobHandler, name='job'),
+        URLSpec(r'^/jobs/([0-9a-f]+)/download$', \
+                JobDownloadHandler, name='job_download'),
+        URLSpec(r'^/jobs/([0-9a-f]+)/events$', \
+                JobEventsHandler, name='job_events')
     ]
     return Application(urls, **settings)
 
@@ -352,6 +1359,15 @@ def process_arguments():
                         choices = ["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"],
                         help = "Set logging level")
 
+    parser.add_argument('--job_queue_path',
+                        nargs   = '?',
+                        dest    = 'job_queue_path',
+                        help    = 'path to a SQLite job queue shared with other instances, /images jobs are '\
+                                  'then run by script/worker.py processes instead of this instance',
+                        type    = str,
+                        default = None
+    )
+
     parser.add_argument('--rest_api_port',
                         nargs   = '?',
                         metavar = 'REST_API_PORT',
@@ -373,6 +1389,11 @@ async def main():
     logger.setLevel(args.log_level)
     logger.info(f'Parsed command arguments: {args}')
 
+    if args.job_queue_path is not None:
+        global job_queue
+        job_queue = JobQueue(args.job_queue_path)
+        logger.info(f'Jobs queued in [{args.job_queue_path}]')
+
     app = make_app()
     app.listen(args.rest_api_port)
     shutdown_event = asyncio.Event()
@@ -12,11 +12,28 @@ Copyright:
 """
 
 import os
+import sys
+import json
+import time
+import signal
 import argparse
 import traceback
+from functools import partial
 from core.image_annotations import ImageAnnotations
 from core.path_consistensy import InputOutputPathConsistensy
-from core.custom_exceptions import NoSuchPath, UnvalidAnnotationsFile, UnvalidKittiFolderFormat
+from core.dataset_index import DatasetIndex, default_index_path
+from core.failure_report import FailureReport, ON_ERROR_POLICIES
+from core.validation import DatasetValidator
+from core.manifest import RunManifest
+from core.sharding import shard_of, select_shard, manifest_path, merge_shards
+from core.watcher import InputWatcher
+from core.exporters import EXPORT_FORMATS, open_exporters
+from core.resize import RESIZE_BACKENDS
+from core.profiles import PROFILES, get_profile
+from core.frame_dedup import LINK_METHODS, FrameDeduplicator
+from core.parallel_scale import ParallelScaler
+from core.output_sink import DURABILITY_LEVELS, OUTPUT_SINKS, WRITE_BUFFER_SIZE, open_sink
+from core.custom_exceptions import NoSuchPath, UnvalidKittiFolderFormat
 from utils import custom_logger
 
 logger = custom_logger(__file__)
@@ -24,6 +41,17 @@ logger = custom_logger(__file__)
 path_to_self = os.path.join(os.path.dirname(__file__))
 path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
 
+# Set on SIGTERM, the run stops between two files
+stop_requested = False
+# Export sinks (--export) fed along with the Kitti output
+exporters = []
+# Scaled images by digest of their input image (--dedup)
+deduplicator = None
+# Worker processes scaling the pairs (--scale_workers)
+scaler = None
+# Sink of the scaled files (--output_sink, --durability)
+sink = None
+
 # ----------------------------------------------------------------
 def debug_log_Exception(e):
     """Log missing argument exception
@@ -33,9 +61,506 @@ def debug_log_Exception(e):
     """
     logger.error(f'Exception Type: {type(e)}')
     logger.error(f'Exception message: {e}')
-    logger.error(traceback.format_exc())
+    # Also called outside of the except clause, i.e. for errors of the worker processes
+    logger.error(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
     raise e
 
+# ----------------------------------------------------------------
+def request_stop(signum, frame):
+    """Stop the run once the file being scaled is written, the manifest is
+    then left incomplete. Nothing is logged here: the interrupted thread may
+    hold the lock of the log queue, the loops log the stop instead
+
+    Parameters:
+        signum (int): received signal
+        frame (frame): interrupted frame
+    """
+    global stop_requested
+    stop_requested = True
+
+# ----------------------------------------------------------------
+def emit_progress(args, event, **fields):
+    """Print a progress event as a JSON line on stdout when --progress is set,
+    logs go to stderr so that both never mix
+
+    Parameters:
+        args (Namespace): parsed command arguments
+        event (str): 'total', 'done', 'failed' or 'end'
+        fields (dict): event fields
+    """
+    if args.progress:
+        print(json.dumps({'event': event, **fields}), flush = True)
+
+# ----------------------------------------------------------------
+def filter_by_classes(filenames, paths, args, path_to_data):
+    """Keep the filenames of the frames containing any of the requested classes.
+    Frames that can not be indexed are kept, so that scaling them reports the
+    error through the --on_error policy
+
+    Parameters:
+        filenames (list): unique ids for every pair of image and annotation files
+        paths (InputOutputPathConsistensy): input/output paths
+        args (Namespace): parsed command arguments
+        path_to_data (str): path to data
+
+    Return:
+        Filtered list of filenames
+    """
+    if args.index_path == None:
+        path_to_index = default_index_path(path_to_data)
+    else:
+        path_to_index = args.index_path
+
+    index = DatasetIndex(paths.path_to_images, paths.path_to_annotations, path_to_index)
+    updated = index.update()
+    index.save()
+    logger.info(f'Dataset index [{path_to_index}] up to date ({updated} frames reindexed)')
+
+    classes = [class_name.strip() for class_name in args.classes.split(',') if class_name.strip()]
+    selected = set(index.frames_with_classes(classes))
+    unindexed = set(index.invalid_frame_ids.tolist())
+    if unindexed:
+        logger.warning(f'{len(unindexed)} frames could not be indexed, they are kept to be reported on scaling')
+    filenames = [filename for filename in filenames if filename in selected or filename in unindexed]
+    logger.info(f'{len(filenames) - len(unindexed.intersection(filenames))} frames contain any of the classes {classes}')
+    return filenames
+
+# ----------------------------------------------------------------
+def scale_pairs(filenames, paths, args, manifest, failures):
+    """Scale and save pairs of image and annotations file following the 
+    --on_error policy
+
+    Parameters:
+        filenames (list): unique ids of the pairs
+        paths (InputOutputPathConsistensy): input/output paths
+        args (Namespace): parsed command arguments
+        manifest (RunManifest): manifest of the run
+        failures (FailureReport): failure report of the run
+
+    Return:
+        Tuple of (pairs succesfully scaled, pairs processed), fewer pairs are
+        processed than given if a stop was requested
+    """
+    scaled = 0
+    processed = 0
+
+    for filename, error in scale_results(filenames, paths, args):
+        processed += 1
+        if error is not None:
+            emit_progress(args, 'failed', filename = filename,
+                          reason = getattr(error, 'reason', type(error).__name__), message = str(error))
+            if args.on_error == 'abort':
+                failures.close()
+                debug_log_Exception(error)
+            failures.record(filename,
+                            os.path.join(paths.path_to_images, filename+'.jpg'),
+                            os.path.join(paths.path_to_annotations, filename+'.txt'),
+                            error
+                            )
+            manifest.add_failure(filename)
+            logger.warning(f'Filename [{filename}] skipped: {error}')
+            continue
+
+        scaled += 1
+        manifest.add(filename)
+        emit_progress(args, 'done', filename = filename)
+        # Lazy formatting, one line per file is only written at DEBUG level
+        logger.debug('Filename [%s] succesfully scaled', filename)
+        if args.log_every > 0 and processed % args.log_every == 0:
+            logger.info(f'{processed} of {len(filenames)} files processed, {scaled} succesfully scaled')
+
+    return scaled, processed
+
+# ----------------------------------------------------------------
+def scale_results(filenames, paths, args):
+    """Scale and save pairs of image and annotations file, in this process or
+    over the --scale_workers processes, until a stop is requested
+
+    Parameters:
+        filenames (list): unique ids of the pairs
+        paths (InputOutputPathConsistensy): input/output paths
+        args (Namespace): parsed command arguments
+
+    Return:
+        Generator of (filename, error), the error is None for scaled pairs
+    """
+    if scaler is not None:
+        for filename, frame, error in scaler.scale(filenames, stop = lambda: stop_requested):
+            if error is None:
+                try:
+                    for exporter in exporters:
+                        exporter.add(filename, *frame)
+                except Exception as e:
+                    error = e
+            yield filename, error
+        return
+
+    for filename in filenames:
+        if stop_requested:
+            break
+        try:
+            scale_pair(filename, paths, args)
+        except Exception as e:
+            yield filename, e
+            continue
+        yield filename, None
+
+# ----------------------------------------------------------------
+def scale_in_chunks(filenames, paths, args, manifest, failures):
+    """Scale pairs of image and annotations file in chunks of --chunk_size,
+    updating the manifest after each one. With --stepwise the run waits for
+    a line on stdin before each chunk and stops early at the end of stdin,
+    which lets a scheduler preempt it between chunks. A stop request ends
+    the run between two files.
+
+    Parameters:
+        filenames (list): unique ids of the pairs
+        paths (InputOutputPathConsistensy): input/output paths
+        args (Namespace): parsed command arguments
+        manifest (RunManifest): manifest of the run
+        failures (FailureReport): failure report of the run
+
+    Return:
+        Tuple of (pairs succesfully scaled, pairs processed)
+    """
+    scaled = 0
+    processed = 0
+    chunk_size = args.chunk_size if args.chunk_size > 0 else max(1, len(filenames))
+
+    for start in range(0, len(filenames), chunk_size):
+        if args.stepwise and not sys.stdin.readline():
+            logger.warning(f'Stopped with {len(filenames) - processed} files left')
+            break
+
+        chunk_scaled, chunk_processed = scale_pairs(filenames[start:start+chunk_size], paths, args, manifest, failures)
+        scaled += chunk_scaled
+        processed += chunk_processed
+        if stop_requested:
+            logger.warning(f'Stop requested (SIGTERM), stopped with {len(filenames) - processed} files left')
+            break
+        if args.chunk_size > 0:
+            commit(manifest)
+        emit_progress(args, 'chunk', processed = processed, remaining = len(filenames) - processed)
+
+    return scaled, processed
+
+# ----------------------------------------------------------------
+def skip_produced(filenames, manifest):
+    """Skip the pairs produced by a previous run of the same job, as recorded
+    in its manifest, so that a run interrupted on one node is resumed on
+    another one from its last complete chunk
+
+    Parameters:
+        filenames (list): unique ids of the pairs
+        manifest (RunManifest): manifest of the run, not written yet
+
+    Return:
+        List of the filenames left to scale
+    """
+    if not os.path.exists(manifest.path):
+        return filenames
+
+    produced = set(RunManifest.read(manifest.path)['produced'])
+    remaining = []
+    for filename in filenames:
+        if filename in produced:
+            manifest.add(filename)
+        else:
+            remaining.append(filename)
+    logger.info(f'Resuming [{manifest.path}]: {len(filenames) - len(remaining)} files already scaled')
+    return remaining
+
+# ----------------------------------------------------------------
+def wait_for_input_folders(paths, args):
+    """Wait until the input folders hold data, their kind is told apart by 
+    the extension of their files
+
+    Parameters:
+        paths (InputOutputPathConsistensy): input/output paths
+        args (Namespace): parsed command arguments
+    """
+    while True:
+        try:
+            paths.locate_input_folders()
+            return
+        except UnvalidKittiFolderFormat as e:
+            if e.reason != 'empty':
+                raise
+            logger.debug('Waiting for data in the input folders')
+            time.sleep(args.poll_interval)
+
+# ----------------------------------------------------------------
+def watch(paths, args, manifest, failures):
+    """Scale new pairs of image and annotations file as they land in the 
+    input folders, until interrupted or stopped
+
+    Parameters:
+        paths (InputOutputPathConsistensy): input/output paths
+        args (Namespace): parsed command arguments
+        manifest (RunManifest): manifest of the run
+        failures (FailureReport): failure report of the run
+    """
+    # A watch restarted on its output folder goes on from the pairs its manifest lists as produced
+    produced = []
+    if os.path.exists(manifest.path):
+        produced = RunManifest.read(manifest.path)['produced']
+        manifest.assign(produced)
+        for filename in produced:
+            manifest.add(filename)
+        logger.info(f'Resuming [{manifest.path}]: {len(produced)} files already scaled')
+    watcher = InputWatcher(paths.path_to_images, paths.path_to_annotations, settle_time = args.settle_time,
+                           reported = produced)
+    manifest.write()
+    logger.info(f'Watching [{paths.path_to_images}] and [{paths.path_to_annotations}]')
+
+    try:
+        while not stop_requested:
+            filenames = watcher.poll()
+            if args.num_shards > 1:
+                filenames = [filename for filename in filenames 
+                             if shard_of(filename, args.num_shards) == args.shard_index]
+            if not filenames:
+                time.sleep(args.poll_interval)
+                continue
+
+            # Small batches amortize the manifest update while keeping latency low
+            for i in range(0, len(filenames), args.batch_size):
+                batch = filenames[i:i+args.batch_size]
+                manifest.assign(batch)
+                emit_progress(args, 'total', total = len(manifest.data['assigned']))
+                scaled, _ = scale_pairs(batch, paths, args, manifest, failures)
+                commit(manifest)
+                logger.info(f'{scaled} of {len(batch)} new files succesfully scaled')
+                if stop_requested:
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stop_requested:
+            logger.warning('Stop requested (SIGTERM)')
+        logger.info('Stop watching')
+        close_workers()
+        failures.close()
+        close_exporters()
+        close_sink()
+        report_duplicates(manifest)
+        # A stop in the middle of a batch leaves assigned pairs unprocessed
+        data = manifest.data
+        commit(manifest, complete = len(data['produced']) + len(data['failed']) >= len(data['assigned']))
+        emit_progress(args, 'end', scaled = len(manifest.data['produced']), failed = failures.total)
+
+# ----------------------------------------------------------------
+def close_exporters():
+    """Complete the files of the export sinks"""
+    for exporter in exporters:
+        exporter.close()
+
+# ----------------------------------------------------------------
+def commit(manifest, complete = None):
+    """Commit point: the scaled files written so far are put in place and
+    made durable before the manifest records them as produced
+
+    Parameters:
+        manifest (RunManifest): manifest of the run
+        complete (bool): whether the run finished, None in the middle of the run:
+                         the changes are then appended to the journal of the manifest
+    """
+    if sink is not None:
+        sink.commit()
+    manifest.add_commit()
+    if complete is None:
+        manifest.update()
+    else:
+        manifest.write(complete = complete)
+
+# ----------------------------------------------------------------
+def close_sink():
+    """Store the last scaled files, i.e. complete the archive or the uploads"""
+    if sink is not None:
+        sink.close()
+
+# ----------------------------------------------------------------
+def discard_sink():
+    """Drop the scaled files not committed yet after an error, the manifest
+    does not list their pairs so the next run scales them again"""
+    if sink is not None:
+        sink.discard()
+        sink.close()
+
+# ----------------------------------------------------------------
+def close_workers():
+    """Stop the --scale_workers processes"""
+    if scaler is not None:
+        scaler.close()
+
+# ----------------------------------------------------------------
+def report_duplicates(manifest):
+    """Log the duplicates found with --dedup and store them in the manifest
+
+    Parameters:
+        manifest (RunManifest): manifest of the run
+    """
+    if deduplicator is None:
+        return
+    report = deduplicator.report
+    manifest.add_report('dedup', report)
+    logger.info(f'{report["duplicates"]} duplicate images of {report["unique"]} unique ones, '
+                f'{report["saved_seconds"]:.2f} s saved for {report["hash_seconds"]:.2f} s hashing '
+                f'(links: {report["links"]})')
+
+# ----------------------------------------------------------------
+def select_filenames(paths, args, path_to_data):
+    """Get the unique ids of the pairs this run has to process
+
+    Parameters:
+        paths (InputOutputPathConsistensy): input/output paths
+        args (Namespace): parsed command arguments
+        path_to_data (str): path to data
+
+    Return:
+        List of filenames
+    """
+    filenames = paths.get_filenames_no_extension()
+
+    # Keep only the frames containing the requested classes
+    if args.classes:
+        filenames = filter_by_classes(filenames, paths, args, path_to_data)
+
+    # Keep only the frames of this shard
+    if args.num_shards > 1:
+        filenames = select_shard(filenames, args.num_shards, args.shard_index)
+        logger.info(f'Shard {args.shard_index} of {args.num_shards}: {len(filenames)} files')
+    return filenames
+
+# ----------------------------------------------------------------
+def merge(args, path_to_data, path_to_output):
+    """Check that every pair was produced exactly once by the shards sharing
+    the output folder. Exits with status 1 otherwise.
+
+    Parameters:
+        args (Namespace): parsed command arguments
+        path_to_data (str): path to data
+        path_to_output (str): path to the scaled data
+    """
+    try:
+        paths = InputOutputPathConsistensy(path_to_data)
+    except NoSuchPath as e:
+        debug_log_Exception(e)
+    except UnvalidKittiFolderFormat as e:
+        debug_log_Exception(e)
+
+    num_shards = args.num_shards
+    args.num_shards = 1
+    filenames = select_filenames(paths, args, path_to_data)
+    args.num_shards = num_shards
+
+    path_to_output_folder = os.path.join(path_to_output, args.output_folder)
+    result = merge_shards(path_to_output_folder, filenames)
+    with open(os.path.join(path_to_output_folder, 'manifest.json'), 'w') as file:
+        json.dump(result, file)
+
+    for key, value in result.items():
+        if isinstance(value, list) and value:
+            logger.warning(f'Merge > {key}: {len(value)} ({value[:10]})')
+    logger.info(f'Merge > {result["produced"]} pairs produced by {result["num_shards"]} shards')
+    if not result['valid']:
+        sys.exit(1)
+
+# ----------------------------------------------------------------
+def open_failure_report(args, path_to_output_folder):
+    """Create the failure report following the --on_error policy
+
+    Parameters:
+        args (Namespace): parsed command arguments
+        path_to_output_folder (str): path to the folder with the scaled data
+
+    Return:
+        FailureReport
+    """
+    if args.failure_report == None and args.num_shards > 1:
+        path_to_report = os.path.join(path_to_output_folder,
+                                      f'failures-shard-{args.shard_index:05d}-of-{args.num_shards:05d}.jsonl')
+    elif args.failure_report == None:
+        path_to_report = os.path.join(path_to_output_folder, 'failures.jsonl')
+    else:
+        path_to_report = args.failure_report
+
+    path_to_quarantine = None
+    if args.on_error == 'quarantine':
+        if args.quarantine_path == None:
+            path_to_quarantine = os.path.join(path_to_output_folder, 'quarantine')
+        else:
+            path_to_quarantine = args.quarantine_path
+
+    return FailureReport(path_to_report, path_to_quarantine)
+
+# ----------------------------------------------------------------
+def scale_pair(filename, paths, args):
+    """Scale and save a pair of image and annotations file
+
+    Parameters:
+        filename (str): unique id of the pair of image and annotation files
+        paths (InputOutputPathConsistensy): input/output paths
+        args (Namespace): parsed command arguments
+    """
+    # Paths to image and annotations folder
+    path_to_image = os.path.join(paths.path_to_images, filename+'.jpg')
+    path_to_annotations = os.path.join(paths.path_to_annotations, filename +'.txt')
+
+    # Paths to image and annotations scaled folder
+    path_to_scaled_image = os.path.join(paths.path_to_scaled_images, filename+'.jpg')
+    path_to_scaled_annotations = os.path.join(paths.path_to_scaled_annotations, filename+'.txt')
+
+    img_ann = ImageAnnotations(path_to_image, 
+                               path_to_annotations,
+                               path_to_scaled_image, 
+                               path_to_scaled_annotations
+                               )
+    if deduplicator is None:
+        img_ann.scale(target_width = args.target_width, target_height = args.target_height,
+                      resize_backend = args.resize_backend, profile = get_profile(args.profile))
+        img_ann.write(exporters, sink = sink)
+        return
+
+    # Identical input images scale to identical images, only the first one is decoded
+    digest = deduplicator.digest(path_to_image)
+    start = time.perf_counter()
+    img_ann.scale_annotations(target_width = args.target_width, target_height = args.target_height)
+    # Before a duplicate gets the scaled image
+    img_ann.check_exports(exporters)
+    if deduplicator.reuse(digest, path_to_scaled_image):
+        img_ann.write(exporters, write_image = False, sink = sink)
+        deduplicator.account(digest, time.perf_counter() - start)
+        return
+    img_ann.scale(target_width = args.target_width, target_height = args.target_height,
+                  resize_backend = args.resize_backend, profile = get_profile(args.profile))
+    img_ann.write(exporters, sink = sink)
+    deduplicator.register(digest, path_to_scaled_image, time.perf_counter() - start)
+
+# ----------------------------------------------------------------
+def validate(args, path_to_data):
+    """Validate the input data without producing any output. Exits with 
+    status 1 if any violation is found.
+
+    Parameters:
+        args (Namespace): parsed command arguments
+        path_to_data (str): path to data
+    """
+    logger.info(f'Validating [{path_to_data}]')
+    validator = DatasetValidator(path_to_data, check_jpeg = args.check_jpeg, workers = args.workers)
+    violations = validator.run()
+
+    for entry in violations:
+        line = f':{entry["line"]}' if entry['line'] is not None else ''
+        logger.warning(f'{entry["file"]}{line} > {entry["message"]}')
+
+    if args.failure_report != None:
+        validator.write_report(args.failure_report)
+
+    logger.info(f'{validator.pairs} pairs validated, {len(violations)} violations found')
+    if not validator.valid:
+        sys.exit(1)
+
 # ----------------------------------------------------------------
 def process_arguments():
     # Initialize the ArgumentParser
@@ -76,6 +601,263 @@ def process_arguments():
                         default = None
     )
 
+    parser.add_argument('--classes',
+                        nargs   = '?',
+                        dest    = 'classes',
+                        help    = 'comma separated class names, only frames containing any of them are scaled (e.g. Car,Pedestrian)',
+                        type    = str,
+                        default = None
+    )
+
+    parser.add_argument('--index_path',
+                        nargs   = '?',
+                        dest    = 'index_path',
+                        help    = 'path to the dataset index, defaults to a file per dataset under $XDG_CACHE_HOME/kitti_index (~/.cache/kitti_index)',
+                        type    = str,
+                        default = None
+    )
+
+    parser.add_argument('--on_error',
+                        nargs   = '?',
+                        dest    = 'on_error',
+                        help    = 'what to do with a pair that can not be scaled: abort the run, skip it or skip and copy it aside',
+                        choices = ON_ERROR_POLICIES,
+                        default = 'abort'
+    )
+
+    parser.add_argument('--failure_report',
+                        nargs   = '?',
+                        dest    = 'failure_report',
+                        help    = 'path to the JSONL failure report, defaults to <output folder>/failures.jsonl',
+                        type    = str,
+                        default = None
+    )
+
+    parser.add_argument('--quarantine_path',
+                        nargs   = '?',
+                        dest    = 'quarantine_path',
+                        help    = 'path to copy failed pairs to, defaults to <output folder>/quarantine',
+                        type    = str,
+                        default = None
+    )
+
+    parser.add_argument('--validate',
+                        dest    = 'validate',
+                        help    = 'only check the input data against the Kitti Format requirements, nothing is scaled',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--check_jpeg',
+                        dest    = 'check_jpeg',
+                        help    = 'also verify the JPEG markers of every image while validating',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--workers',
+                        nargs   = '?',
+                        dest    = 'workers',
+                        help    = 'number of worker processes, defaults to the number of CPUs',
+                        type    = int,
+                        default = None
+    )
+
+    parser.add_argument('--scale_workers',
+                        nargs   = '?',
+                        dest    = 'scale_workers',
+                        help    = 'number of worker processes scaling the pairs, 1 to scale them in this process. '\
+                                  'Workers read and write the files themselves, only filenames go through the pool',
+                        type    = int,
+                        default = 1
+    )
+
+    parser.add_argument('--num_shards',
+                        nargs   = '?',
+                        dest    = 'num_shards',
+                        help    = 'number of shards the dataset is split into (i.e. one per node)',
+                        type    = int,
+                        default = 1
+    )
+
+    parser.add_argument('--shard_index',
+                        nargs   = '?',
+                        dest    = 'shard_index',
+                        help    = 'index of the shard processed by this run, from 0 to num_shards - 1',
+                        type    = int,
+                        default = 0
+    )
+
+    parser.add_argument('--output_folder',
+                        nargs   = '?',
+                        dest    = 'output_folder',
+                        help    = 'name of the output folder inside output_path, shared by all shards. '\
+                                  'An unique output-<uuid> folder is created if not given',
+                        type    = str,
+                        default = None
+    )
+
+    parser.add_argument('--merge',
+                        dest    = 'merge',
+                        help    = 'check the manifests of all shards in output_folder instead of scaling',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--watch',
+                        dest    = 'watch',
+                        help    = 'keep running and scale new pairs as they land in the input folders',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--poll_interval',
+                        nargs   = '?',
+                        dest    = 'poll_interval',
+                        help    = 'seconds between two polls of the input folders while watching',
+                        type    = float,
+                        default = 1.0
+    )
+
+    parser.add_argument('--settle_time',
+                        nargs   = '?',
+                        dest    = 'settle_time',
+                        help    = 'seconds a file must stay unchanged to be considered complete while watching',
+                        type    = float,
+                        default = 2.0
+    )
+
+    parser.add_argument('--batch_size',
+                        nargs   = '?',
+                        dest    = 'batch_size',
+                        help    = 'maximum number of new pairs scaled between two manifest updates while watching',
+                        type    = int,
+                        default = 32
+    )
+
+    parser.add_argument('--chunk_size',
+                        nargs   = '?',
+                        dest    = 'chunk_size',
+                        help    = 'number of pairs scaled between two manifest updates, 0 to scale all pairs at once',
+                        type    = int,
+                        default = 0
+    )
+
+    parser.add_argument('--stepwise',
+                        dest    = 'stepwise',
+                        help    = 'wait for a line on stdin before each chunk and stop at the end of stdin, '\
+                                  'used by the Rest API scheduler to preempt the run between chunks',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--resume',
+                        dest    = 'resume',
+                        help    = 'skip the pairs already produced in output_folder according to its manifest, '\
+                                  'to resume an interrupted run',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--dedup',
+                        dest    = 'dedup',
+                        help    = 'hash the input images and scale identical ones once, the next ones get '\
+                                  'the scaled image through a link or a copy (see --dedup_link)',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--dedup_link',
+                        nargs   = '?',
+                        dest    = 'dedup_link',
+                        help    = 'how duplicates get the scaled image, auto tries reflink, hardlink and copy',
+                        choices = LINK_METHODS,
+                        default = 'auto'
+    )
+
+    parser.add_argument('--durability',
+                        nargs   = '?',
+                        dest    = 'durability',
+                        help    = 'scaled files are written aside and renamed in place, none never flushes them '\
+                                  'to disk, batch flushes them at every manifest update (one fsync per directory) '\
+                                  'and every-file before every rename',
+                        choices = DURABILITY_LEVELS,
+                        default = 'batch'
+    )
+
+    parser.add_argument('--output_sink',
+                        nargs   = '?',
+                        dest    = 'output_sink',
+                        help    = 'where the scaled images and annotations go: fs (the output folder), '\
+                                  'tar:<path to the archive> or s3://<bucket>/<prefix> (an S3-compatible '\
+                                  'store configured through the AWS_* and S3_ENDPOINT_URL variables)',
+                        type    = str,
+                        default = 'fs'
+    )
+
+    parser.add_argument('--write_buffer',
+                        nargs   = '?',
+                        dest    = 'write_buffer',
+                        help    = 'bytes of annotations files (and archive members) held in memory before they are '\
+                                  'written in one batch, at the latest on every manifest update. 0 writes every file '\
+                                  'as it comes, object stores are never buffered',
+                        type    = int,
+                        default = WRITE_BUFFER_SIZE
+    )
+
+    parser.add_argument('--progress',
+                        dest    = 'progress',
+                        help    = 'print a JSON line on stdout for every processed file, to follow the run from another process',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--resize_backend',
+                        nargs   = '?',
+                        dest    = 'resize_backend',
+                        help    = 'pil resamples with Image.resize, area and numpy downscale integer factors '\
+                                  '(after a JPEG draft decode) with a box filter and fall back to pil otherwise, '\
+                                  'see benchmarks/bench_resize.py',
+                        choices = RESIZE_BACKENDS,
+                        default = 'pil'
+    )
+
+    parser.add_argument('--profile',
+                        nargs   = '?',
+                        dest    = 'profile',
+                        help    = 'resampling filter and JPEG encoder settings of the scaled images, '\
+                                  'Pillow defaults if not given, see benchmarks/bench_profiles.py',
+                        choices = list(PROFILES),
+                        default = None
+    )
+
+    parser.add_argument('--export',
+                        nargs   = '?',
+                        dest    = 'export',
+                        help    = f'comma separated formats {EXPORT_FORMATS} also written in the output folder '\
+                                  'in the same pass, i.e. coco.json and labels/',
+                        type    = str,
+                        default = None
+    )
+
+    parser.add_argument('--export_classes',
+                        nargs   = '?',
+                        dest    = 'export_classes',
+                        help    = 'comma separated class names in the order of their exported ids, '\
+                                  'other classes get the next ids as they are seen (e.g. Car,Pedestrian)',
+                        type    = str,
+                        default = None
+    )
+
+    parser.add_argument('--log_every',
+                        nargs   = '?',
+                        dest    = 'log_every',
+                        help    = 'log a summary every given number of files instead of a line per file, '\
+                                  'those are logged at DEBUG level (0 for no summary)',
+                        type    = int,
+                        default = 100
+    )
+
     parser.add_argument('--log_level',
                         nargs = '?',
                         dest = "log_level",
@@ -85,12 +867,42 @@ def process_arguments():
     
     # Parse the commandline
     args = parser.parse_args()
+
+    if args.num_shards < 1 or not 0 <= args.shard_index < args.num_shards:
+        parser.error('--shard_index must be between 0 and --num_shards - 1')
+    if (args.num_shards > 1 or args.merge) and args.output_folder == None:
+        parser.error('--output_folder is required to share the output between shards')
+    if args.watch and (args.classes or args.merge or args.validate):
+        parser.error('--watch can not be combined with --classes, --merge or --validate')
+    if args.watch and args.stepwise:
+        parser.error('--watch can not be combined with --stepwise')
+    if args.resume and (args.output_folder == None or args.watch):
+        parser.error('--resume requires --output_folder and can not be combined with --watch')
+    args.export = [name.strip() for name in args.export.split(',') if name.strip()] if args.export else []
+    if any(name not in EXPORT_FORMATS for name in args.export):
+        parser.error(f'--export formats must be among {EXPORT_FORMATS}')
+    if args.scale_workers < 1:
+        parser.error('--scale_workers must be at least 1')
+    if args.dedup and args.scale_workers > 1:
+        parser.error('--dedup can not be combined with --scale_workers, duplicates are linked in order')
+    if not args.output_sink.startswith(OUTPUT_SINKS):
+        parser.error(f'--output_sink must be one of {OUTPUT_SINKS}')
+    if args.output_sink.startswith('tar:') and (args.scale_workers > 1 or args.resume):
+        parser.error('--output_sink tar: can not be combined with --scale_workers or --resume, '\
+                     'the archive is written by a single process from scratch')
+    if 'yolo' in args.export and (args.num_shards > 1 or args.resume) and not args.export_classes:
+        parser.error('--export yolo requires --export_classes with --num_shards or --resume, '\
+                     'every run writes its class ids to the same labels folder')
+    if 'coco' in args.export and args.resume:
+        parser.error('--export coco can not be combined with --resume, the COCO file only covers a single run')
     return args
 
 # ----------------------------------------------------------------
 def main():
+    global deduplicator, scaler, sink
 
     logger.info('Initializing script')
+    signal.signal(signal.SIGTERM, request_stop)
 
     # Process arguments
     args = process_arguments()
@@ -103,47 +915,106 @@ def main():
     else:
         path_to_data = args.input_path
     
+    if args.validate:
+        validate(args, path_to_data)
+        return
+
     if args.output_path == None:
         path_to_output = path_to_package
     else:
         path_to_output = args.output_path
 
+    if args.merge:
+        merge(args, path_to_data, path_to_output)
+        return
+
+    # Scaled files are named relative to the output path in archives and object stores
+    sink = open_sink(args.output_sink, path_to_output, args.durability, args.write_buffer)
+    # Shards share the output folder, each one only sweeps the temporary files of its pairs
+    owns = None
+    if args.num_shards > 1:
+        owns = lambda filename: shard_of(filename, args.num_shards) == args.shard_index
+
     try:
-        paths = InputOutputPathConsistensy(path_to_data, path_to_output)
+        # While watching, pairs may be landing: only the folder structure is checked
+        paths = InputOutputPathConsistensy(path_to_data, path_to_output, 
+                                           check_input = not args.watch,
+                                           target_folder = args.output_folder,
+                                           sink = sink,
+                                           owns = owns)
+        if args.watch:
+            wait_for_input_folders(paths, args)
     except NoSuchPath as e:
         debug_log_Exception(e)
     except UnvalidKittiFolderFormat as e:
         debug_log_Exception(e)
     
     logger.info('Input/output path are consistent with Kitti Format')
-            
+
+    # Every run keeps track of what it was assigned and what it produced
+    manifest = RunManifest(manifest_path(paths.path_to_output_folder, args.num_shards, args.shard_index),
+                           input_path = path_to_data,
+                           num_shards = args.num_shards,
+                           shard_index = args.shard_index,
+                           target_width = args.target_width,
+                           target_height = args.target_height)
+
+    # Failed pairs are recorded next to the scaled data unless told otherwise
+    failures = open_failure_report(args, paths.path_to_output_folder)
+
+    # Shards and resumed runs share the YOLO labels, their ids must not depend on the order classes are seen
+    fixed_classes = None
+    if args.export:
+        classes = [name.strip() for name in args.export_classes.split(',')] if args.export_classes else None
+        suffix = f'-shard-{args.shard_index:05d}-of-{args.num_shards:05d}' if args.num_shards > 1 else ''
+        if 'yolo' in args.export and (args.num_shards > 1 or args.resume):
+            fixed_classes = classes
+        exporters.extend(open_exporters(args.export, paths.path_to_output_folder, suffix, classes,
+                                        fixed_classes = fixed_classes is not None))
+
+    if args.dedup:
+        deduplicator = FrameDeduplicator(args.dedup_link, sink)
+    if args.scale_workers > 1:
+        scaler = ParallelScaler(paths, args.target_width, args.target_height, args.scale_workers,
+                                resize_backend = args.resize_backend, profile = get_profile(args.profile),
+                                frames = bool(exporters), classes = fixed_classes,
+                                make_sink = partial(open_sink, args.output_sink, path_to_output, args.durability,
+                                                    args.write_buffer))
+
+    if args.watch:
+        watch(paths, args, manifest, failures)
+        return
+
     # Iterate over all filenames and scale image/annotation files
-    filenames = paths.get_filenames_no_extension()
+    filenames = select_filenames(paths, args, path_to_data)
+    manifest.assign(filenames)
+    if args.resume:
+        filenames = skip_produced(filenames, manifest)
+    manifest.write()
+    emit_progress(args, 'total', total = len(manifest.data['assigned']), resumed = len(manifest.data['produced']))
     logger.info('Starting scaling all files')
 
-    for filename in filenames:
-        
-        # Paths to image and annotations folder
-        path_to_image = os.path.join(paths.path_to_images, filename+'.jpg')
-        path_to_annotations = os.path.join(paths.path_to_annotations, filename +'.txt')
-        
-        # Paths to image and annotations scaled folder
-        path_to_scaled_image = os.path.join(paths.path_to_scaled_images, filename+'.jpg')
-        path_to_scaled_annotations = os.path.join(paths.path_to_scaled_annotations, filename+'.txt')
-        
-        try:
-            img_ann = ImageAnnotations(path_to_image, 
-                                       path_to_annotations,
-                                       path_to_scaled_image, 
-                                       path_to_scaled_annotations
-                                       )
-        except UnvalidAnnotationsFile as e:
-            debug_log_Exception(e)
-        
-        img_ann.scale(target_width = args.target_width, target_height = args.target_height)
-        img_ann.write()
-
-        logger.info(f'Filename [{filename}] succesfully scaled')
+    try:
+        scaled, processed = scale_in_chunks(filenames, paths, args, manifest, failures)
+    except BaseException:
+        discard_sink()
+        raise
+    complete = processed == len(filenames)
+
+    close_workers()
+    failures.close()
+    close_exporters()
+    close_sink()
+    report_duplicates(manifest)
+    commit(manifest, complete = complete)
+    emit_progress(args, 'end', scaled = scaled, failed = failures.total, complete = complete)
+    logger.info(f'{scaled} of {len(filenames)} files succesfully scaled')
+    if failures.total:
+        logger.warning(f'{failures.total} files failed, see [{failures.path_to_report}]. '
+                       f'Failures by reason: {failures.counts}')
+    # A run ended at the end of stdin (--stepwise) was stopped by its scheduler, not interrupted
+    if not complete and stop_requested:
+        sys.exit(1)
 
 # ----------------------------------------------------------------
 if __name__ == '__main__':
@@ -0,0 +1,246 @@
+"""
+worker.py
+
+Description:
+    Worker of the job queue shared by the Rest API instances. Claims the
+    jobs of the SQLite queue on the shared volume, runs run.py over them
+    and renews the lease of the job with its progress after every chunk
+    and at regular intervals in between. A job is resumed from its last
+    complete chunk when a worker claims it again after a crash.
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import json
+import time
+import socket
+import signal
+import argparse
+import threading
+from subprocess import Popen, PIPE
+from core.job_queue import JobQueue
+from utils import custom_logger
+
+logger = custom_logger(__file__)
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_script = os.path.join(path_to_self, 'run.py')
+
+# Set on SIGTERM, the worker gives its job back to the queue and exits
+stop_requested = False
+# run.py process of the job being run
+current_process = None
+
+# ----------------------------------------------------------------
+def request_stop(signum, frame):
+    """Stop the worker, the job being run stops between two files. Nothing
+    is logged here: the interrupted thread may hold the lock of the log
+    queue, the stop is logged once the job ends
+
+    Parameters:
+        signum (int): received signal
+        frame (frame): interrupted frame
+    """
+    global stop_requested
+    stop_requested = True
+    if current_process is not None and current_process.poll() is None:
+        current_process.terminate()
+
+# ----------------------------------------------------------------
+def run_job(queue, job, args):
+    """Run a claimed job and record its end in the queue
+
+    Parameters:
+        queue (JobQueue): shared job queue
+        job (dict): claimed job
+        args (Namespace): parsed command arguments
+    """
+    global current_process
+    params = job['params']
+    command = ['python3', path_to_script,
+               '--target_width', f"{params['target_width']}",
+               '--target_height', f"{params['target_height']}",
+               '--input_path', f"{params['input_path']}",
+               '--output_path', f"{params['output_path']}",
+               '--output_folder', f"{job['output_folder']}",
+               '--chunk_size', f'{args.chunk_size}',
+               '--resume',
+               '--progress',
+               '--log_level', args.log_level]
+    if params.get('profile'):
+        command += ['--profile', params['profile']]
+
+    progress = {'total': job['total'], 'done': job['done'], 'failed': 0, 'chunks': job['chunks']}
+    # Set when the lease was lost or the job cancelled
+    lost = threading.Event()
+    finished = threading.Event()
+
+    process = Popen(command, stdout = PIPE, text = True)
+    current_process = process
+    if stop_requested:
+        process.terminate()
+
+    def renew():
+        if not queue.heartbeat(job['job_id'], args.worker_id, **progress):
+            lost.set()
+            if process.poll() is None:
+                process.terminate()
+
+    def keep_alive():
+        # Chunks may take longer than the lease
+        while not finished.wait(queue.lease_time / 3) and not lost.is_set():
+            renew()
+
+    heartbeats = threading.Thread(target = keep_alive, daemon = True)
+    heartbeats.start()
+    try:
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.warning(f"Job {job['job_id']} > Unexpected output: {line[:200]}")
+                continue
+            if event.get('event') == 'total':
+                progress.update(total = event['total'], done = event.get('resumed', 0), failed = 0)
+            elif event.get('event') == 'done':
+                progress['done'] += 1
+            elif event.get('event') == 'failed':
+                progress['failed'] += 1
+            elif event.get('event') == 'chunk' and not lost.is_set():
+                # The manifest was written, a new claim resumes from here
+                progress['chunks'] += 1
+                renew()
+        returncode = process.wait()
+    finally:
+        finished.set()
+        heartbeats.join()
+        current_process = None
+
+    if lost.is_set():
+        # Recorded as cancelled if so, nothing happens if another worker holds the job
+        queue.finish(job['job_id'], args.worker_id, False, 'Stopped')
+        logger.warning(f"Job {job['job_id']} > Stopped, cancelled or lease lost")
+    elif returncode == 0:
+        queue.finish(job['job_id'], args.worker_id, True)
+        logger.info(f"Job {job['job_id']} > Done, {progress['done']} of {progress['total']} files scaled")
+    elif stop_requested:
+        queue.release(job['job_id'], args.worker_id)
+        logger.info(f"Job {job['job_id']} > Given back to the queue")
+    else:
+        queue.finish(job['job_id'], args.worker_id, False, f'Scaling script exited with status {returncode}')
+        logger.warning(f"Job {job['job_id']} > Failed, scaling script exited with status {returncode}")
+
+# ----------------------------------------------------------------
+def process_arguments():
+    # Initialize the ArgumentParser
+    parser = argparse.ArgumentParser(
+        description = "Job queue worker",
+        epilog = 'Press "CTRL-C" to stop the worker.',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--queue_path',
+                        nargs   = '?',
+                        dest    = 'queue_path',
+                        help    = 'path to the SQLite job queue on the volume shared with the Rest API instances',
+                        type    = str,
+                        required = True
+    )
+
+    parser.add_argument('--worker_id',
+                        nargs   = '?',
+                        dest    = 'worker_id',
+                        help    = 'unique id of the worker',
+                        type    = str,
+                        default = f'{socket.gethostname()}-{os.getpid()}'
+    )
+
+    parser.add_argument('--lease_time',
+                        nargs   = '?',
+                        dest    = 'lease_time',
+                        help    = 'seconds a claimed job stays with the worker without a heartbeat, '\
+                                  'the job is queued again once expired',
+                        type    = float,
+                        default = 30.0
+    )
+
+    parser.add_argument('--max_attempts',
+                        nargs   = '?',
+                        dest    = 'max_attempts',
+                        help    = 'claims of a job before it is failed',
+                        type    = int,
+                        default = 3
+    )
+
+    parser.add_argument('--poll_interval',
+                        nargs   = '?',
+                        dest    = 'poll_interval',
+                        help    = 'seconds between two claims while the queue is empty',
+                        type    = float,
+                        default = 1.0
+    )
+
+    parser.add_argument('--chunk_size',
+                        nargs   = '?',
+                        dest    = 'chunk_size',
+                        help    = 'number of pairs scaled between two manifest updates, '\
+                                  'a resumed job starts over from the last one',
+                        type    = int,
+                        default = 256
+    )
+
+    parser.add_argument('--exit_when_empty',
+                        dest    = 'exit_when_empty',
+                        help    = 'exit once the queue is empty instead of polling it',
+                        action  = 'store_true',
+                        default = False
+    )
+
+    parser.add_argument('--log_level',
+                        nargs = '?',
+                        dest = "log_level",
+                        default = "INFO",
+                        choices = ["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"],
+                        help = "Set logging level")
+
+    # Parse the commandline
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error('--chunk_size must be positive')
+    return args
+
+# ----------------------------------------------------------------
+def main():
+
+    logger.info('Initializing worker')
+
+    # Process arguments
+    args = process_arguments()
+    logger.setLevel(args.log_level)
+    logger.info(f'Parsed command arguments: {args}')
+    signal.signal(signal.SIGTERM, request_stop)
+
+    queue = JobQueue(args.queue_path, lease_time = args.lease_time, max_attempts = args.max_attempts)
+    logger.info(f'Worker {args.worker_id} claiming jobs from [{args.queue_path}]')
+
+    while not stop_requested:
+        job = queue.claim(args.worker_id)
+        if job is None:
+            if args.exit_when_empty:
+                break
+            time.sleep(args.poll_interval)
+            continue
+        logger.info(f"Job {job['job_id']} > Claimed, attempt {job['attempts']}")
+        run_job(queue, job, args)
+
+    if stop_requested:
+        logger.warning('Stop requested (SIGTERM)')
+    logger.info(f'Worker {args.worker_id} stopped')
+
+# ----------------------------------------------------------------
+if __name__ == '__main__':
+    main()
@@ -196,6 +196,18 @@ class TestAnnotations(unittest.TestCase):
         except Exception as e:
             self.fail(f'Error scaling annotation file: {e}')
 
+    # ===================================================================================
+    def test_annotations_scale_float_policy(self):
+        """
+        Testing scaled annotations print the box with the fixed float policy, integral
+        coordinates without decimals, and keep the value of the fields outside the box
+        """
+        annotations = Annotations(text = 'Car 0.00 0 -1.58 100 50 300 150 1.5 1.60 3.20 0.00 1.00 10.50 -1.567\n'
+                                         'Van 0 0 0 10.5 20 30.25 40 0 0 0 0 0 0.00001 0\n', check = False)
+        self.assertEqual(annotations.scale(400, 200, 200, 100),
+                         ['Car 0 0 -1.58 50 25 150 75 1.5 1.6 3.2 0 1 10.5 -1.567',
+                          'Van 0 0 0 5.25 10 15.12 20 0 0 0 0 0 0.00001 0'])
+
 # =======================================================================================
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,80 @@
+"""
+test_base_archive.py
+
+Description:
+    Unnitest for the archives built on the fly
+
+Author: 
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import io
+import shutil
+import tarfile
+import zipfile
+import unittest
+from pathlib import Path
+from core.archive import TarStream, zip_chunks
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+
+
+class TestArchive(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize a made up output folder"""
+        self.path_to_output = os.path.join(path_to_self, 'output')
+        self.files = {'images/frame-0.jpg': bytes(range(256))*9,
+                      'annotations/frame-0.txt': b'helmet 0 0 0 101.1 47.71 130.64 81.22 0 0 0 0 0 0 0\n',
+                      'annotations/'+'frame'*40+'.txt': b'',
+                      'manifests/shard-00000-of-00001.json': b'{}'}
+        for name, body in self.files.items():
+            Path(os.fspath(os.path.dirname(os.path.join(self.path_to_output, name)))).mkdir(parents=True, exist_ok=True)
+            with open(os.path.join(self.path_to_output, name), 'wb') as file:
+                file.write(body)
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_output)
+
+    # ===================================================================================
+    def test_archive_tar(self):
+        """
+        Testing TarStream produces a valid archive of the announced size, by any byte range
+        """
+        archive = TarStream(self.path_to_output, 'output-test')
+        data = b''.join(archive.chunks(chunk_size = 100))
+        self.assertEqual(len(data), archive.size)
+
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            extracted = {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+        self.assertEqual(extracted, {'output-test/'+name: body for name, body in self.files.items()})
+
+        # Resuming from any offset gives the same bytes
+        for start in (0, 1, 511, 512, 1000, archive.size - 1):
+            self.assertEqual(b''.join(archive.chunks(start, start+700, chunk_size = 64)), data[start:start+700])
+
+        # Same content, same etag
+        self.assertEqual(TarStream(self.path_to_output, 'output-test').etag, archive.etag)
+
+    # ===================================================================================
+    def test_archive_zip(self):
+        """
+        Testing zip_chunks produces a valid zip archive
+        """
+        data = b''.join(zip_chunks(self.path_to_output, 'output-test', chunk_size = 100))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            extracted = {name: archive.read(name) for name in archive.namelist()}
+        self.assertEqual(extracted, {'output-test/'+name: body for name, body in self.files.items()})
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
@@ -0,0 +1,131 @@
+"""
+test_base_batch_stream.py
+
+Description:
+    Unnitest for the incremental batch upload parsers
+
+Author: 
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import io
+import tarfile
+import unittest
+from core.batch_stream import (
+    TarStreamParser,
+    MultipartStreamParser,
+    PairAssembler,
+    multipart_boundary
+)
+from core.custom_exceptions import UnvalidBatchUpload
+
+
+def feed_in_chunks(parser, data, chunk_size):
+    """Feed data in chunks and collect the completed files"""
+    files = []
+    for i in range(0, len(data), chunk_size):
+        files.extend(parser.feed(data[i:i+chunk_size]))
+    return files
+
+
+class TestBatchStream(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize made up files"""
+        self.files = [('images/'+'frame'*30+'-0.jpg', bytes(range(256))*7),
+                      ('annotations/'+'frame'*30+'-0.txt', b'helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n'),
+                      ('images/empty.jpg', b'')]
+
+    # ===================================================================================
+    def test_batch_stream_tar(self):
+        """
+        Testing TarStreamParser over GNU and pax archives fed in arbitrary chunks
+        """
+        for format in (tarfile.GNU_FORMAT, tarfile.PAX_FORMAT):
+            archive = io.BytesIO()
+            with tarfile.open(fileobj=archive, mode='w', format=format) as tar:
+                folder = tarfile.TarInfo('images')
+                folder.type = tarfile.DIRTYPE
+                tar.addfile(folder)
+                for name, body in self.files:
+                    info = tarfile.TarInfo(name)
+                    info.size = len(body)
+                    tar.addfile(info, io.BytesIO(body))
+            data = archive.getvalue()
+
+            for chunk_size in (1, 511, 4096, len(data)):
+                parser = TarStreamParser(max_entry_size = 4096)
+                self.assertEqual(feed_in_chunks(parser, data, chunk_size), self.files)
+                parser.close()
+
+            # Truncated archive
+            parser = TarStreamParser(max_entry_size = 4096)
+            feed_in_chunks(parser, data[:1500], 100)
+            with self.assertRaises(UnvalidBatchUpload) as context:
+                parser.close()
+            self.assertEqual(context.exception.reason, 'incomplete')
+
+            # File too big
+            parser = TarStreamParser(max_entry_size = 100)
+            with self.assertRaises(UnvalidBatchUpload) as context:
+                parser.feed(data)
+            self.assertEqual(context.exception.reason, 'entry_size')
+
+    # ===================================================================================
+    def test_batch_stream_multipart(self):
+        """
+        Testing MultipartStreamParser fed in arbitrary chunks
+        """
+        boundary = multipart_boundary('multipart/form-data; boundary="xyz"')
+        self.assertEqual(boundary, b'xyz')
+        data = b'preamble\r\n'
+        data += b'--xyz\r\nContent-Disposition: form-data; name="field"\r\n\r\nvalue\r\n'
+        for name, body in self.files:
+            data += (b'--xyz\r\nContent-Disposition: form-data; name="file"; filename="'+name.encode()+b'"\r\n'
+                     b'Content-Type: application/octet-stream\r\n\r\n'+body+b'\r\n')
+        data += b'--xyz--\r\nepilogue'
+
+        for chunk_size in (1, 3, 100, len(data)):
+            parser = MultipartStreamParser(boundary, max_entry_size = 4096)
+            self.assertEqual(feed_in_chunks(parser, data, chunk_size), self.files)
+            parser.close()
+
+        parser = MultipartStreamParser(boundary, max_entry_size = 100)
+        with self.assertRaises(UnvalidBatchUpload) as context:
+            parser.feed(data)
+        self.assertEqual(context.exception.reason, 'entry_size')
+
+    # ===================================================================================
+    def test_batch_stream_pairs(self):
+        """
+        Testing PairAssembler matches pairs and bounds the files waiting for their partner
+        """
+        assembler = PairAssembler(max_unpaired = 2)
+        self.assertIsNone(assembler.add('images/a.jpg', b'image a'))
+        self.assertIsNone(assembler.add('annotations/b.txt', b'annotations b'))
+        self.assertEqual(assembler.add('annotations/a.txt', b'annotations a'), ('a', b'image a', b'annotations a'))
+        self.assertIsNone(assembler.add('c.jpg', b'image c'))
+        self.assertEqual(assembler.unpaired(), ['b.txt', 'c.jpg'])
+
+        for name, reason in (('d.jpg', 'unpaired'), ('a.jpg', 'duplicate'), ('e.png', 'extension')):
+            with self.assertRaises(UnvalidBatchUpload) as context:
+                assembler.add(name, b'')
+            self.assertEqual(context.exception.reason, reason)
+
+        # Bounded by the bytes waiting too
+        assembler = PairAssembler(max_unpaired = 8, max_unpaired_bytes = 10)
+        self.assertIsNone(assembler.add('a.jpg', b'image a'))
+        with self.assertRaises(UnvalidBatchUpload) as context:
+            assembler.add('b.jpg', b'image b')
+        self.assertEqual(context.exception.reason, 'unpaired')
+        self.assertIsNotNone(assembler.add('a.txt', b'annotations a'))
+        self.assertIsNone(assembler.add('c.jpg', b'image c'))
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
@@ -0,0 +1,146 @@
+"""
+test_base_dataset_index.py
+
+Description:
+    Unnitest for dataset index
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import time
+import shutil
+from pathlib import Path
+import unittest
+from PIL import Image
+from unittest import mock
+from core.dataset_index import DatasetIndex, default_index_path
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+
+class TestDatasetIndex(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize a Kitti Format dataset for testing"""
+
+        self.path_to_data = os.path.join(path_to_self, 'data')
+        self.path_to_images = os.path.join(self.path_to_data, 'images')
+        self.path_to_annotations = os.path.join(self.path_to_data, 'annotations')
+        self.path_to_index = os.path.join(self.path_to_data, 'kitti_index.npz')
+        Path(os.fspath(self.path_to_data)).mkdir()
+        Path(os.fspath(self.path_to_images)).mkdir()
+        Path(os.fspath(self.path_to_annotations)).mkdir()
+
+        labels = {
+            'frame0': ['Car 0 0 0 100 100 300 200 0 0 0 0 0 0 0'],
+            'frame1': ['Pedestrian 0 0 0 10 10 20 50 0 0 0 0 0 0 0',
+                       'Car 0 0 0 0 0 500 400 0 0 0 0 0 0 0'],
+            'frame2': ['Cyclist 0 0 0 50 50 80 80 0 0 0 0 0 0 0']
+        }
+        for frame_id, lines in labels.items():
+            self.write_frame(frame_id, lines)
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_data)
+
+    # ===================================================================================
+    def write_frame(self, frame_id, lines, size = (1000, 500)):
+        Image.new(mode='RGB', size = size, color = (0,255,0)).save(
+            os.path.join(self.path_to_images, frame_id+'.jpg'))
+        with open(os.path.join(self.path_to_annotations, frame_id+'.txt'), 'w') as file:
+            file.write('\n'.join(lines)+'\n')
+
+    # ===================================================================================
+    def test_dataset_index_classes(self):
+        """
+        Testing class to frame ids queries
+        """
+        index = DatasetIndex(self.path_to_images, self.path_to_annotations, self.path_to_index)
+        self.assertEqual(index.update(), 3)
+        self.assertEqual(index.frames_with_classes(['Car']), ['frame0', 'frame1'])
+        self.assertEqual(index.frames_with_classes(['Pedestrian', 'Cyclist']), ['frame1', 'frame2'])
+        self.assertEqual(index.frames_with_classes(['Truck']), [])
+        self.assertEqual(index.frames_by_class()['Cyclist'], ['frame2'])
+
+    # ===================================================================================
+    def test_dataset_index_box_statistics(self):
+        """
+        Testing box sizes queries after scaling
+        """
+        index = DatasetIndex(self.path_to_images, self.path_to_annotations, self.path_to_index)
+        index.update()
+        widths, heights, areas = index.box_statistics(target_width = 284, target_height = 284)
+        self.assertEqual(len(widths), 4)
+        self.assertAlmostEqual(float(max(areas)), 142.0 * 227.2)
+        # Pedestrian box is 10x40 px, 2.84x22.72 px once scaled
+        self.assertEqual(index.frames_with_boxes_smaller_than(3, 284, 284), ['frame1'])
+        self.assertEqual(index.frames_with_boxes_smaller_than(3), [])
+
+    # ===================================================================================
+    def test_dataset_index_persist_and_update(self):
+        """
+        Testing incremental updates of a persisted index
+        """
+        index = DatasetIndex(self.path_to_images, self.path_to_annotations, self.path_to_index)
+        index.update()
+        index.save()
+
+        # Nothing changed, nothing is read again
+        index = DatasetIndex(self.path_to_images, self.path_to_annotations, self.path_to_index)
+        self.assertEqual(len(index.frame_ids), 3)
+        self.assertEqual(index.update(), 0)
+
+        # Modify, add and remove frames
+        time.sleep(0.01)
+        self.write_frame('frame0', ['Pedestrian 0 0 0 1 1 2 2 0 0 0 0 0 0 0'])
+        self.write_frame('frame3', ['Car 0 0 0 1 1 2 2 0 0 0 0 0 0 0'])
+        os.remove(os.path.join(self.path_to_images, 'frame2.jpg'))
+        os.remove(os.path.join(self.path_to_annotations, 'frame2.txt'))
+
+        self.assertEqual(index.update(), 2)
+        self.assertEqual(index.frame_ids.tolist(), ['frame0', 'frame1', 'frame3'])
+        self.assertEqual(index.frames_with_classes(['Car']), ['frame1', 'frame3'])
+        self.assertEqual(index.frames_with_classes(['Pedestrian']), ['frame0', 'frame1'])
+        self.assertEqual(index.frames_with_classes(['Cyclist']), [])
+
+    # ===================================================================================
+    def test_dataset_index_invalid_frame(self):
+        """
+        Testing an annotation file that does not follow the requirements
+        """
+        self.write_frame('frame4', ['Car 0 0 0 0 0 0 0 0 0 0 0 0 0 0'])
+        index = DatasetIndex(self.path_to_images, self.path_to_annotations, self.path_to_index)
+        index.update()
+        self.assertEqual(index.invalid_frame_ids.tolist(), ['frame4'])
+        self.assertEqual(len(index.box_statistics()[0]), 4)
+
+    # ===================================================================================
+    def test_dataset_index_default_path(self):
+        """
+        Testing the default index is kept in the cache directory, out of the dataset
+        """
+        path_to_cache = os.path.join(self.path_to_data, 'cache')
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': path_to_cache}):
+            path_to_index = default_index_path(self.path_to_images+'/..')
+            self.assertEqual(path_to_index, default_index_path(self.path_to_data))
+            self.assertNotEqual(path_to_index, default_index_path(self.path_to_images))
+        self.assertTrue(path_to_index.startswith(path_to_cache+os.sep))
+
+        index = DatasetIndex(self.path_to_images, self.path_to_annotations, path_to_index)
+        index.update()
+        index.save()
+        self.assertTrue(os.path.exists(path_to_index))
+        self.assertEqual(os.listdir(os.path.dirname(path_to_index)), [os.path.basename(path_to_index)])
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
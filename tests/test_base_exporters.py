@@ -0,0 +1,148 @@
+"""
+test_base_exporters.py
+
+Description:
+    Unnitest for the COCO and YOLO export sinks
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import io
+import json
+import shutil
+import unittest
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from core.image_annotations import ImageAnnotations
+from core.exporters import CocoExporter, YoloExporter, open_exporters
+from core.custom_exceptions import UnvalidAnnotationsFile
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+
+
+class TestExporters(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize the output folder"""
+        self.path_to_output = os.path.join(path_to_self, 'output')
+        Path(os.fspath(self.path_to_output)).mkdir()
+        self.parameters = np.zeros((2, 14))
+        self.parameters[:, 3:7] = [[10, 20, 30, 60], [0, 0, 100, 50]]
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_output)
+
+    # ===================================================================================
+    def test_exporters_coco(self):
+        """
+        Testing CocoExporter writes a complete COCO file once closed
+        """
+        path_to_coco = os.path.join(self.path_to_output, 'coco.json')
+        with CocoExporter(path_to_coco, classes = ['person']) as exporter:
+            exporter.add('frame-0', ['helmet', 'person'], self.parameters, 100, 50)
+            exporter.add('frame-1', [], np.zeros((0, 14)), 100, 50)
+            exporter.add('frame-2', ['helmet'], self.parameters[:1], 100, 50)
+            self.assertFalse(os.path.exists(path_to_coco))
+
+        with open(path_to_coco) as file:
+            coco = json.load(file)
+        self.assertEqual([image['file_name'] for image in coco['images']], ['frame-0.jpg', 'frame-1.jpg', 'frame-2.jpg'])
+        self.assertEqual(coco['categories'], [{'id': 1, 'name': 'person'}, {'id': 2, 'name': 'helmet'}])
+        self.assertEqual(coco['annotations'][0], {'id': 1, 'image_id': 1, 'category_id': 2,
+                                                  'bbox': [10, 20, 20, 40], 'area': 800, 'iscrowd': 0})
+        self.assertEqual([(a['id'], a['image_id']) for a in coco['annotations']], [(1, 1), (2, 1), (3, 3)])
+
+        # Nothing added
+        path_to_empty = os.path.join(self.path_to_output, 'empty.json')
+        CocoExporter(path_to_empty).close()
+        with open(path_to_empty) as file:
+            self.assertEqual(json.load(file), {'images': [], 'annotations': [], 'categories': []})
+
+    # ===================================================================================
+    def test_exporters_yolo(self):
+        """
+        Testing YoloExporter writes normalized boxes and the class names
+        """
+        path_to_labels = os.path.join(self.path_to_output, 'labels')
+        with YoloExporter(path_to_labels) as exporter:
+            exporter.add('frame-0', ['helmet', 'person'], self.parameters, 100, 50)
+        with open(os.path.join(path_to_labels, 'frame-0.txt')) as file:
+            self.assertEqual(file.read(), '0 0.200000 0.800000 0.200000 0.800000\n'
+                                          '1 0.500000 0.500000 1.000000 1.000000\n')
+        with open(os.path.join(path_to_labels, 'classes.txt')) as file:
+            self.assertEqual(file.read(), 'helmet\nperson\n')
+
+    # ===================================================================================
+    def test_exporters_yolo_shards(self):
+        """
+        Testing shards seeing classes in different orders write the same ids to the shared labels
+        """
+        path_to_labels = os.path.join(self.path_to_output, 'labels')
+        shards = [open_exporters(['yolo'], self.path_to_output, classes = ['person', 'helmet'],
+                                 fixed_classes = True)[0] for _ in range(2)]
+        shards[0].add('frame-0', ['helmet', 'person'], self.parameters, 100, 50)
+        shards[1].add('frame-1', ['person', 'helmet'], self.parameters, 100, 50)
+        with self.assertRaises(UnvalidAnnotationsFile) as context:
+            shards[1].add('frame-2', ['car'], self.parameters[:1], 100, 50)
+        self.assertEqual(context.exception.reason, 'unexported_class')
+        self.assertFalse(os.path.exists(os.path.join(path_to_labels, 'frame-2.txt')))
+        for exporter in shards:
+            exporter.close()
+
+        with open(os.path.join(path_to_labels, 'frame-0.txt')) as file:
+            self.assertEqual([line.split()[0] for line in file], ['1', '0'])
+        with open(os.path.join(path_to_labels, 'frame-1.txt')) as file:
+            self.assertEqual([line.split()[0] for line in file], ['0', '1'])
+        with open(os.path.join(path_to_labels, 'classes.txt')) as file:
+            self.assertEqual(file.read(), 'person\nhelmet\n')
+
+    # ===================================================================================
+    def test_exporters_image_annotations_write(self):
+        """
+        Testing ImageAnnotations.write() feeds the exporters with the scaled annotations
+        """
+        buffer = io.BytesIO()
+        Image.new(mode = 'RGB', size = (200, 100)).save(buffer, format = 'JPEG')
+        img_ann = ImageAnnotations.from_bytes(buffer.getvalue(), 'Car 0 0 0 20 10 60 90 0 0 0 0 0 0 0',
+                                              os.path.join(self.path_to_output, 'frame-0.jpg'),
+                                              os.path.join(self.path_to_output, 'frame-0.txt'))
+        img_ann.scale(100, 100)
+        exporters = open_exporters(['coco', 'yolo'], self.path_to_output)
+        img_ann.write(exporters)
+        for exporter in exporters:
+            exporter.close()
+
+        with open(os.path.join(self.path_to_output, 'coco.json')) as file:
+            coco = json.load(file)
+        self.assertEqual(coco['images'][0], {'id': 1, 'file_name': 'frame-0.jpg', 'width': 100, 'height': 100})
+        self.assertEqual(coco['annotations'][0]['bbox'], [10, 10, 20, 80])
+        with open(os.path.join(self.path_to_output, 'labels', 'frame-0.txt')) as file:
+            self.assertEqual(file.read(), '0 0.200000 0.500000 0.200000 0.800000\n')
+
+    # ===================================================================================
+    def test_exporters_unexported_class_writes_nothing(self):
+        """
+        Testing a pair with a class out of the fixed classes fails before any of its files is written
+        """
+        buffer = io.BytesIO()
+        Image.new(mode = 'RGB', size = (200, 100)).save(buffer, format = 'JPEG')
+        img_ann = ImageAnnotations.from_bytes(buffer.getvalue(), 'Car 0 0 0 20 10 60 90 0 0 0 0 0 0 0\n'
+                                                                 'Van 0 0 0 20 10 60 90 0 0 0 0 0 0 0',
+                                              os.path.join(self.path_to_output, 'frame-0.jpg'),
+                                              os.path.join(self.path_to_output, 'frame-0.txt'))
+        img_ann.scale(100, 100)
+        exporters = open_exporters(['yolo'], self.path_to_output, classes = ['Car'], fixed_classes = True)
+        with self.assertRaises(UnvalidAnnotationsFile) as context:
+            img_ann.write(exporters)
+        self.assertEqual((context.exception.reason, context.exception.line), ('unexported_class', 2))
+        for name in ('frame-0.jpg', 'frame-0.txt', os.path.join('labels', 'frame-0.txt')):
+            self.assertFalse(os.path.exists(os.path.join(self.path_to_output, name)))
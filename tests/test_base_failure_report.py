@@ -0,0 +1,99 @@
+"""
+test_base_failure_report.py
+
+Description:
+    Unnitest for failure report
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import json
+import shutil
+from pathlib import Path
+import unittest
+from core.annotations import Annotations
+from core.custom_exceptions import UnvalidAnnotationsFile
+from core.failure_report import FailureReport
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+
+class TestFailureReport(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize a made up unvalid pair of image and annotations file"""
+
+        self.path_to_data = os.path.join(path_to_self, 'data')
+        Path(os.fspath(self.path_to_data)).mkdir()
+        self.path_to_image = os.path.join(self.path_to_data, 'test.jpg')
+        self.path_to_annotations = os.path.join(self.path_to_data, 'test.txt')
+        self.path_to_report = os.path.join(self.path_to_data, 'failures.jsonl')
+        self.path_to_quarantine = os.path.join(self.path_to_data, 'quarantine')
+
+        with open(self.path_to_image, 'wb') as file:
+            file.write(b'not a jpeg')
+        with open(self.path_to_annotations, 'w') as file:
+            file.write('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0'+'\n')
+            file.write('helmet 0 0 0 0 0 0 0 0 0 0 0 0 0 0'+'\n')
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_data)
+
+    # ===================================================================================
+    def test_failure_report_line_number(self):
+        """
+        Testing the line number of the first unvalid annotation is reported
+        """
+        with self.assertRaises(UnvalidAnnotationsFile) as context:
+            Annotations(self.path_to_annotations)
+        self.assertEqual(context.exception.reason, 'unvalid_box')
+        self.assertEqual(context.exception.line, 2)
+        self.assertEqual(str(context.exception), 'Unvalid bounding box')
+
+    # ===================================================================================
+    def test_failure_report_record(self):
+        """
+        Testing failures are reported, counted by reason and quarantined
+        """
+        with FailureReport(self.path_to_report, self.path_to_quarantine) as failures:
+            try:
+                Annotations(self.path_to_annotations)
+            except UnvalidAnnotationsFile as e:
+                failures.record('test', self.path_to_image, self.path_to_annotations, e)
+            failures.record('test', self.path_to_image, self.path_to_annotations, OSError('truncated'))
+
+        self.assertEqual(failures.counts, {'unvalid_box': 1, 'OSError': 1})
+        self.assertEqual(failures.total, 2)
+
+        with open(self.path_to_report, 'r') as file:
+            entries = [json.loads(line) for line in file.read().splitlines()]
+        self.assertEqual(entries[0]['reason'], 'unvalid_box')
+        self.assertEqual(entries[0]['line'], 2)
+        self.assertEqual(entries[0]['file'], self.path_to_annotations)
+        self.assertEqual(entries[1]['file'], self.path_to_image)
+
+        self.assertTrue(os.path.isfile(os.path.join(self.path_to_quarantine, 'images', 'test.jpg')))
+        self.assertTrue(os.path.isfile(os.path.join(self.path_to_quarantine, 'annotations', 'test.txt')))
+
+    # ===================================================================================
+    def test_failure_report_clean_run(self):
+        """
+        Testing no report is written when nothing fails
+        """
+        with FailureReport(self.path_to_report) as failures:
+            pass
+        self.assertEqual(failures.total, 0)
+        self.assertFalse(os.path.exists(self.path_to_report))
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
@@ -0,0 +1,67 @@
+"""
+test_base_fingerprint.py
+
+Description:
+    Unnitest for the input folders fingerprint
+
+Author: 
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import shutil
+import unittest
+from pathlib import Path
+from core.fingerprint import input_fingerprint
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+
+
+class TestFingerprint(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize a made up dataset"""
+        self.path_to_data = os.path.join(path_to_self, 'data')
+        Path(os.fspath(os.path.join(self.path_to_data, 'images'))).mkdir(parents=True)
+        Path(os.fspath(os.path.join(self.path_to_data, 'annotations'))).mkdir()
+        with open(os.path.join(self.path_to_data, 'images', 'frame-0.jpg'), 'wb') as file:
+            file.write(b'\xff\xd8\xff\xd9')
+        with open(os.path.join(self.path_to_data, 'annotations', 'frame-0.txt'), 'w') as file:
+            file.write('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n')
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_data)
+
+    # ===================================================================================
+    def test_fingerprint(self):
+        """
+        Testing input_fingerprint() only changes with the input files
+        """
+        fingerprint = input_fingerprint(self.path_to_data)
+
+        # Output folders and files next to the input folders are left out
+        Path(os.fspath(os.path.join(self.path_to_data, 'output-test', 'images'))).mkdir(parents=True)
+        with open(os.path.join(self.path_to_data, 'kitti_index.npz'), 'wb') as file:
+            file.write(b'index')
+        self.assertEqual(input_fingerprint(self.path_to_data), fingerprint)
+
+        # New and modified input files
+        with open(os.path.join(self.path_to_data, 'images', 'frame-1.jpg'), 'wb') as file:
+            file.write(b'\xff\xd8\xff\xd9')
+        with_new_file = input_fingerprint(self.path_to_data)
+        self.assertNotEqual(with_new_file, fingerprint)
+
+        with open(os.path.join(self.path_to_data, 'annotations', 'frame-0.txt'), 'a') as file:
+            file.write('helmet 0 0 0 111 144 134 174 0 0 0 0 0 0 0\n')
+        self.assertNotEqual(input_fingerprint(self.path_to_data), with_new_file)
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
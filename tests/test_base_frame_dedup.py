@@ -0,0 +1,102 @@
+"""
+test_base_frame_dedup.py
+
+Description:
+    Unnitest for the content-addressed deduplication of input images
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import shutil
+import unittest
+from pathlib import Path
+from PIL import Image
+from core.image_annotations import ImageAnnotations
+from core.frame_dedup import FrameDeduplicator, content_digest, link_or_copy
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+
+
+class TestFrameDedup(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize the output folder"""
+        self.path_to_output = os.path.join(path_to_self, 'output')
+        Path(os.fspath(self.path_to_output)).mkdir()
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_output)
+
+    # ===================================================================================
+    def write_frame(self, name, color):
+        path_to_image = os.path.join(self.path_to_output, name+'.jpg')
+        Image.new(mode = 'RGB', size = (400, 200), color = color).save(path_to_image)
+        return path_to_image
+
+    # ===================================================================================
+    def test_frame_dedup_links(self):
+        """
+        Testing digests and the links of scaled images
+        """
+        first = self.write_frame('first', (255, 0, 0))
+        shutil.copyfile(first, os.path.join(self.path_to_output, 'copy.jpg'))
+        other = self.write_frame('other', (0, 0, 255))
+        digest, size = content_digest(first, chunk_size = 100)
+        self.assertEqual(size, os.path.getsize(first))
+        self.assertEqual(content_digest(os.path.join(self.path_to_output, 'copy.jpg'))[0], digest)
+        self.assertNotEqual(content_digest(other)[0], digest)
+
+        # A hardlinked name replaced by a link to another file keeps the first file
+        linked = os.path.join(self.path_to_output, 'linked.jpg')
+        self.assertEqual(link_or_copy(first, linked, 'hardlink'), 'hardlink')
+        self.assertEqual(os.stat(first).st_nlink, 2)
+        self.assertIn(link_or_copy(other, linked), ('reflink', 'hardlink', 'copy'))
+        self.assertEqual(content_digest(first)[0], digest)
+        self.assertEqual(link_or_copy(first, linked, 'copy'), 'copy')
+        self.assertEqual(os.stat(linked).st_nlink, 1)
+        self.assertFalse(os.path.exists(linked+'.tmp'))
+
+    # ===================================================================================
+    def test_frame_dedup_scale(self):
+        """
+        Testing duplicates get the scaled image of the first one and their own annotations
+        """
+        deduplicator = FrameDeduplicator('copy')
+        pairs = [('000000', (255, 0, 0), 'Car 0 0 0 40 20 200 100 0 0 0 0 0 0 0\n'),
+                 ('000001', (255, 0, 0), 'Pedestrian 0 0 0 0 0 400 200 0 0 0 0 0 0 0\n'),
+                 ('000002', (0, 255, 0), 'Car 0 0 0 0 0 100 100 0 0 0 0 0 0 0\n')]
+        for name, color, annotations in pairs:
+            path_to_image = self.write_frame(name, color)
+            path_to_annotations = os.path.join(self.path_to_output, name+'.txt')
+            with open(path_to_annotations, 'w') as file:
+                file.write(annotations)
+            path_to_scaled_image = os.path.join(self.path_to_output, name+'_scaled.jpg')
+            img_ann = ImageAnnotations(path_to_image, path_to_annotations, path_to_scaled_image,
+                                       os.path.join(self.path_to_output, name+'_scaled.txt'))
+
+            digest = deduplicator.digest(path_to_image)
+            if deduplicator.reuse(digest, path_to_scaled_image):
+                img_ann.scale_annotations(200, 100)
+                img_ann.write(write_image = False)
+                deduplicator.account(digest, 0.0)
+            else:
+                img_ann.scale(200, 100)
+                img_ann.write()
+                deduplicator.register(digest, path_to_scaled_image, 1.0)
+
+        report = deduplicator.report
+        self.assertEqual((report['unique'], report['duplicates'], report['links']['copy']), (2, 1, 1))
+        self.assertEqual(report['saved_seconds'], 1.0)
+        with open(os.path.join(self.path_to_output, '000000_scaled.jpg'), 'rb') as first, \
+             open(os.path.join(self.path_to_output, '000001_scaled.jpg'), 'rb') as duplicate:
+            self.assertEqual(first.read(), duplicate.read())
+        with open(os.path.join(self.path_to_output, '000001_scaled.txt')) as file:
+            self.assertEqual(file.read(), 'Pedestrian 0 0 0 0 0 200 100 0 0 0 0 0 0 0\n')
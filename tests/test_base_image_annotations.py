@@ -12,6 +12,7 @@ Copyright:
 """
 
 import os
+import io
 import uuid
 from pathlib import Path
 import unittest
@@ -123,6 +124,27 @@ class TestImageAnnotations(unittest.TestCase):
         except Exception as e:
             self.fail(f'Error saving scaled image and annotation files to output folder: {e}')
 
+    # ===================================================================================
+    def test_image_annotations_in_memory(self):
+        """
+        Testing from_bytes() and encode() functions from ImageAnnotations class
+        """
+        try:
+            with open(self.path_to_image, 'rb') as file:
+                image_bytes = file.read()
+            with open(self.path_to_annotations, 'r') as file:
+                annotations_text = file.read()
+
+            img_ann = ImageAnnotations.from_bytes(image_bytes, annotations_text)
+            img_ann.scale(self.target_width, self.target_height)
+            self.assertEqual(img_ann.scaled_annotations, self.expected_scaled_annotations)
+
+            with Image.open(io.BytesIO(img_ann.encode())) as img:
+                self.assertEqual(img.format, 'JPEG')
+                self.assertEqual(img.size, (self.target_width, self.target_height))
+        except Exception as e:
+            self.fail(f'Error scaling image and annotations in memory: {e}')
+
 # =======================================================================================
 if __name__ == '__main__':
     unittest.main(verbosity=2)
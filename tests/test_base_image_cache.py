@@ -0,0 +1,98 @@
+"""
+test_base_image_cache.py
+
+Description:
+    Unnitest for the decoded image cache
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import shutil
+import unittest
+from PIL import Image
+from core.image_cache import DecodedImageCache
+from core.image_annotations import ImageAnnotations
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_output = os.path.join(path_to_self, 'output')
+
+
+class TestImageCache(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        os.makedirs(path_to_output, exist_ok = True)
+        self.images = []
+        for i in range(3):
+            path = os.path.join(path_to_output, f'{i:06d}.jpg')
+            Image.new(mode = 'RGB', size = (100, 100), color = (i, 0, 0)).save(path)
+            self.images.append(path)
+        self.path_to_annotations = os.path.join(path_to_output, '000000.txt')
+        with open(self.path_to_annotations, 'w') as file:
+            file.write('Car 0 0 0 10 10 50 50 0 0 0 0 0 0 0\n')
+
+    # ===================================================================================
+    def tearDown(self):
+        shutil.rmtree(path_to_output)
+
+    # ===================================================================================
+    def test_image_cache_hits(self):
+        """
+        Testing repeated requests of a file are decoded once and scale as the file
+        """
+        cache = DecodedImageCache(max_bytes = 10**6)
+        image = cache.image(self.images[0])
+        self.assertIs(cache.image(self.images[0]), image)
+        annotations = cache.annotations(self.path_to_annotations)
+        self.assertIs(cache.annotations(self.path_to_annotations), annotations)
+        metrics = cache.metrics
+        self.assertEqual((metrics['hits'], metrics['misses'], metrics['entries']), (2, 2, 2))
+
+        cached = ImageAnnotations(image, annotations)
+        cached.scale(50, 50)
+        direct = ImageAnnotations(self.images[0], self.path_to_annotations)
+        direct.scale(50, 50)
+        self.assertEqual(cached.scaled_annotations, direct.scaled_annotations)
+        self.assertEqual(cached.encode(), direct.encode())
+        # The cached image is left as decoded
+        self.assertEqual(cache.image(self.images[0]).size, (100, 100))
+
+    # ===================================================================================
+    def test_image_cache_bounds(self):
+        """
+        Testing the least recently used images are evicted past the memory bound,
+        changed files are decoded again and images over the bound are not cached
+        """
+        # Two decoded 100x100 RGB images
+        cache = DecodedImageCache(max_bytes = 2 * 100 * 100 * 3)
+        cache.image(self.images[0])
+        cache.image(self.images[1])
+        cache.image(self.images[0])
+        cache.image(self.images[2])
+        metrics = cache.metrics
+        self.assertEqual((metrics['entries'], metrics['evictions']), (2, 1))
+        self.assertLessEqual(metrics['bytes'], metrics['max_bytes'])
+        # images[1] was the least recently used
+        cache.image(self.images[0])
+        self.assertEqual(cache.metrics['hits'], 2)
+        cache.image(self.images[1])
+        self.assertEqual(cache.metrics['misses'], 4)
+
+        # Rewritten file, new modification time
+        Image.new(mode = 'RGB', size = (100, 100), color = (0, 0, 255)).save(self.images[1])
+        stat = os.stat(self.images[1])
+        os.utime(self.images[1], ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertGreater(cache.image(self.images[1]).getpixel((0, 0))[2], 200)
+        self.assertEqual(cache.metrics['misses'], 5)
+
+        # Disabled cache
+        cache = DecodedImageCache(max_bytes = 0)
+        cache.image(self.images[0])
+        cache.image(self.images[0])
+        metrics = cache.metrics
+        self.assertEqual((metrics['misses'], metrics['entries'], metrics['bytes']), (2, 0, 0))
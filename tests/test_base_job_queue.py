@@ -0,0 +1,162 @@
+"""
+test_base_job_queue.py
+
+Description:
+    Unnitest for the shared job queue and its worker
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import unittest
+import threading
+import subprocess
+from pathlib import Path
+from PIL import Image
+from core.job_queue import JobQueue
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_worker = os.path.abspath(os.path.join(path_to_self, '..', 'script', 'worker.py'))
+
+PARAMS = {'input_path': '', 'output_path': '', 'target_width': 100, 'target_height': 100}
+
+
+class TestJobQueue(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize an empty queue"""
+        self.path_to_output = os.path.join(path_to_self, 'output')
+        Path(os.fspath(self.path_to_output)).mkdir()
+        self.path_to_queue = os.path.join(self.path_to_output, 'jobs.sqlite')
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_output)
+
+    # ===================================================================================
+    def test_job_queue_claim(self):
+        """
+        Testing JobQueue.claim() hands every job to a single worker, highest priority first
+        """
+        queue = JobQueue(self.path_to_queue)
+        low = queue.submit('user', PARAMS, priority = 1)
+        high = queue.submit('user', PARAMS, priority = 8)
+        self.assertEqual(low['status'], 'queued')
+        self.assertEqual(low['output_folder'], 'output-'+low['job_id'])
+        self.assertEqual(queue.claim('worker-0')['job_id'], high['job_id'])
+        claimed = queue.claim('worker-0')
+        self.assertEqual((claimed['job_id'], claimed['status'], claimed['worker']), (low['job_id'], 'running', 'worker-0'))
+        self.assertIsNone(queue.claim('worker-0'))
+
+        # Workers on several nodes share the database
+        submitted = {queue.submit('user', PARAMS)['job_id'] for _ in range(20)}
+        claims = []
+
+        def work(worker_id):
+            node = JobQueue(self.path_to_queue)
+            while True:
+                job = node.claim(worker_id)
+                if job is None:
+                    return
+                claims.append(job['job_id'])
+
+        workers = [threading.Thread(target = work, args = (f'worker-{i}',)) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(sorted(claims), sorted(submitted))
+
+    # ===================================================================================
+    def test_job_queue_lease(self):
+        """
+        Testing JobQueue jobs whose lease expired are claimed again, up to max_attempts
+        """
+        queue = JobQueue(self.path_to_queue, lease_time = 0.2, max_attempts = 2)
+        job_id = queue.submit('user', PARAMS)['job_id']
+        queue.claim('worker-0')
+        self.assertTrue(queue.heartbeat(job_id, 'worker-0', total = 10, done = 4, chunks = 1))
+        self.assertEqual((queue.get(job_id)['done'], queue.get(job_id)['chunks']), (4, 1))
+        self.assertIsNone(queue.claim('worker-1'))
+
+        # worker-0 died, its job is resumed by worker-1
+        time.sleep(0.3)
+        job = queue.claim('worker-1')
+        self.assertEqual((job['job_id'], job['attempts'], job['done']), (job_id, 2, 4))
+        self.assertFalse(queue.heartbeat(job_id, 'worker-0'))
+        self.assertFalse(queue.finish(job_id, 'worker-0', True))
+
+        # A worker shut down gives the job back without counting the attempt
+        self.assertTrue(queue.release(job_id, 'worker-1'))
+        self.assertEqual(queue.claim('worker-1')['attempts'], 2)
+
+        # Too many attempts
+        time.sleep(0.3)
+        self.assertIsNone(queue.claim('worker-2'))
+        self.assertEqual(queue.get(job_id)['status'], 'failed')
+
+    # ===================================================================================
+    def test_job_queue_cancel(self):
+        """
+        Testing JobQueue.cancel() for queued and running jobs
+        """
+        queue = JobQueue(self.path_to_queue)
+        queued = queue.submit('user', PARAMS)['job_id']
+        running = queue.submit('user', PARAMS)['job_id']
+        self.assertEqual(queue.cancel(queued)['status'], 'cancelled')
+        self.assertEqual(queue.claim('worker-0')['job_id'], running)
+
+        # Stopped by its worker at the next heartbeat
+        job = queue.cancel(running)
+        self.assertEqual((job['status'], job['cancel_requested']), ('running', True))
+        self.assertFalse(queue.heartbeat(running, 'worker-0'))
+        self.assertTrue(queue.finish(running, 'worker-0', False, 'Stopped'))
+        self.assertEqual(queue.get(running)['status'], 'cancelled')
+        self.assertIsNone(queue.cancel('unknown'))
+
+    # ===================================================================================
+    def test_job_queue_worker(self):
+        """
+        Testing script/worker.py runs the queued jobs and resumes them from their manifest
+        """
+        path_to_data = os.path.join(self.path_to_output, 'data')
+        Path(os.fspath(os.path.join(path_to_data, 'images'))).mkdir(parents=True)
+        Path(os.fspath(os.path.join(path_to_data, 'annotations'))).mkdir()
+        image = Image.new(mode='RGB', size = (500,500), color = (0,255,0))
+        for i in range(3):
+            image.save(os.path.join(path_to_data, 'images', f'frame-{i}.jpg'))
+            with open(os.path.join(path_to_data, 'annotations', f'frame-{i}.txt'), 'w') as file:
+                file.write('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n')
+
+        queue = JobQueue(self.path_to_queue)
+        job = queue.submit('user', {**PARAMS, 'input_path': path_to_data, 'output_path': path_to_data})
+
+        # A previous attempt produced frame-0 before its worker died
+        path_to_manifest = os.path.join(path_to_data, job['output_folder'], 'manifests', 'shard-00000-of-00001.json')
+        Path(os.fspath(os.path.dirname(path_to_manifest))).mkdir(parents=True)
+        with open(path_to_manifest, 'w') as file:
+            json.dump({'assigned': ['frame-0', 'frame-1', 'frame-2'], 'produced': ['frame-0'], 'failed': []}, file)
+
+        subprocess.run([sys.executable, path_to_worker, '--queue_path', self.path_to_queue,
+                        '--exit_when_empty', '--chunk_size', '2', '--log_level', 'ERROR'],
+                       check = True, timeout = 60, stderr = subprocess.DEVNULL)
+
+        job = queue.get(job['job_id'])
+        self.assertEqual((job['status'], job['total'], job['done'], job['failed'], job['chunks']), ('done', 3, 3, 0, 1))
+        with open(path_to_manifest) as file:
+            manifest = json.load(file)
+        self.assertTrue(manifest['complete'])
+        self.assertEqual(sorted(manifest['produced']), ['frame-0', 'frame-1', 'frame-2'])
+        # frame-0 was not scaled again
+        self.assertEqual(sorted(os.listdir(os.path.join(path_to_data, job['output_folder'], 'images'))),
+                         ['frame-1.jpg', 'frame-2.jpg'])
@@ -0,0 +1,64 @@
+"""
+test_base_loggers.py
+
+Description:
+    Unnitest for the queued loggers
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import logging
+import unittest
+from logging.handlers import QueueListener
+from utils.loggers import BoundedQueueHandler
+
+
+class ListHandler(logging.Handler):
+    """Keep the handled records"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestLoggers(unittest.TestCase):
+
+    # ===================================================================================
+    def test_loggers_bounded_queue(self):
+        """
+        Testing BoundedQueueHandler never blocks, drops info records and keeps warnings once full
+        """
+        logger = logging.getLogger('test_loggers_bounded_queue')
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        handler = BoundedQueueHandler(maxsize = 3)
+        logger.addHandler(handler)
+        try:
+            for i in range(5):
+                logger.info('info %d', i)
+            self.assertEqual(handler.dropped, 2)
+            logger.warning('warning')
+            # The oldest record made room for the warning
+            self.assertEqual(handler.dropped, 3)
+            queued = [handler.queue.get_nowait().getMessage() for _ in range(3)]
+            self.assertEqual(queued, ['info 1', 'info 2', 'warning'])
+
+            # The drops are reported with the next record written
+            target = ListHandler()
+            listener = QueueListener(handler.queue, target)
+            listener.start()
+            logger.info('after')
+            listener.stop()
+            messages = [record.getMessage() for record in target.records]
+            self.assertEqual(messages, ['3 log records dropped, the log queue was full', 'after'])
+            self.assertEqual(target.records[0].levelno, logging.WARNING)
+            self.assertEqual(handler.dropped, 0)
+        finally:
+            logger.removeHandler(handler)
@@ -0,0 +1,83 @@
+"""
+test_base_parallel_scale.py
+
+Description:
+    Unnitest for the scaling over worker processes
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import shutil
+import unittest
+from pathlib import Path
+from PIL import Image
+from core.image_annotations import ImageAnnotations
+from core.path_consistensy import InputOutputPathConsistensy
+from core.parallel_scale import ParallelScaler
+from core.custom_exceptions import UnvalidAnnotationsFile
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+
+
+class TestParallelScale(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize a dataset with a pair of unvalid annotations"""
+        self.path_to_output = os.path.join(path_to_self, 'output')
+        path_to_data = os.path.join(self.path_to_output, 'data')
+        for folder in ('images', 'annotations'):
+            Path(os.fspath(os.path.join(path_to_data, folder))).mkdir(parents = True)
+        self.filenames = [f'{i:06d}' for i in range(5)]
+        for i, filename in enumerate(self.filenames):
+            Image.new(mode = 'RGB', size = (400, 200), color = (50*i, 0, 0)).save(
+                os.path.join(path_to_data, 'images', filename+'.jpg'))
+            with open(os.path.join(path_to_data, 'annotations', filename+'.txt'), 'w') as file:
+                if i == 3:
+                    file.write('Car 0 0 0 0 0 0 0 0 0 0 0 0 0\n')
+                else:
+                    file.write(f'Car 0 0 0 {i} 10 200 100 0 0 0 0 0 0 0\n')
+        self.paths = InputOutputPathConsistensy(path_to_data, self.path_to_output, target_folder = 'scaled')
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_output)
+
+    # ===================================================================================
+    def test_parallel_scale(self):
+        """
+        Testing workers scale as this process, in order, and send errors back
+        """
+        scaler = ParallelScaler(self.paths, 100, 50, workers = 2, frames = True, chunk_size = 2)
+        try:
+            results = list(scaler.scale(self.filenames))
+            # No new task once stopped
+            self.assertEqual(list(scaler.scale(self.filenames, stop = lambda: True)), [])
+        finally:
+            scaler.close()
+
+        self.assertEqual([filename for filename, _, _ in results], self.filenames)
+        filename, frame, error = results[3]
+        self.assertIsNone(frame)
+        self.assertIsInstance(error, UnvalidAnnotationsFile)
+        self.assertEqual(error.reason, 'unvalid_box')
+
+        filename, frame, error = results[1]
+        self.assertIsNone(error)
+        img_ann = ImageAnnotations(os.path.join(self.paths.path_to_images, filename+'.jpg'),
+                                   os.path.join(self.paths.path_to_annotations, filename+'.txt'))
+        img_ann.scale(100, 50)
+        class_names, parameters, width, height = frame
+        self.assertEqual(class_names, img_ann.scaled_frame[0])
+        self.assertEqual(parameters.tolist(), img_ann.scaled_frame[1].tolist())
+        self.assertEqual((width, height), (100, 50))
+        with open(os.path.join(self.paths.path_to_scaled_images, filename+'.jpg'), 'rb') as file:
+            self.assertEqual(file.read(), img_ann.encode())
+        with open(os.path.join(self.paths.path_to_scaled_annotations, filename+'.txt')) as file:
+            self.assertEqual(file.read().splitlines(), img_ann.scaled_annotations)
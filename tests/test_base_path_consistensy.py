@@ -12,6 +12,7 @@ Copyright:
 """
 
 import os
+import shutil
 import uuid
 import re
 from pathlib import Path
@@ -103,6 +104,22 @@ class TestPathConsistensy(unittest.TestCase):
             except FileNotFoundError as e:
                 self.fail(f'Error preparing output folder: {e}')
 
+    # ===================================================================================
+    def test_path_consistensy_output_inside_input_path(self):
+        """
+        Testing output folders of previous runs inside the input path are ignored
+        """
+        try:
+            InputOutputPathConsistensy(self.path_to_input, self.path_to_input)
+            second = InputOutputPathConsistensy(self.path_to_input, self.path_to_input)
+            self.assertEqual(len(second.get_filenames_no_extension()), 3)
+        except Exception as e:
+            self.fail(f'Error checking input/output consistensty: {e}')
+        finally:
+            for name in os.listdir(self.path_to_input):
+                if name.startswith('output-'):
+                    shutil.rmtree(os.path.join(self.path_to_input, name))
+
     # ===================================================================================
     def test_path_consistensy_non_existent_input_path(self):
         """
@@ -0,0 +1,49 @@
+"""
+test_base_profiles.py
+
+Description:
+    Unnitest for the scaling profiles
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import io
+import unittest
+import numpy as np
+from PIL import Image
+from core.image_annotations import ImageAnnotations
+from core.profiles import PROFILES, get_profile
+
+
+class TestProfiles(unittest.TestCase):
+
+    # ===================================================================================
+    def test_profiles_encode(self):
+        """
+        Testing ImageAnnotations.scale() and encode() follow the settings of the profile
+        """
+        rng = np.random.default_rng(0)
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, size = (400, 600, 3), dtype = np.uint8)).save(buffer, format = 'JPEG')
+        annotations = 'Car 0 0 0 100 100 300 200 0 0 0 0 0 0 0'
+
+        sizes = {}
+        for name in ('fast', 'quality'):
+            img_ann = ImageAnnotations.from_bytes(buffer.getvalue(), annotations)
+            img_ann.scale(284, 284, profile = get_profile(name))
+            encoded = img_ann.encode()
+            sizes[name] = len(encoded)
+            with Image.open(io.BytesIO(encoded)) as image:
+                self.assertEqual(bool(image.info.get('progressive')), PROFILES[name].progressive)
+            self.assertEqual(img_ann.scaled_annotations, ['Car 0 0 0 47.33 71 142 142 0 0 0 0 0 0 0'])
+        self.assertGreater(sizes['quality'], sizes['fast'])
+
+        # Encoder settings only apply to JPEG
+        self.assertEqual(PROFILES['quality'].save_kwargs('PNG'), {})
+        self.assertIsNone(get_profile(''))
+        with self.assertRaises(ValueError):
+            get_profile('unknown')
@@ -0,0 +1,81 @@
+"""
+test_base_resize.py
+
+Description:
+    Unnitest for the resize backends
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import io
+import unittest
+import numpy as np
+from PIL import Image
+from core.image_annotations import ImageAnnotations
+from core.resize import integer_factors, draft_scale, resize_image, area_downscale_numpy, psnr
+
+
+class TestResize(unittest.TestCase):
+
+    # ===================================================================================
+    @classmethod
+    def setUpClass(self):
+        """Initialize a noisy gradient image"""
+        rng = np.random.default_rng(0)
+        y, x = np.mgrid[0:568, 0:1136]
+        pixels = np.stack([x * 255 // 1136, y * 255 // 568, (x + y) * 255 // 1704], axis = -1)
+        self.pixels = np.clip(pixels + rng.normal(0, 8, size = pixels.shape), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(self.pixels).save(buffer, format = 'JPEG', quality = 90)
+        self.jpeg = buffer.getvalue()
+
+    # ===================================================================================
+    def test_resize_factors(self):
+        """
+        Testing integer_factors() and draft_scale()
+        """
+        self.assertEqual(integer_factors((1136, 568), (284, 284)), (4, 2))
+        self.assertIsNone(integer_factors((1136, 568), (300, 284)))
+        self.assertEqual(draft_scale((1136, 568), (284, 284)), 2)
+        self.assertEqual(draft_scale((1136, 568), (142, 71)), 8)
+        self.assertIsNone(draft_scale((1136, 568), (300, 300)))
+
+    # ===================================================================================
+    def test_resize_backends(self):
+        """
+        Testing the area and numpy backends compute the same box filter, close to pil
+        """
+        image = Image.fromarray(self.pixels)
+        area = resize_image(image, (284, 284), 'area')
+        numpy = area_downscale_numpy(image, (4, 2))
+        self.assertEqual(area.size, (284, 284))
+        np.testing.assert_array_equal(np.asarray(area), np.asarray(numpy))
+        np.testing.assert_array_equal(np.asarray(numpy)[0, 0], np.round(self.pixels[:2, :4].mean(axis = (0, 1))))
+        self.assertGreater(psnr(area, image.resize((284, 284))), 35)
+
+        # Decoded at half the size first
+        jpeg = Image.open(io.BytesIO(self.jpeg))
+        resized = resize_image(jpeg, (284, 284), 'numpy')
+        self.assertEqual((jpeg.size, resized.size), ((568, 284), (284, 284)))
+        self.assertGreater(psnr(resized, Image.open(io.BytesIO(self.jpeg)).resize((284, 284))), 35)
+
+        # No integer factors
+        self.assertEqual(psnr(resize_image(image, (300, 300), 'area'), image.resize((300, 300))), float('inf'))
+        with self.assertRaises(ValueError):
+            resize_image(image, (284, 284), 'unknown')
+
+    # ===================================================================================
+    def test_resize_image_annotations(self):
+        """
+        Testing ImageAnnotations.scale() scales the annotations from the original size with any backend
+        """
+        annotations = 'Car 0 0 0 100.5 200.25 400 500 0 0 0 0 0 0 0'
+        for backend in ('pil', 'area', 'numpy'):
+            img_ann = ImageAnnotations.from_bytes(self.jpeg, annotations)
+            img_ann.scale(284, 284, resize_backend = backend)
+            self.assertEqual(img_ann.scaled_image.size, (284, 284))
+            self.assertEqual(img_ann.scaled_annotations, ['Car 0 0 0 25.12 100.12 100 250 0 0 0 0 0 0 0'])
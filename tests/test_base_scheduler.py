@@ -0,0 +1,104 @@
+"""
+test_base_scheduler.py
+
+Description:
+    Unnitest for the fair-share scheduler
+
+Author: 
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import asyncio
+import unittest
+from core.scheduler import FairShareScheduler
+
+
+async def run_chunks(scheduler, ticket, chunks, log):
+    """Run chunks of a job one after the other, recording who got the slot"""
+    for _ in range(chunks):
+        await scheduler.acquire(ticket, cost = 10)
+        log.append(ticket.user_id)
+        await asyncio.sleep(0)
+        scheduler.release(ticket)
+
+
+class TestScheduler(unittest.TestCase):
+
+    # ===================================================================================
+    def test_scheduler_weighted_fair_share(self):
+        """
+        Testing slots are shared between users following the weights of their priority
+        """
+        async def scenario():
+            scheduler = FairShareScheduler(slots = 1, default_quota = 1)
+            log = []
+            await asyncio.gather(run_chunks(scheduler, scheduler.ticket('batch', 1), 100, log),
+                                 run_chunks(scheduler, scheduler.ticket('interactive', 8), 40, log))
+            return log
+
+        log = asyncio.run(scenario())
+        # While both are waiting, the interactive user gets 8 slots for each batch one
+        first = log[:45]
+        self.assertEqual(first.count('interactive'), 40)
+        self.assertEqual(first.count('batch'), 5)
+        self.assertEqual(len(log), 140)
+
+    # ===================================================================================
+    def test_scheduler_preemption_and_queue_position(self):
+        """
+        Testing a large job gives way between chunks to a job arriving later
+        """
+        async def scenario():
+            scheduler = FairShareScheduler(slots = 1, default_quota = 1)
+            large = scheduler.ticket('user-a', 4)
+            small = scheduler.ticket('user-b', 4)
+
+            # The large job already ran some chunks
+            for _ in range(3):
+                await scheduler.acquire(large, cost = 10)
+                scheduler.release(large)
+            await scheduler.acquire(large, cost = 10)
+
+            waiting = asyncio.ensure_future(scheduler.acquire(small, cost = 10))
+            await asyncio.sleep(0.01)
+            position_while_waiting = small.position()
+
+            # Next chunk of the large job is queued behind the small one
+            next_chunk = asyncio.ensure_future(scheduler.acquire(large, cost = 10))
+            await asyncio.sleep(0.01)
+            scheduler.release(large)
+            await waiting
+            position_of_large = large.position()
+            scheduler.release(small)
+            await next_chunk
+            return position_while_waiting, position_of_large, small.position()
+
+        self.assertEqual(asyncio.run(scenario()), (1, 1, None))
+
+    # ===================================================================================
+    def test_scheduler_quotas(self):
+        """
+        Testing a user never holds more slots than its quota and cancelled requests leave the queue
+        """
+        async def scenario():
+            scheduler = FairShareScheduler(slots = 3, default_quota = 1, quotas = {'user-b': 2})
+            a1, a2 = scheduler.ticket('user-a', 4), scheduler.ticket('user-a', 4)
+            b1, b2 = scheduler.ticket('user-b', 4), scheduler.ticket('user-b', 4)
+            tasks = [asyncio.ensure_future(scheduler.acquire(ticket)) for ticket in (a1, a2, b1, b2)]
+            await asyncio.sleep(0.01)
+            granted = [ticket.holding for ticket in (a1, a2, b1, b2)]
+
+            # The second job of user-a waits for its quota, not for a free slot
+            tasks[1].cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+            return granted, scheduler.waiting, scheduler.free
+
+        self.assertEqual(asyncio.run(scenario()), ([True, False, True, True], 0, 0))
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
@@ -0,0 +1,36 @@
+"""
+test_base_serializer.py
+
+Description:
+    Unnitest for the annotations serializer
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import unittest
+import numpy as np
+from core.serializer import AnnotationSerializer
+
+
+class TestSerializer(unittest.TestCase):
+
+    # ===================================================================================
+    def test_serializer_format(self):
+        """
+        Testing AnnotationSerializer.format() formats a whole frame with the float policy
+        """
+        parameters = np.zeros((3, 14))
+        parameters[0, 3:7] = [101.1, 47.714, 130.64, 81.0]
+        parameters[1, 3:7] = [-0.001, 1000000, 0.5, 10.05]
+        serializer = AnnotationSerializer()
+        self.assertEqual(serializer.format(['helmet', 'person', 'Car'], parameters),
+                         'helmet 0 0 0 101.1 47.71 130.64 81 0 0 0 0 0 0 0\n'
+                         'person 0 0 0 0 1000000 0.5 10.05 0 0 0 0 0 0 0\n'
+                         'Car 0 0 0 0 0 0 0 0 0 0 0 0 0 0\n')
+        self.assertEqual(serializer.format([], np.zeros((0, 14))), '')
+        self.assertEqual(AnnotationSerializer(trim = False).lines(['Car'], parameters[:1])[0],
+                         'Car 0.00 0.00 0.00 101.10 47.71 130.64 81.00 0.00 0.00 0.00 0.00 0.00 0.00 0.00')
@@ -0,0 +1,125 @@
+"""
+test_base_sharding.py
+
+Description:
+    Unnitest for sharding and run manifests
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import shutil
+import json
+import random
+from pathlib import Path
+import unittest
+from core.manifest import RunManifest
+from core.sharding import shard_of, select_shard, manifest_path, merge_shards
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+
+class TestSharding(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize a shared output folder"""
+        self.path_to_output_folder = os.path.join(path_to_self, 'output')
+        Path(os.fspath(self.path_to_output_folder)).mkdir()
+        self.filenames = [f'frame{i:06d}' for i in range(3000)]
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_output_folder)
+
+    # ===================================================================================
+    def write_shard(self, num_shards, shard_index, produced = None, complete = True):
+        assigned = select_shard(self.filenames, num_shards, shard_index)
+        manifest = RunManifest(manifest_path(self.path_to_output_folder, num_shards, shard_index))
+        manifest.assign(assigned)
+        for filename in (assigned if produced is None else produced):
+            manifest.add(filename)
+        manifest.write(complete = complete)
+
+    # ===================================================================================
+    def test_sharding_partition(self):
+        """
+        Testing shards are disjoint, balanced and independent of the listing order
+        """
+        shards = [select_shard(self.filenames, 4, i) for i in range(4)]
+        self.assertEqual(sorted(sum(shards, [])), self.filenames)
+        for shard in shards:
+            self.assertGreater(len(shard), 600)
+
+        shuffled = list(self.filenames)
+        random.shuffle(shuffled)
+        self.assertEqual(select_shard(shuffled, 4, 2), shards[2])
+        self.assertEqual(shard_of('frame000042', 4), shard_of('frame000042', 4))
+
+    # ===================================================================================
+    def test_sharding_merge(self):
+        """
+        Testing the merge of all shards of a run
+        """
+        for i in range(3):
+            self.write_shard(3, i)
+        result = merge_shards(self.path_to_output_folder, self.filenames)
+        self.assertTrue(result['valid'])
+        self.assertEqual(result['produced'], len(self.filenames))
+
+    # ===================================================================================
+    def test_sharding_merge_errors(self):
+        """
+        Testing the merge detects missing, incomplete and duplicated shards
+        """
+        self.write_shard(3, 0)
+        # Shard 1 produces a pair of shard 0 and none of its own
+        duplicated = select_shard(self.filenames, 3, 0)[0]
+        self.write_shard(3, 1, produced = [duplicated], complete = False)
+        result = merge_shards(self.path_to_output_folder, self.filenames)
+        self.assertFalse(result['valid'])
+        self.assertEqual(result['missing_shards'], [2])
+        self.assertEqual(result['incomplete_shards'], [1])
+        self.assertEqual(result['produced_more_than_once'], [duplicated])
+        self.assertGreater(len(result['missing']), 0)
+
+    # ===================================================================================
+    def test_sharding_manifest_journal(self):
+        """
+        Testing updates in the middle of a run are journaled and the manifest rewritten once the journal is as large
+        """
+        path = manifest_path(self.path_to_output_folder, 1, 0)
+        manifest = RunManifest(path)
+        manifest.write()
+        for i in range(0, 3000, 100):
+            batch = self.filenames[i:i+100]
+            manifest.assign(batch)
+            for filename in batch:
+                manifest.add(filename)
+            manifest.add_commit()
+            manifest.update()
+            data = RunManifest.read(path)
+            self.assertEqual((data['assigned'], data['produced']), (self.filenames[:i+100], self.filenames[:i+100]))
+            self.assertEqual(len(data['commits']), i // 100 + 1)
+        # The last updates were only appended to the journal
+        with open(path) as file:
+            self.assertLess(len(json.load(file)['produced']), len(self.filenames))
+
+        # A rewrite interrupted before the journal was removed, and a journal entry cut short
+        journal = os.path.splitext(path)[0]+'.journal.jsonl'
+        with open(journal) as file:
+            entries = file.read()
+        manifest.write(complete = True)
+        with open(journal, 'w') as file:
+            file.write(entries+'{"sequence": 99, "assig')
+        self.assertEqual(RunManifest.read(path)['produced'], self.filenames)
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
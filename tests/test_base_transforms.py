@@ -0,0 +1,91 @@
+"""
+test_base_transforms.py
+
+Description:
+    Unnitest for the geometric transforms of images and annotations
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import io
+import unittest
+import numpy as np
+from PIL import Image
+from core.annotations import Annotations
+from core.image_annotations import ImageAnnotations
+from core.transforms import (
+    Compose, Crop, Resize, LetterboxPad, HorizontalFlip, Affine, transform_boxes
+)
+
+
+class TestTransforms(unittest.TestCase):
+
+    # ===================================================================================
+    def test_transforms_fold(self):
+        """
+        Testing Compose.fold() folds a chain of transforms into a single matrix
+        """
+        transforms = Compose([Crop(100, 50, 400, 300), Resize(200, 150), HorizontalFlip()])
+        matrix, size = transforms.fold(640, 480)
+        self.assertEqual(size, (200, 150))
+        np.testing.assert_allclose(matrix, [[-0.5, 0, 250], [0, 0.5, -25], [0, 0, 1]])
+
+        matrix, size = Compose([LetterboxPad(320, 320)]).fold(640, 480)
+        self.assertEqual(size, (320, 320))
+        np.testing.assert_allclose(matrix, [[0.5, 0, 0], [0, 0.5, 40], [0, 0, 1]])
+
+    # ===================================================================================
+    def test_transforms_boxes(self):
+        """
+        Testing transform_boxes() clips the boxes and drops those left outside the image
+        """
+        matrix, size = Compose([Crop(100, 100, 200, 200)]).fold(500, 500)
+        boxes, keep = transform_boxes([[150, 150, 200, 200], [50, 120, 150, 180], [0, 0, 50, 50]], matrix, size)
+        np.testing.assert_allclose(boxes[:2], [[50, 50, 100, 100], [0, 20, 50, 80]])
+        self.assertEqual(keep.tolist(), [True, True, False])
+
+        # A rotated box becomes the box enclosing its corners
+        matrix, size = Compose([Affine.rotation(90, (50, 50))]).fold(100, 100)
+        boxes, keep = transform_boxes([[10, 20, 30, 60]], matrix, size)
+        np.testing.assert_allclose(boxes, [[20, 70, 60, 90]], atol = 1e-9)
+
+    # ===================================================================================
+    def test_transforms_image_annotations(self):
+        """
+        Testing ImageAnnotations.transform() moves the image content along with its boxes
+        """
+        image = Image.new(mode = 'RGB', size = (400, 200), color = (0, 0, 0))
+        image.paste((0, 255, 0), (40, 40, 120, 120))
+        buffer = io.BytesIO()
+        image.save(buffer, format = 'PNG')
+        annotations = 'helmet 0 0 0 40 40 120 120 0 0 0 0 0 0 0\nperson 0 0 0 390 10 400 20 0 0 0 0 0 0 0'
+
+        pair = ImageAnnotations.from_bytes(buffer.getvalue(), annotations)
+        pair.transform(Compose([Crop(0, 0, 300, 200), HorizontalFlip(), LetterboxPad(150, 150)],
+                               fill = (114, 114, 114)))
+
+        self.assertEqual(pair.scaled_image.size, (150, 150))
+        # Box outside of the crop dropped
+        self.assertEqual(pair.scaled_annotations, ['helmet 0 0 0 90 45 130 85 0 0 0 0 0 0 0'])
+        self.assertEqual(pair.scaled_image.getpixel((110, 65)), (0, 255, 0))
+        self.assertEqual(pair.scaled_image.getpixel((75, 20)), (114, 114, 114))
+        self.assertEqual(pair.scaled_image.getpixel((20, 65)), (0, 0, 0))
+
+        # Same boxes whatever the path of the image
+        rotated = ImageAnnotations.from_bytes(buffer.getvalue(), annotations)
+        rotated.transform(Compose([Affine.rotation(180, (200, 100))]))
+        self.assertEqual(rotated.scaled_annotations[0], 'helmet 0 0 0 280 80 360 160 0 0 0 0 0 0 0')
+        self.assertEqual(rotated.scaled_image.getpixel((320, 120)), (0, 255, 0))
+
+    # ===================================================================================
+    def test_transforms_annotations_fields(self):
+        """
+        Testing Annotations.transform() keeps every other parameter of the annotations
+        """
+        annotations = Annotations(text = 'Car 0 0 0 100.5 200.25 400 500 0 0 0 0 0 0 0', check = False)
+        matrix, size = Compose([Resize(284, 284)]).fold(1136, 568)
+        self.assertEqual(annotations.transform(matrix, size), ['Car 0 0 0 25.12 100.12 100 250 0 0 0 0 0 0 0'])
@@ -0,0 +1,110 @@
+"""
+test_base_validation.py
+
+Description:
+    Unnitest for dataset validation
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import json
+import shutil
+from pathlib import Path
+import unittest
+from PIL import Image
+from core.validation import DatasetValidator
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+
+class TestValidation(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize a Kitti Format dataset with some unvalid files"""
+
+        self.path_to_data = os.path.join(path_to_self, 'data')
+        self.path_to_images = os.path.join(self.path_to_data, 'images')
+        self.path_to_annotations = os.path.join(self.path_to_data, 'annotations')
+        Path(os.fspath(self.path_to_data)).mkdir()
+        Path(os.fspath(self.path_to_images)).mkdir()
+        Path(os.fspath(self.path_to_annotations)).mkdir()
+
+        for i in range(3):
+            Image.new(mode='RGB', size = (500,500), color = (0,255,0)).save(
+                os.path.join(self.path_to_images, f'test{i}.jpg'))
+            with open(os.path.join(self.path_to_annotations, f'test{i}.txt'), 'w') as file:
+                file.write(f'helmet 0 0 0 {178+i} {84+i} {230+i} {143+i} 0 0 0 0 0 0 0'+'\n')
+
+        # Second and third annotations are unvalid
+        with open(os.path.join(self.path_to_annotations, 'test1.txt'), 'a') as file:
+            file.write('helmet 0 0 0 0 0 0 0 0 0 0 0 0 0 0'+'\n')
+            file.write('0 0 0 111 144 134 174 0 0 0 0 0 0 0'+'\n')
+
+        # Truncated image
+        with open(os.path.join(self.path_to_images, 'test2.jpg'), 'r+b') as file:
+            file.truncate(200)
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_data)
+
+    # ===================================================================================
+    def test_validation_annotations(self):
+        """
+        Testing every unvalid annotation is reported with file and line
+        """
+        validator = DatasetValidator(self.path_to_data, workers = 1)
+        violations = validator.run()
+        self.assertEqual(validator.pairs, 3)
+        self.assertFalse(validator.valid)
+        self.assertEqual([(os.path.basename(v['file']), v['line'], v['reason']) for v in violations],
+                         [('test1.txt', 2, 'unvalid_box'), ('test1.txt', 3, 'class')])
+
+    # ===================================================================================
+    def test_validation_jpeg(self):
+        """
+        Testing JPEG markers are only checked when asked
+        """
+        validator = DatasetValidator(self.path_to_data, check_jpeg = True, workers = 1)
+        reasons = {(os.path.basename(v['file']), v['reason']) for v in validator.run()}
+        self.assertIn(('test2.jpg', 'truncated'), reasons)
+        self.assertEqual(len(reasons), 3)
+
+    # ===================================================================================
+    def test_validation_unmatched_and_report(self):
+        """
+        Testing files without a one-to-one match are reported and written to a report
+        """
+        os.remove(os.path.join(self.path_to_annotations, 'test0.txt'))
+        validator = DatasetValidator(self.path_to_data, workers = 2)
+        violations = validator.run()
+        self.assertEqual(validator.pairs, 2)
+        self.assertEqual(violations[0]['reason'], 'length')
+        self.assertEqual(os.path.basename(violations[0]['file']), 'test0.jpg')
+
+        path_to_report = os.path.join(self.path_to_data, 'violations.jsonl')
+        validator.write_report(path_to_report)
+        with open(path_to_report, 'r') as file:
+            self.assertEqual(len([json.loads(line) for line in file]), 3)
+
+    # ===================================================================================
+    def test_validation_folder_structure(self):
+        """
+        Testing an input path that does not follow Kitti format folder structure
+        """
+        shutil.rmtree(self.path_to_annotations)
+        violations = DatasetValidator(self.path_to_data).run()
+        self.assertEqual(len(violations), 1)
+        self.assertEqual(violations[0]['reason'], 'folder')
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
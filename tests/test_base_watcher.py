@@ -0,0 +1,140 @@
+"""
+test_base_watcher.py
+
+Description:
+    Unnitest for input watcher
+
+Author:
+    Joan Pont
+
+Copyright:
+    Copyright © 2023, Trifork, All Rights Reserved
+"""
+
+import os
+import shutil
+from pathlib import Path
+import unittest
+from core.watcher import InputWatcher
+
+path_to_self = os.path.join(os.path.dirname(__file__))
+path_to_package = os.path.abspath(os.path.join(path_to_self, '..'))
+
+class TestInputWatcher(unittest.TestCase):
+
+    # ===================================================================================
+    def setUp(self):
+        """Initialize empty Kitti Format input folders and a fake clock"""
+
+        self.path_to_data = os.path.join(path_to_self, 'data')
+        self.path_to_images = os.path.join(self.path_to_data, 'images')
+        self.path_to_annotations = os.path.join(self.path_to_data, 'annotations')
+        Path(os.fspath(self.path_to_images)).mkdir(parents=True)
+        Path(os.fspath(self.path_to_annotations)).mkdir(parents=True)
+
+        self.now = 0.0
+        self.watcher = InputWatcher(self.path_to_images, self.path_to_annotations,
+                                    settle_time = 2.0, clock = lambda: self.now)
+
+    # ===================================================================================
+    def tearDown(self):
+        """Remove testing files and folders"""
+        shutil.rmtree(self.path_to_data)
+
+    # ===================================================================================
+    def write(self, filename, content = b'data', mode = 'wb'):
+        with open(os.path.join(self.path_to_data, filename), mode) as file:
+            file.write(content)
+
+    # ===================================================================================
+    def test_watcher_complete_pairs(self):
+        """
+        Testing pairs are only reported once both files are complete and stable
+        """
+        self.write('images/a.jpg')
+        self.assertEqual(self.watcher.poll(), [])
+
+        self.now = 1.0
+        self.write('annotations/a.txt')
+        self.assertEqual(self.watcher.poll(), [])
+
+        # Image is stable but the annotations file is still settling
+        self.now = 2.5
+        self.assertEqual(self.watcher.poll(), [])
+
+        self.now = 3.5
+        self.assertEqual(self.watcher.poll(), ['a'])
+
+        # Reported pairs are not reported again
+        self.now = 10.0
+        self.assertEqual(self.watcher.poll(), [])
+
+    # ===================================================================================
+    def test_watcher_growing_file(self):
+        """
+        Testing a file still being written is not reported
+        """
+        self.write('images/b.jpg')
+        self.write('annotations/b.txt')
+        self.watcher.poll()
+
+        self.now = 1.5
+        self.write('images/b.jpg', b' more data', mode = 'ab')
+        self.assertEqual(self.watcher.poll(), [])
+
+        self.now = 2.5
+        self.assertEqual(self.watcher.poll(), [])
+
+        self.now = 3.6
+        self.assertEqual(self.watcher.poll(), ['b'])
+
+    # ===================================================================================
+    def test_watcher_new_pairs_only(self):
+        """
+        Testing only new pairs are reported, deleted pairs are forgotten
+        """
+        self.write('images/c.jpg')
+        self.write('annotations/c.txt')
+        self.watcher.poll()
+        self.now = 2.0
+        self.assertEqual(self.watcher.poll(), ['c'])
+
+        self.write('images/d.jpg')
+        self.write('annotations/d.txt')
+        os.remove(os.path.join(self.path_to_images, 'c.jpg'))
+        self.watcher.poll()
+        self.now = 4.0
+        self.assertEqual(self.watcher.poll(), ['d'])
+
+        self.write('images/c.jpg')
+        self.watcher.poll()
+        self.now = 6.0
+        self.assertEqual(self.watcher.poll(), ['c'])
+
+    # ===================================================================================
+    def test_watcher_reported(self):
+        """
+        Testing pairs already scaled by a previous watch are only reported again once they land again
+        """
+        for filename in ('a', 'b'):
+            self.write(f'images/{filename}.jpg')
+            self.write(f'annotations/{filename}.txt')
+        watcher = InputWatcher(self.path_to_images, self.path_to_annotations,
+                               settle_time = 2.0, clock = lambda: self.now, reported = ['a'])
+        watcher.poll()
+        self.now = 3.0
+        self.assertEqual(watcher.poll(), ['b'])
+
+        os.remove(os.path.join(self.path_to_images, 'a.jpg'))
+        os.remove(os.path.join(self.path_to_annotations, 'a.txt'))
+        watcher.poll()
+        self.write('images/a.jpg')
+        self.write('annotations/a.txt')
+        watcher.poll()
+        self.now = 6.0
+        self.assertEqual(watcher.poll(), ['a'])
+
+# =======================================================================================
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+    exit(0)
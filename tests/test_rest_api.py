@@ -7,6 +7,12 @@ from subprocess import Popen, PIPE, TimeoutExpired
 import requests
 from PIL import Image
 import shutil
+import io
+import base64
+import json
+import tarfile
+import zipfile
+import socket
 
 REST_API_PORT = "8080"
 LOG_LEVEL = "ERROR"
@@ -118,12 +124,512 @@ class TestRestApi(unittest.TestCase):
             r.raise_for_status()
             result = r.json()
             self.assertEqual(result['message'], 'data successfully scaled')
+            job_id = result['job_id']
+
+            r = requests.get(f'{base_url}/jobs/{job_id}', 
+                             headers={'Authorization': f'bearer {self.token}'},
+                             timeout=20)
+            r.raise_for_status()
+            self.assertEqual(r.json()['status'], 'done')
+
+            # Download the output as a tar archive, in two parts
+            r = requests.get(f'{base_url}/jobs/{job_id}/download', 
+                             headers={'Authorization': f'bearer {self.token}'},
+                             timeout=20)
+            r.raise_for_status()
+            self.assertEqual(int(r.headers['Content-Length']), len(r.content))
+            r_resumed = requests.get(f'{base_url}/jobs/{job_id}/download', 
+                                     headers={'Authorization': f'bearer {self.token}',
+                                              'Range': 'bytes=1000-',
+                                              'If-Range': r.headers['Etag']},
+                                     timeout=20)
+            self.assertEqual(r_resumed.status_code, 206)
+            self.assertEqual(r_resumed.content, r.content[1000:])
+            with tarfile.open(fileobj=io.BytesIO(r.content)) as tar:
+                names = tar.getnames()
+            self.assertIn(f'output-{job_id}/annotations/{unique_id}.txt', names)
+            self.assertIn(f'output-{job_id}/images/{unique_id}.jpg', names)
+
+            # Download the output as a zip archive
+            r = requests.get(f'{base_url}/jobs/{job_id}/download', 
+                             headers={'Authorization': f'bearer {self.token}'},
+                             params={'format': 'zip'},
+                             timeout=20)
+            r.raise_for_status()
+            with zipfile.ZipFile(io.BytesIO(r.content)) as archive:
+                self.assertIn(f'output-{job_id}/images/{unique_id}.jpg', archive.namelist())
         except Exception as e:
             self.fail(f'Error scaling data: {e}')
         finally:
             # Remove all testing files and directories
             shutil.rmtree(path_to_data)
  
+    # ===================================================================================
+    def test_rest_api_job_events(self):
+        """Testing REST API job progress events"""
+        try:
+            Path(os.fspath(os.path.join(path_to_self,'data'))).mkdir()
+            path_to_data = os.path.join(path_to_self, 'data')
+            Path(os.fspath(os.path.join(path_to_data,'images'))).mkdir()
+            Path(os.fspath(os.path.join(path_to_data,'annotations'))).mkdir()
+
+            image = Image.new(mode='RGB', size = (500,500), color = (0,255,0))      
+            for i in range(4):
+                image.save(os.path.join(path_to_data, 'images', f'frame-{i}.jpg'))
+                with open(os.path.join(path_to_data, 'annotations', f'frame-{i}.txt'), 'w') as file:
+                    # The last frame has an unvalid bounding box
+                    file.write('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n' if i < 3 else
+                               'helmet 0 0 0 0 0 0 0 0 0 0 0 0 0 0\n')
+
+            # Start the job without waiting for it
+            r = requests.get(f'{base_url}/images', 
+                             headers={'Authorization': f'bearer {self.token}'},
+                             params={"input_path" : f'{path_to_data}',
+                                     "output_path" : f'{path_to_data}',
+                                     "wait": 'false'},
+                             timeout=20)
+            self.assertEqual(r.status_code, 202)
+            job_id = r.json()['job_id']
+
+            # Follow it until it ends
+            events = []
+            with requests.get(f'{base_url}/jobs/{job_id}/events', 
+                              headers={'Authorization': f'bearer {self.token}'},
+                              stream=True,
+                              timeout=20) as r:
+                r.raise_for_status()
+                self.assertTrue(r.headers['Content-Type'].startswith('text/event-stream'))
+                event = None
+                for line in r.iter_lines(decode_unicode=True):
+                    if line.startswith('event: '):
+                        event = line[len('event: '):]
+                    elif line.startswith('data: '):
+                        events.append((event, json.loads(line[len('data: '):])))
+                        if event == 'end':
+                            break
+
+            self.assertEqual(events[0][0], 'progress')
+            name, end = events[-1]
+            self.assertEqual(name, 'end')
+            # The script aborts on the first failure by default
+            self.assertEqual(end['status'], 'failed')
+            self.assertEqual((end['total'], end['failed']), (4, 1))
+            self.assertLess(end['done'], 4)
+            self.assertEqual(end['recent_failures'][0]['filename'], 'frame-3')
+            self.assertIn('frame-3', [data['filename'] for name, data in events if name == 'failure'])
+        except Exception as e:
+            self.fail(f'Error following job events: {e}')
+        finally:
+            shutil.rmtree(os.path.join(path_to_self, 'data'))
+
+    # ===================================================================================
+    def test_rest_api_scale_deduplication(self):
+        """Testing REST API identical scaling requests share the same job"""
+        try:
+            Path(os.fspath(os.path.join(path_to_self,'data'))).mkdir()
+            path_to_data = os.path.join(path_to_self, 'data')
+            Path(os.fspath(os.path.join(path_to_data,'images'))).mkdir()
+            Path(os.fspath(os.path.join(path_to_data,'annotations'))).mkdir()
+
+            image = Image.new(mode='RGB', size = (500,500), color = (0,255,0))      
+            image.save(os.path.join(path_to_data, 'images', 'frame-0.jpg'))
+            with open(os.path.join(path_to_data, 'annotations', 'frame-0.txt'), 'w') as file:
+                file.write('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n')
+
+            def scale(wait, target_width = 284):
+                r = requests.get(f'{base_url}/images', 
+                                 headers={'Authorization': f'bearer {self.token}'},
+                                 params={"input_path" : f'{path_to_data}',
+                                         "output_path" : f'{path_to_data}',
+                                         "target_width": target_width,
+                                         "wait": wait},
+                                 timeout=20)
+                r.raise_for_status()
+                return r.json()
+
+            # In flight
+            first = scale('false')
+            second = scale('false')
+            self.assertEqual(second['job_id'], first['job_id'])
+            self.assertTrue(second['deduplicated'])
+
+            # Completed, the cached result is returned
+            third = scale('true')
+            self.assertEqual(third['job_id'], first['job_id'])
+            self.assertEqual(sorted(os.listdir(path_to_data)), ['annotations', 'images', first['output_folder']])
+
+            # Different parameters or input data
+            self.assertNotEqual(scale('false', target_width = 100)['job_id'], first['job_id'])
+            with open(os.path.join(path_to_data, 'annotations', 'frame-0.txt'), 'a') as file:
+                file.write('helmet 0 0 0 111 144 134 174 0 0 0 0 0 0 0\n')
+            self.assertFalse(scale('false')['deduplicated'])
+        except Exception as e:
+            self.fail(f'Error deduplicating requests: {e}')
+        finally:
+            shutil.rmtree(os.path.join(path_to_self, 'data'))
+
+    # ===================================================================================
+    def test_rest_api_job_cancel(self):
+        """Testing REST API job cancellation and deadline"""
+        try:
+            Path(os.fspath(os.path.join(path_to_self,'data'))).mkdir()
+            path_to_data = os.path.join(path_to_self, 'data')
+            Path(os.fspath(os.path.join(path_to_data,'images'))).mkdir()
+            Path(os.fspath(os.path.join(path_to_data,'annotations'))).mkdir()
+
+            image = Image.new(mode='RGB', size = (2000,2000), color = (0,255,0))
+            for i in range(100):
+                image.save(os.path.join(path_to_data, 'images', f'frame-{i}.jpg'))
+                with open(os.path.join(path_to_data, 'annotations', f'frame-{i}.txt'), 'w') as file:
+                    file.write('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n')
+            headers = {'Authorization': f'bearer {self.token}'}
+
+            r = requests.get(f'{base_url}/images', headers=headers,
+                             params={"input_path" : f'{path_to_data}',
+                                     "output_path" : f'{path_to_data}',
+                                     "wait": 'false'},
+                             timeout=20)
+            self.assertEqual(r.status_code, 202)
+            job_id = r.json()['job_id']
+            output_folder = r.json()['output_folder']
+
+            # Cancel once the script is scaling
+            for _ in range(100):
+                if requests.get(f'{base_url}/jobs/{job_id}', headers=headers, timeout=20).json()['done']:
+                    break
+                time.sleep(0.1)
+            r = requests.delete(f'{base_url}/jobs/{job_id}', headers=headers, timeout=20)
+            r.raise_for_status()
+            job = r.json()
+            self.assertEqual((job['status'], job['cancelled']), ('cancelled', 'cancelled'))
+            self.assertLess(job['done'], 100)
+
+            # Partial output is kept and marked incomplete
+            with open(os.path.join(path_to_data, output_folder, 'manifests', 'shard-00000-of-00001.json')) as file:
+                manifest = json.load(file)
+            self.assertFalse(manifest['complete'])
+            self.assertEqual(len(manifest['produced']), job['done'])
+            self.assertEqual(requests.delete(f'{base_url}/jobs/{job_id}', headers=headers, timeout=20).status_code, 409)
+            # Output folders are created inside the input folder, the next run needs it clean
+            shutil.rmtree(os.path.join(path_to_data, output_folder))
+
+            # Deadline exceeded, the output folder is kept
+            r = requests.get(f'{base_url}/images', headers=headers,
+                             params={"input_path" : f'{path_to_data}',
+                                     "output_path" : f'{path_to_data}',
+                                     "target_width": 100,
+                                     "timeout": 1},
+                             timeout=20)
+            self.assertEqual(r.status_code, 409)
+            self.assertEqual(r.json()['cancelled'], 'timeout')
+            self.assertTrue(os.path.isdir(os.path.join(path_to_data, r.json()['output_folder'])))
+        except Exception as e:
+            self.fail(f'Error cancelling jobs: {e}')
+        finally:
+            shutil.rmtree(os.path.join(path_to_self, 'data'))
+
+    # ===================================================================================
+    def test_rest_api_job_cancel_waiting(self):
+        """Testing REST API cancellation of a job waiting for a scheduler slot"""
+        try:
+            Path(os.fspath(os.path.join(path_to_self,'data'))).mkdir()
+            path_to_data = os.path.join(path_to_self, 'data')
+            Path(os.fspath(os.path.join(path_to_data,'images'))).mkdir()
+            Path(os.fspath(os.path.join(path_to_data,'annotations'))).mkdir()
+
+            image = Image.new(mode='RGB', size = (2000,2000), color = (0,255,0))
+            for i in range(100):
+                image.save(os.path.join(path_to_data, 'images', f'frame-{i}.jpg'))
+                with open(os.path.join(path_to_data, 'annotations', f'frame-{i}.txt'), 'w') as file:
+                    file.write('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n')
+            headers = {'Authorization': f'bearer {self.token}'}
+
+            # The first jobs hold the slots of the user, the last one waits for a slot
+            job_ids = []
+            for target_width in (100, 200, 300):
+                r = requests.get(f'{base_url}/images', headers=headers,
+                                 params={"input_path" : f'{path_to_data}',
+                                         "output_path" : f'{path_to_data}',
+                                         "target_width": target_width,
+                                         "wait": 'false'},
+                                 timeout=20)
+                self.assertEqual(r.status_code, 202)
+                job_ids.append(r.json()['job_id'])
+            for _ in range(100):
+                if requests.get(f'{base_url}/jobs/{job_ids[2]}', headers=headers, timeout=20).json()['queue_position']:
+                    break
+                time.sleep(0.1)
+            # Let the script get blocked reading its next grant
+            time.sleep(1)
+
+            start = time.monotonic()
+            r = requests.delete(f'{base_url}/jobs/{job_ids[2]}', headers=headers, timeout=20)
+            r.raise_for_status()
+            job = r.json()
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertEqual((job['status'], job['exit_status'], job['done']), ('cancelled', 0, 0))
+
+            for job_id in job_ids[:2]:
+                r = requests.delete(f'{base_url}/jobs/{job_id}', headers=headers, timeout=20)
+                r.raise_for_status()
+                self.assertEqual(r.json()['status'], 'cancelled')
+        except Exception as e:
+            self.fail(f'Error cancelling waiting jobs: {e}')
+        finally:
+            shutil.rmtree(os.path.join(path_to_self, 'data'))
+
+    # ===================================================================================
+    def test_rest_api_validate(self):
+        """Testing REST API validation function"""
+        try:
+            # Create a directory structure following Kitti format with a made up
+            # image and an unvalid annotations file
+            Path(os.fspath(os.path.join(path_to_self,'data'))).mkdir()
+            path_to_data = os.path.join(path_to_self, 'data')
+            Path(os.fspath(os.path.join(path_to_data,'images'))).mkdir()
+            Path(os.fspath(os.path.join(path_to_data,'annotations'))).mkdir()
+
+            image = Image.new(mode='RGB', size = (500,500), color = (0,255,0))      
+            unique_id = 'test-'+uuid.uuid1().hex
+            image.save(os.path.join(path_to_data, 'images', unique_id+'.jpg'))
+            with open(os.path.join(path_to_data, 'annotations', unique_id+'.txt'), 'w') as file:
+                file.write('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0'+'\n')
+                file.write('helmet 0 0 0 0 0 0 0 0 0 0 0 0 0 0'+'\n')
+
+            r = requests.get(f'{base_url}/validate', 
+                             headers={'Authorization': f'bearer {self.token}'},
+                             params={"input_path" : f'{path_to_data}',
+                                     "check_jpeg" : 'true'},
+                             timeout=20)
+            r.raise_for_status()
+            result = r.json()
+            self.assertEqual(result['pairs'], 1)
+            self.assertEqual(result['valid'], False)
+            self.assertEqual(result['violations'][0]['line'], 2)
+            # Nothing is written while validating
+            self.assertEqual(sorted(os.listdir(path_to_data)), ['annotations', 'images'])
+        except Exception as e:
+            self.fail(f'Error validating data: {e}')
+        finally:
+            # Remove all testing files and directories
+            shutil.rmtree(path_to_data)
+
+    # ===================================================================================
+    def test_rest_api_scale_in_memory(self):
+        """Testing REST API in-memory scaling of a single image"""
+        try:
+            buffer = io.BytesIO()
+            Image.new(mode='RGB', size = (500,500), color = (0,255,0)).save(buffer, format='JPEG')
+            annotations = ('helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n'
+                           'person 0 0 0 141 83 181 131 0 0 0 0 0 0 0\n')
+            expected_annotations = ['helmet 0 0 0 101.1 47.71 130.64 81.22 0 0 0 0 0 0 0',
+                                    'person 0 0 0 80.09 47.14 102.81 74.41 0 0 0 0 0 0 0']
+
+            # Multipart upload, JSON response
+            r = requests.post(f'{base_url}/scale', 
+                              headers={'Authorization': f'bearer {self.token}'},
+                              files={'image': ('test.jpg', buffer.getvalue(), 'image/jpeg'),
+                                     'annotations': ('test.txt', annotations, 'text/plain')},
+                              timeout=20)
+            r.raise_for_status()
+            result = r.json()
+            self.assertEqual(result['annotations'], expected_annotations)
+            with Image.open(io.BytesIO(base64.b64decode(result['image']))) as img:
+                self.assertEqual(img.size, (284, 284))
+
+            # Raw image body, image response
+            r = requests.post(f'{base_url}/scale', 
+                              headers={'Authorization': f'bearer {self.token}',
+                                       'Content-Type': 'image/jpeg'},
+                              params={'annotations': annotations, 'format': 'jpeg',
+                                      'target_width': 100, 'target_height': 50},
+                              data=buffer.getvalue(),
+                              timeout=20)
+            r.raise_for_status()
+            self.assertEqual(r.headers['Content-Type'], 'image/jpeg')
+            self.assertEqual(len(json.loads(r.headers['X-Scaled-Annotations'])), 2)
+            with Image.open(io.BytesIO(r.content)) as img:
+                self.assertEqual(img.size, (100, 50))
+
+            # Profile with progressive JPEG, unknown profile
+            r = requests.post(f'{base_url}/scale', 
+                              headers={'Authorization': f'bearer {self.token}',
+                                       'Content-Type': 'image/jpeg'},
+                              params={'annotations': annotations, 'format': 'jpeg', 'profile': 'quality'},
+                              data=buffer.getvalue(),
+                              timeout=20)
+            r.raise_for_status()
+            with Image.open(io.BytesIO(r.content)) as img:
+                self.assertTrue(img.info.get('progressive'))
+            r = requests.post(f'{base_url}/scale', 
+                              headers={'Authorization': f'bearer {self.token}',
+                                       'Content-Type': 'image/jpeg'},
+                              params={'annotations': annotations, 'profile': 'unknown'},
+                              data=buffer.getvalue(),
+                              timeout=20)
+            self.assertEqual(r.status_code, 400)
+
+            # Unvalid annotations
+            r = requests.post(f'{base_url}/scale', 
+                              headers={'Authorization': f'bearer {self.token}',
+                                       'Content-Type': 'image/jpeg'},
+                              params={'annotations': 'helmet 0 0 0 0 0 0 0 0 0 0 0 0 0 0'},
+                              data=buffer.getvalue(),
+                              timeout=20)
+            self.assertEqual(r.status_code, 400)
+
+            # File of the server, decoded once and then served from the image cache
+            path_to_data = os.path.join(path_to_self, 'output')
+            os.makedirs(os.path.join(path_to_data, 'images'), exist_ok = True)
+            os.makedirs(os.path.join(path_to_data, 'annotations'), exist_ok = True)
+            with open(os.path.join(path_to_data, 'images', '000000.jpg'), 'wb') as file:
+                file.write(buffer.getvalue())
+            with open(os.path.join(path_to_data, 'annotations', '000000.txt'), 'w') as file:
+                file.write(annotations)
+            for _ in range(2):
+                r = requests.post(f'{base_url}/scale',
+                                  headers={'Authorization': f'bearer {self.token}'},
+                                  params={'input_path': path_to_data, 'filename': '000000'},
+                                  timeout=20)
+                r.raise_for_status()
+                self.assertEqual(r.json()['annotations'], expected_annotations)
+            r = requests.post(f'{base_url}/scale',
+                              headers={'Authorization': f'bearer {self.token}'},
+                              params={'input_path': path_to_data, 'filename': '../000000'},
+                              timeout=20)
+            self.assertEqual(r.status_code, 400)
+            r = requests.get(f'{base_url}/metrics',
+                             headers={'Authorization': f'bearer {self.token}'},
+                             timeout=20)
+            r.raise_for_status()
+            metrics = r.json()['image_cache']
+            self.assertEqual((metrics['hits'], metrics['misses'], metrics['entries']), (2, 2, 2))
+        except Exception as e:
+            self.fail(f'Error scaling in memory: {e}')
+        finally:
+            shutil.rmtree(os.path.join(path_to_self, 'output'), ignore_errors = True)
+
+    # ===================================================================================
+    def test_rest_api_batch_upload(self):
+        """Testing REST API streaming batch upload"""
+        try:
+            path_to_output = os.path.join(path_to_self, 'output')
+            Path(os.fspath(path_to_output)).mkdir()
+
+            buffer = io.BytesIO()
+            Image.new(mode='RGB', size = (500,500), color = (0,255,0)).save(buffer, format='JPEG')
+            annotations = b'helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n'
+            files = {}
+            for i in range(3):
+                files[f'images/frame-{i}.jpg'] = buffer.getvalue()
+                files[f'annotations/frame-{i}.txt'] = annotations
+
+            archive = io.BytesIO()
+            with tarfile.open(fileobj=archive, mode='w') as tar:
+                for name, body in files.items():
+                    info = tarfile.TarInfo(name)
+                    info.size = len(body)
+                    tar.addfile(info, io.BytesIO(body))
+            body = archive.getvalue()
+
+            # Tar archive sent with chunked transfer encoding
+            r = requests.post(f'{base_url}/batch', 
+                              headers={'Authorization': f'bearer {self.token}',
+                                       'Content-Type': 'application/x-tar'},
+                              params={'output_path': path_to_output},
+                              data=(body[i:i+1000] for i in range(0, len(body), 1000)),
+                              timeout=20)
+            r.raise_for_status()
+            result = r.json()
+            self.assertEqual(result['scaled'], 3)
+            self.assertEqual(result['failed'], [])
+            with open(os.path.join(result['output_folder'], 'annotations', 'frame-0.txt'), 'r') as file:
+                self.assertEqual(file.read(), 'helmet 0 0 0 101.1 47.71 130.64 81.22 0 0 0 0 0 0 0\n')
+            with Image.open(os.path.join(result['output_folder'], 'images', 'frame-2.jpg')) as img:
+                self.assertEqual(img.size, (284, 284))
+
+            # Multipart upload with a missing annotations file
+            r = requests.post(f'{base_url}/batch', 
+                              headers={'Authorization': f'bearer {self.token}'},
+                              params={'output_path': path_to_output},
+                              files=[('file', ('a.jpg', buffer.getvalue())),
+                                     ('file', ('a.txt', annotations)),
+                                     ('file', ('b.jpg', buffer.getvalue()))],
+                              timeout=20)
+            r.raise_for_status()
+            result = r.json()
+            self.assertEqual(result['scaled'], 1)
+            self.assertEqual(result['unpaired'], ['b.jpg'])
+
+            # An image whose header claims 20000x20000 pixels only fails its pair
+            bomb = bytearray(buffer.getvalue())
+            sof = bomb.index(b'\xff\xc0')
+            bomb[sof+5:sof+9] = (20000).to_bytes(2, 'big') * 2
+            r = requests.post(f'{base_url}/batch', 
+                              headers={'Authorization': f'bearer {self.token}'},
+                              params={'output_path': path_to_output},
+                              files=[('file', ('bomb.jpg', bytes(bomb))),
+                                     ('file', ('bomb.txt', annotations)),
+                                     ('file', ('c.jpg', buffer.getvalue())),
+                                     ('file', ('c.txt', annotations))],
+                              timeout=20)
+            r.raise_for_status()
+            result = r.json()
+            self.assertEqual(result['scaled'], 1)
+            self.assertEqual([failure['reason'] for failure in result['failed']], ['DecompressionBombError'])
+
+            # Truncated archive
+            r = requests.post(f'{base_url}/batch', 
+                              headers={'Authorization': f'bearer {self.token}',
+                                       'Content-Type': 'application/x-tar'},
+                              params={'output_path': path_to_output},
+                              data=body[:2000],
+                              timeout=20)
+            self.assertEqual(r.status_code, 400)
+        except Exception as e:
+            self.fail(f'Error uploading batch: {e}')
+        finally:
+            shutil.rmtree(os.path.join(path_to_self, 'output'), ignore_errors=True)
+
+    # ===================================================================================
+    def test_rest_api_batch_upload_interrupted(self):
+        """Testing REST API batch upload leaves no scaled file when the client leaves halfway"""
+        try:
+            path_to_output = os.path.join(path_to_self, 'output')
+            Path(os.fspath(path_to_output)).mkdir()
+
+            buffer = io.BytesIO()
+            Image.new(mode='RGB', size = (500,500), color = (0,255,0)).save(buffer, format='JPEG')
+            archive = io.BytesIO()
+            with tarfile.open(fileobj=archive, mode='w') as tar:
+                for i in range(4):
+                    for name, body in ((f'images/frame-{i}.jpg', buffer.getvalue()),
+                                       (f'annotations/frame-{i}.txt', b'helmet 0 0 0 178 84 230 143 0 0 0 0 0 0 0\n')):
+                        info = tarfile.TarInfo(name)
+                        info.size = len(body)
+                        tar.addfile(info, io.BytesIO(body))
+            body = archive.getvalue()
+
+            # The first pairs are scaled, then the connection drops
+            connection = socket.create_connection(('localhost', int(REST_API_PORT)))
+            connection.sendall((f'POST /batch?output_path={path_to_output} HTTP/1.1\r\n'
+                                f'Host: localhost\r\n'
+                                f'Authorization: bearer {self.token}\r\n'
+                                f'Content-Type: application/x-tar\r\n'
+                                f'Content-Length: {len(body)}\r\n\r\n').encode() + body[:len(body)//2])
+            time.sleep(1)
+            connection.close()
+            time.sleep(1)
+
+            output_folders = os.listdir(path_to_output)
+            self.assertEqual(len(output_folders), 1)
+            for folder in ('images', 'annotations'):
+                self.assertEqual(os.listdir(os.path.join(path_to_output, output_folders[0], folder)), [])
+        except Exception as e:
+            self.fail(f'Error uploading batch: {e}')
+        finally:
+            shutil.rmtree(os.path.join(path_to_self, 'output'), ignore_errors=True)
+
 # =======================================================================================
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -2,7 +2,9 @@
 loggers.py
 
 Description:
-    Loggers to track code execution.
+    Loggers to track code execution. Records are put in a bounded queue
+    and written by a background thread, so that a slow log volume never
+    stalls the caller.
 
 Author: 
     Joan Pont
@@ -15,8 +17,10 @@ import                                 sys
 import                                 os
 import                                 platform
 import                                 re
+import                                 atexit
+import                                 queue
 import logging
-from   logging.handlers         import RotatingFileHandler
+from   logging.handlers         import RotatingFileHandler, QueueHandler, QueueListener
 from   pathlib                  import Path
 from   datetime                 import datetime
 
@@ -24,6 +28,9 @@ from   datetime                 import datetime
 LOG_LOCATION_ENV_VARIABLE = 'LOGS'
 LOGS_PATH = os.getenv(LOG_LOCATION_ENV_VARIABLE)
 
+# Records waiting to be written before the overflow policy applies
+LOG_QUEUE_SIZE = 10000
+
 
 def custom_time(*args):
     """
@@ -44,9 +51,45 @@ def custom_time(*args):
     return utc_dt.timetuple()
     
 
+class BoundedQueueHandler(QueueHandler):
+    """
+    Queue handler that never blocks the caller. Once the queue is full,
+    records below WARNING are dropped, warnings and errors take the place
+    of the oldest record instead. Dropped records are counted and reported
+    with the next record that makes it to the queue.
+    """
+
+    def __init__(self, maxsize = LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.dropped and self.queue.qsize() < self.queue.maxsize - 1:
+            self.queue.put_nowait(self.dropped_record(record))
+            self.dropped = 0
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            # Either the record or the oldest one is dropped
+            self.dropped += 1
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+
+    def dropped_record(self, record):
+        """Warning about the records dropped before the given one"""
+        return logging.LogRecord(record.name, logging.WARNING, record.pathname, record.lineno,
+                                 f'{self.dropped} log records dropped, the log queue was full', None, None)
+
+
 def custom_logger(f):
     """
-    Create a custom logger.
+    Create a custom logger. Its handlers are fed from a bounded queue by a
+    listener thread, stopped (and the queue flushed) at exit.
     """
 
     filename = (f).split('/')
@@ -80,8 +123,6 @@ def custom_logger(f):
         lfile_format.converter = custom_time
         lfile_handler.setFormatter(lfile_format)
 
-        # Add handler to the logger
-        logger.addHandler(lfile_handler)
     ###################################################################
 
     ## Create and configure the stdout (screen) logger ################
@@ -97,8 +138,17 @@ def custom_logger(f):
     lstdout_format.converter = custom_time
     lstdout_handler.setFormatter(lstdout_format)
 
-    # Add handler to the logger
-    logger.addHandler(lstdout_handler)
+    ###################################################################
+
+    ## Write the records from a background thread #####################
+    handlers = [handler for handler in (lfile_handler, lstdout_handler) if handler is not None]
+    queue_handler = BoundedQueueHandler()
+    # Records no handler would write are not even queued
+    queue_handler.setLevel(min(handler.level for handler in handlers))
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level = True)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(queue_handler)
     ###################################################################
 
     # Setting the level of the logging object